@@ -0,0 +1,44 @@
+"""add email outbox
+
+Revision ID: 0a4e7d2c9f61
+Revises: f3c9d2a65b17
+Create Date: 2026-03-21 11:08:54.602371
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a4e7d2c9f61'
+down_revision: Union[str, Sequence[str], None] = 'f3c9d2a65b17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('email_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('to_email', sa.String(), nullable=False),
+    sa.Column('template', sa.String(), nullable=False),
+    sa.Column('context', sa.JSON(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('run_after', sa.DateTime(), nullable=False),
+    sa.Column('locked_by', sa.String(), nullable=True),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_email_outbox_claim', 'email_outbox', ['status', 'run_after'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_email_outbox_claim', table_name='email_outbox')
+    op.drop_table('email_outbox')
@@ -0,0 +1,42 @@
+"""add upload sessions
+
+Revision ID: 4c1d2e7f8a90
+Revises: 9b69764ead02
+Create Date: 2026-03-02 10:14:22.418311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1d2e7f8a90'
+down_revision: Union[str, Sequence[str], None] = '9b69764ead02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('upload_sessions',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('file_name', sa.String(), nullable=False),
+    sa.Column('total_size', sa.BigInteger(), nullable=True),
+    sa.Column('received_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_upload_sessions_user_id'), 'upload_sessions', ['user_id'], unique=False)
+    op.create_index(op.f('ix_upload_sessions_updated_at'), 'upload_sessions', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_upload_sessions_updated_at'), table_name='upload_sessions')
+    op.drop_index(op.f('ix_upload_sessions_user_id'), table_name='upload_sessions')
+    op.drop_table('upload_sessions')
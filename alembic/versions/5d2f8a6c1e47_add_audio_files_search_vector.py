@@ -0,0 +1,44 @@
+"""add audio files search vector
+
+Revision ID: 5d2f8a6c1e47
+Revises: 1b7e4c9d2a38
+Create Date: 2026-03-27 11:08:52.604913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2f8a6c1e47'
+down_revision: Union[str, Sequence[str], None] = '1b7e4c9d2a38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('audio_files', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    # same expression as services/search_service.py, with its default config
+    op.execute(
+        """
+        UPDATE audio_files SET search_vector =
+            setweight(to_tsvector('simple', regexp_replace(coalesce(file_name, ''), '[[:punct:]]+', ' ', 'g')), 'A')
+            || setweight(to_tsvector('simple', coalesce(
+                (SELECT text FROM transcriptions WHERE audio_file_id = audio_files.id), ''
+            )), 'B')
+        """
+    )
+    op.create_index(
+        'ix_audio_files_search', 'audio_files', ['search_vector'],
+        unique=False, postgresql_using='gin'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_audio_files_search', table_name='audio_files', postgresql_using='gin')
+    op.drop_column('audio_files', 'search_vector')
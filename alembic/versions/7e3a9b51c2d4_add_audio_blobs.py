@@ -0,0 +1,40 @@
+"""add audio blobs
+
+Revision ID: 7e3a9b51c2d4
+Revises: 4c1d2e7f8a90
+Create Date: 2026-03-05 16:41:09.102877
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e3a9b51c2d4'
+down_revision: Union[str, Sequence[str], None] = '4c1d2e7f8a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('audio_blobs',
+    sa.Column('hash', sa.String(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    op.add_column('audio_files', sa.Column('blob_hash', sa.String(), nullable=True))
+    op.create_index(op.f('ix_audio_files_blob_hash'), 'audio_files', ['blob_hash'], unique=False)
+    op.create_foreign_key('audio_files_blob_hash_fkey', 'audio_files', 'audio_blobs', ['blob_hash'], ['hash'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('audio_files_blob_hash_fkey', 'audio_files', type_='foreignkey')
+    op.drop_index(op.f('ix_audio_files_blob_hash'), table_name='audio_files')
+    op.drop_column('audio_files', 'blob_hash')
+    op.drop_table('audio_blobs')
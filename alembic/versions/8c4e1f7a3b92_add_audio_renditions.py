@@ -0,0 +1,45 @@
+"""add audio renditions
+
+Revision ID: 8c4e1f7a3b92
+Revises: 5d2f8a6c1e47
+Create Date: 2026-03-30 09:51:27.117384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4e1f7a3b92'
+down_revision: Union[str, Sequence[str], None] = '5d2f8a6c1e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('audio_renditions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('blob_hash', sa.String(), nullable=False),
+    sa.Column('variant', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('storage_key', sa.String(), nullable=True),
+    sa.Column('mime_type', sa.String(), nullable=True),
+    sa.Column('size', sa.BigInteger(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['blob_hash'], ['audio_blobs.hash'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_audio_renditions_blob_variant', 'audio_renditions',
+        ['blob_hash', 'variant'], unique=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_audio_renditions_blob_variant', table_name='audio_renditions')
+    op.drop_table('audio_renditions')
@@ -0,0 +1,30 @@
+"""add upload session lease
+
+Revision ID: a3d61e9f4b78
+Revises: 8c4e1f7a3b92
+Create Date: 2026-10-18 14:02:11.530918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3d61e9f4b78'
+down_revision: Union[str, Sequence[str], None] = '8c4e1f7a3b92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('upload_sessions', sa.Column('locked_by', sa.String(), nullable=True))
+    op.add_column('upload_sessions', sa.Column('locked_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('upload_sessions', 'locked_at')
+    op.drop_column('upload_sessions', 'locked_by')
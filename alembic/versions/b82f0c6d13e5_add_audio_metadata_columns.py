@@ -0,0 +1,38 @@
+"""add audio metadata columns
+
+Revision ID: b82f0c6d13e5
+Revises: 7e3a9b51c2d4
+Create Date: 2026-03-11 09:27:48.530114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b82f0c6d13e5'
+down_revision: Union[str, Sequence[str], None] = '7e3a9b51c2d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('audio_files', sa.Column('sample_rate', sa.Integer(), nullable=True))
+    op.add_column('audio_files', sa.Column('channels', sa.Integer(), nullable=True))
+    op.add_column('audio_files', sa.Column('bitrate', sa.Integer(), nullable=True))
+    op.add_column('audio_files', sa.Column('codec', sa.String(), nullable=True))
+    op.add_column('audio_files', sa.Column('mime_type', sa.String(), nullable=True))
+    op.add_column('audio_files', sa.Column('processed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('audio_files', 'processed_at')
+    op.drop_column('audio_files', 'mime_type')
+    op.drop_column('audio_files', 'codec')
+    op.drop_column('audio_files', 'bitrate')
+    op.drop_column('audio_files', 'channels')
+    op.drop_column('audio_files', 'sample_rate')
@@ -0,0 +1,62 @@
+"""add transcription jobs
+
+Revision ID: d5a7c3e91f20
+Revises: b82f0c6d13e5
+Create Date: 2026-03-16 14:02:37.871520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a7c3e91f20'
+down_revision: Union[str, Sequence[str], None] = 'b82f0c6d13e5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('transcription_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('audio_file_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('run_after', sa.DateTime(), nullable=False),
+    sa.Column('locked_by', sa.String(), nullable=True),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['audio_file_id'], ['audio_files.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('audio_file_id')
+    )
+    op.create_index('ix_transcription_jobs_claim', 'transcription_jobs', ['status', 'run_after'], unique=False)
+    op.create_table('transcriptions',
+    sa.Column('audio_file_id', sa.Integer(), nullable=False),
+    sa.Column('language', sa.String(), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.Column('word_count', sa.Integer(), nullable=False),
+    sa.Column('character_count', sa.Integer(), nullable=False),
+    sa.Column('confidence', sa.Float(), nullable=True),
+    sa.Column('method', sa.String(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['audio_file_id'], ['audio_files.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('audio_file_id')
+    )
+    # existing files get transcribed too
+    op.execute(
+        "INSERT INTO transcription_jobs (audio_file_id, status, attempts, run_after, created_at, updated_at) "
+        "SELECT id, 'queued', 0, now(), now(), now() FROM audio_files"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('transcriptions')
+    op.drop_index('ix_transcription_jobs_claim', table_name='transcription_jobs')
+    op.drop_table('transcription_jobs')
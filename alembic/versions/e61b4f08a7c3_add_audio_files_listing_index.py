@@ -0,0 +1,35 @@
+"""add audio files listing index
+
+Revision ID: e61b4f08a7c3
+Revises: d5a7c3e91f20
+Create Date: 2026-03-18 10:21:05.114208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e61b4f08a7c3'
+down_revision: Union[str, Sequence[str], None] = 'd5a7c3e91f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # keyset pagination can't step over NULLs
+    op.execute("UPDATE audio_files SET uploaded_at = now() WHERE uploaded_at IS NULL")
+    op.alter_column('audio_files', 'uploaded_at', existing_type=sa.DateTime(), nullable=False)
+    op.create_index(
+        'ix_audio_files_user_uploaded', 'audio_files',
+        ['user_id', sa.text('uploaded_at DESC'), 'id'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_audio_files_user_uploaded', table_name='audio_files')
+    op.alter_column('audio_files', 'uploaded_at', existing_type=sa.DateTime(), nullable=True)
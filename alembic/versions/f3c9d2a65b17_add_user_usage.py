@@ -0,0 +1,41 @@
+"""add user usage
+
+Revision ID: f3c9d2a65b17
+Revises: e61b4f08a7c3
+Create Date: 2026-03-19 16:47:12.390114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c9d2a65b17'
+down_revision: Union[str, Sequence[str], None] = 'e61b4f08a7c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_usage',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('file_count', sa.Integer(), nullable=False),
+    sa.Column('total_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('total_duration', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.execute(
+        "INSERT INTO user_usage (user_id, file_count, total_bytes, total_duration, updated_at) "
+        "SELECT user_id, count(*), coalesce(sum(file_size), 0), coalesce(sum(duration), 0), now() "
+        "FROM audio_files WHERE user_id IS NOT NULL GROUP BY user_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_usage')
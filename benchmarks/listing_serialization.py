@@ -0,0 +1,202 @@
+"""Rows per second for building the /audio/files response.
+
+Compares the ORM + nested Pydantic model path the listing used to take
+with the column projection + TypeAdapter path it uses now. Both produce
+the same JSON, which is checked before timing.
+
+By default rows are synthetic and only building and serialization are
+timed. With --database, a throwaway user with --rows files is created in
+DATABASE_URL (use a scratch database) and the query is timed as well.
+
+    python -m benchmarks.listing_serialization --rows 100 --repeat 200
+    python -m benchmarks.listing_serialization --rows 100 --repeat 50 --database
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, select
+
+from vocali_backend.database import async_session, init_db
+from vocali_backend.models import AudioFile, TranscriptionJob, TranscriptionResult, User
+from vocali_backend.routes.audio import _LISTING_COLUMNS, _audio_file_item
+from vocali_backend.schemas import AUDIO_FILE_LIST, AudioFileOut, AudioMetadata, Transcription
+from vocali_backend.services.download_service import content_media_type, content_url
+from vocali_backend.services.transcription_service import TRANSCRIPTION_STATUS
+
+USER_ID = 1
+Row = namedtuple("Row", [c.key for c in _LISTING_COLUMNS])
+
+
+def legacy_transcription(job_status, transcript):
+    if transcript is None:
+        return Transcription(language="en", text="", status=TRANSCRIPTION_STATUS.get(job_status, "pending"))
+    return Transcription(
+        language=transcript.language,
+        text=transcript.text,
+        status="completed",
+        completedAt=transcript.completed_at,
+        wordCount=transcript.word_count,
+        method=transcript.method,
+        confidence=transcript.confidence,
+        characterCount=transcript.character_count,
+    )
+
+
+def legacy_body(rows) -> bytes:
+    """What the endpoint did before: nested models, then FastAPI's encoder."""
+    items = [
+        AudioFileOut(
+            userId=USER_ID,
+            fileKey=file.file_key,
+            fileName=file.file_name,
+            fileSize=file.file_size,
+            duration=file.duration or 0,
+            format=file.format,
+            uploadedAt=file.uploaded_at,
+            lastModified=file.uploaded_at,
+            status="ready",
+            metadata=AudioMetadata(
+                originalName=file.file_name,
+                duration=file.duration or 0,
+                extension=file.format,
+                transcription=legacy_transcription(job_status, transcript),
+                fileSize=file.file_size,
+                format=file.format,
+                uploadedAt=file.uploaded_at,
+                mimeType=content_media_type(file),
+            ),
+            downloadUrl=content_url(file),
+        )
+        for file, job_status, transcript in rows
+    ]
+    content = jsonable_encoder({"items": items, "pagination": {}})
+    # as JSONResponse.render does it
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def lean_body(rows) -> bytes:
+    items = [_audio_file_item(row, USER_ID) for row in rows]
+    return AUDIO_FILE_LIST.dump_json({"items": items, "pagination": {}})
+
+
+def synthetic(count: int):
+    legacy, lean = [], []
+    now = datetime.utcnow()
+    for i in range(count):
+        file = AudioFile(
+            id=i, file_key=str(uuid.uuid4()), file_name=f"meeting-{i}.mp3", file_size=1_000_000 + i,
+            duration=120 + i, format="mp3", uploaded_at=now - timedelta(minutes=i), mime_type="audio/mpeg",
+        )
+        transcript = None
+        if i % 3:
+            transcript = TranscriptionResult(
+                audio_file_id=i, language="en", text="lorem ipsum dolor sit amet " * 20,
+                word_count=100, character_count=540, confidence=0.93, method="stub", completed_at=now,
+            )
+        status = "completed" if transcript else "queued"
+        legacy.append((file, status, transcript))
+        lean.append(Row(
+            file.id, file.file_key, file.file_name, file.file_size, file.duration, file.format,
+            file.uploaded_at, file.mime_type, status,
+            *((transcript.language, transcript.text, transcript.completed_at, transcript.word_count,
+               transcript.method, transcript.confidence, transcript.character_count)
+              if transcript else (None,) * 7),
+        ))
+    return legacy, lean
+
+
+def report(name: str, rows: int, repeat: int, elapsed: float):
+    print(f"{name:>7}: {rows * repeat / elapsed:12,.0f} rows/s  ({elapsed / repeat * 1000:8.3f} ms per page)")
+
+
+def run_synthetic(rows: int, repeat: int):
+    legacy, lean = synthetic(rows)
+    assert json.loads(legacy_body(legacy)) == json.loads(lean_body(lean)), "paths disagree"
+    for name, body, data in (("legacy", legacy_body, legacy), ("lean", lean_body, lean)):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            body(data)
+        report(name, rows, repeat, time.perf_counter() - started)
+
+
+def _legacy_query(user_id, rows):
+    return (
+        select(AudioFile, TranscriptionJob.status, TranscriptionResult)
+        .outerjoin(TranscriptionJob, TranscriptionJob.audio_file_id == AudioFile.id)
+        .outerjoin(TranscriptionResult, TranscriptionResult.audio_file_id == AudioFile.id)
+        .where(AudioFile.user_id == user_id)
+        .order_by(AudioFile.uploaded_at.desc(), AudioFile.id)
+        .limit(rows)
+    )
+
+
+def _lean_query(user_id, rows):
+    return (
+        select(*_LISTING_COLUMNS)
+        .outerjoin(TranscriptionJob, TranscriptionJob.audio_file_id == AudioFile.id)
+        .outerjoin(TranscriptionResult, TranscriptionResult.audio_file_id == AudioFile.id)
+        .where(AudioFile.user_id == user_id)
+        .order_by(AudioFile.uploaded_at.desc(), AudioFile.id)
+        .limit(rows)
+    )
+
+
+async def run_database(rows: int, repeat: int):
+    global USER_ID
+    await init_db()
+    legacy, _ = synthetic(rows)
+    async with async_session() as session:
+        user = User(email=f"bench-{uuid.uuid4().hex[:8]}@example.com", first_name="Bench",
+                    last_name="Mark", hashed_password="-", is_verified=True)
+        session.add(user)
+        await session.flush()
+        USER_ID = user.id
+        for file, status, transcript in legacy:
+            file.id = None
+            file.user_id = user.id
+            session.add(file)
+            await session.flush()
+            session.add(TranscriptionJob(audio_file_id=file.id, status=status))
+            if transcript is not None:
+                transcript.audio_file_id = file.id
+                session.add(transcript)
+        await session.commit()
+
+    try:
+        async with async_session() as session:
+            old = legacy_body((await session.execute(_legacy_query(USER_ID, rows))).all())
+            new = lean_body((await session.execute(_lean_query(USER_ID, rows))).all())
+            assert json.loads(old) == json.loads(new), "paths disagree"
+
+        for name, query, body in (("legacy", _legacy_query, legacy_body), ("lean", _lean_query, lean_body)):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                # a fresh session each time, like a request
+                async with async_session() as session:
+                    body((await session.execute(query(USER_ID, rows))).all())
+            report(name, rows, repeat, time.perf_counter() - started)
+    finally:
+        async with async_session() as session:
+            await session.execute(delete(AudioFile).where(AudioFile.user_id == USER_ID))
+            await session.execute(delete(User).where(User.id == USER_ID))
+            await session.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--database", action="store_true", help="include the query, needs DATABASE_URL")
+    args = parser.parse_args()
+    if args.database:
+        asyncio.run(run_database(args.rows, args.repeat))
+    else:
+        run_synthetic(args.rows, args.repeat)
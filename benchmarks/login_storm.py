@@ -0,0 +1,109 @@
+"""Latency of other routes while a burst of logins is being hashed.
+
+Runs the app in-process against the database in DATABASE_URL (use a
+scratch one, a throwaway user is created and removed). A probe requests
+GET /auth/me in a loop while --logins sign-ins run concurrently, then the
+probe's latency percentiles are printed.
+
+    poetry install --with dev
+    python -m benchmarks.login_storm --logins 200
+    PASSWORD_HASH_WORKERS=0 python -m benchmarks.login_storm --logins 200   # hashing on the loop
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import os
+# every login is for the same user from the same address
+os.environ.setdefault("AUTH_IP_RATE", "0")
+os.environ.setdefault("AUTH_EMAIL_RATE", "0")
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+from sqlalchemy import delete
+
+from vocali_backend.auth_utils import create_access_token
+from vocali_backend.database import async_session, init_db
+from vocali_backend.main import app
+from vocali_backend.models import User
+from vocali_backend.services.password_hasher import PASSWORD_BCRYPT_ROUNDS, password_hasher
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def probe(client, headers, stop: asyncio.Event, latencies, interval: float):
+    while not stop.is_set():
+        # measured from when the request was due, so time the event loop
+        # spent blocked before it could even send it counts too
+        due = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        response = await client.get("/auth/me", headers=headers)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - due) * 1000)
+
+
+async def run(logins: int, interval: float):
+    await init_db()
+    email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+    password = "benchmark-password"
+    async with async_session() as session:
+        session.add(User(
+            email=email, first_name="Bench", last_name="Mark",
+            hashed_password=await password_hasher.hash(password), is_verified=True,
+        ))
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_access_token(email)[0]}"}
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # warm the principal cache and the connection pool
+            await client.get("/auth/me", headers=headers)
+
+            idle = []
+            stop = asyncio.Event()
+            task = asyncio.create_task(probe(client, headers, stop, idle, interval))
+            await asyncio.sleep(1)
+            stop.set()
+            await task
+
+            loaded = []
+            stop = asyncio.Event()
+            task = asyncio.create_task(probe(client, headers, stop, loaded, interval))
+            started = time.perf_counter()
+            responses = await asyncio.gather(*(
+                client.post("/auth/signin", json={"email": email, "password": password})
+                for _ in range(logins)
+            ))
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await task
+    finally:
+        async with async_session() as session:
+            await session.execute(delete(User).where(User.email == email))
+            await session.commit()
+
+    codes = {}
+    for response in responses:
+        codes[response.status_code] = codes.get(response.status_code, 0) + 1
+
+    print(f"bcrypt rounds {PASSWORD_BCRYPT_ROUNDS}, hash workers {password_hasher.workers}, "
+          f"max pending {password_hasher.max_pending}")
+    print(f"{logins} logins in {elapsed:.2f}s ({logins / elapsed:.1f}/s), status codes {codes}")
+    for name, values in (("idle", idle), ("during storm", loaded)):
+        print(f"/auth/me {name:>13}: n={len(values):5d} p50={statistics.median(values):7.2f}ms "
+              f"p95={percentile(values, 95):7.2f}ms p99={percentile(values, 99):7.2f}ms "
+              f"max={max(values):7.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between probes")
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.interval))
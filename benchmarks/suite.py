@@ -0,0 +1,513 @@
+"""Load scenarios against the whole API, with results compared to a baseline.
+
+Creates a throwaway database next to the one in DATABASE_URL (or
+--database-url), points the app and its local storage at it and at a temp
+directory, and serves vocali_backend.main:app with uvicorn on a thread of
+this process. Requests go over real HTTP. Emails only ever reach the
+outbox table since no sender worker runs, so nothing leaves the machine.
+Per-IP and per-email rate limits are off unless AUTH_IP_RATE and
+AUTH_EMAIL_RATE are set, every request comes from one address.
+
+Scenarios:
+    signin         concurrent POST /auth/signin for one user (bcrypt bound)
+    upload         concurrent POST /audio/upload of large, distinct files
+    listing_cursor walkers paging through --files files with cursors
+    listing_offset the same number of requests at random deep offsets
+    delete         concurrent DELETE /audio/files, one file each
+    delete_batch   POST /audio/files/delete with 100 keys at a time
+    auth_flood     GET /audio/files latency while --flood bad signins land at once
+
+Each reports throughput, p50/p95/p99 latency, errors and peak RSS. Peak
+RSS is reset between scenarios where the kernel allows it, and covers the
+client as well as the server since both live in this process.
+
+    poetry install --with dev
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --baseline bench.json --tolerance 0.2
+    python -m benchmarks.suite --scenarios signin,listing_cursor --signins 100
+
+Exits with status 1 when a scenario's p95 or throughput is worse than the
+baseline by more than the tolerance.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+SCENARIOS = (
+    "signin", "upload", "listing_cursor", "listing_offset", "delete", "delete_batch", "auth_flood",
+)
+PASSWORD = "benchmark-password"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def reset_peak_rss():
+    # "5" resets VmHWM, not every kernel or container allows it
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # lifetime peak, in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class UniqueUpload(io.RawIOBase):
+    """A shared block of random bytes behind a unique prefix.
+
+    Every upload hashes differently, so none is deduplicated, while the
+    client holds a single copy of the payload.
+    """
+
+    def __init__(self, payload: memoryview):
+        self.data = [uuid.uuid4().bytes, payload]
+        self.part = 0
+        self.offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.part < len(self.data):
+            chunk = self.data[self.part][self.offset:self.offset + len(buffer)]
+            if chunk:
+                buffer[:len(chunk)] = chunk
+                self.offset += len(chunk)
+                return len(chunk)
+            self.part += 1
+            self.offset = 0
+        return 0
+
+
+async def create_database(admin_url, name: str):
+    engine = create_async_engine(admin_url, isolation_level="AUTOCOMMIT")
+    async with engine.connect() as conn:
+        await conn.execute(text(f'CREATE DATABASE "{name}"'))
+    await engine.dispose()
+
+
+async def drop_database(admin_url, name: str):
+    engine = create_async_engine(admin_url, isolation_level="AUTOCOMMIT")
+    async with engine.connect() as conn:
+        await conn.execute(text(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+    await engine.dispose()
+
+
+class ServerThread:
+    """uvicorn on its own event loop and thread, bound to a free port."""
+
+    def __init__(self, app):
+        import uvicorn
+
+        self.socket = socket.socket()
+        self.socket.bind(("127.0.0.1", 0))
+        self.url = "http://127.0.0.1:%d" % self.socket.getsockname()[1]
+        # client and server share a GIL, a busy client can leave a connection
+        # idle past uvicorn's 5s default and then race its close
+        config = uvicorn.Config(
+            app, log_level="warning", lifespan="on", access_log=False, timeout_keep_alive=60
+        )
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.socket]})
+
+    def start(self, timeout: float = 60):
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("The API server did not start")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join()
+        self.socket.close()
+
+
+async def measure(name, jobs, concurrency: int, expected=(200,)):
+    """Run jobs with at most concurrency at a time.
+
+    A job is called with timed, which sends one request and records its
+    latency; most jobs make a single request, a listing walker makes many
+    in turn.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = {}
+
+    async def timed(request):
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await request
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        latencies.append((time.perf_counter() - started) * 1000)
+        if status not in expected:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+        return response
+
+    async def one(job):
+        async with semaphore:
+            await job(timed)
+
+    reset_peak_rss()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(job) for job in jobs))
+    elapsed = time.perf_counter() - started
+    result = {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 2),
+        "p50Ms": round(percentile(latencies, 50), 2),
+        "p95Ms": round(percentile(latencies, 95), 2),
+        "p99Ms": round(percentile(latencies, 99), 2),
+        "maxMs": round(max(latencies), 2),
+        "peakRssMb": round(peak_rss_mb(), 1),
+    }
+    print(f"{name:>15}: {result['requests']:5d} req {result['throughput']:8.1f}/s "
+          f"p50={result['p50Ms']:8.2f}ms p95={result['p95Ms']:8.2f}ms p99={result['p99Ms']:8.2f}ms "
+          f"rss={result['peakRssMb']:7.1f}MB errors={errors or '-'}")
+    return result
+
+
+class Seeder:
+    """Writes fixtures straight to the database on the client's own engine;
+    the app's engine belongs to the server thread's event loop."""
+
+    def __init__(self, url: str):
+        from vocali_backend.database import make_engine
+
+        self.engine = make_engine(url)
+
+    async def user(self, email: str, hashed_password: str) -> int:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                text("INSERT INTO users (email, first_name, last_name, hashed_password, is_active, is_verified) "
+                     "VALUES (:email, 'Bench', 'Mark', :password, true, true) RETURNING id"),
+                {"email": email, "password": hashed_password},
+            )
+            return result.scalar_one()
+
+    async def files(self, user_id: int, count: int, size: int = 1_000_000) -> list:
+        """count processed files, each with a blob of its own (nothing on disk)."""
+        now = datetime.utcnow()
+        keys = [str(uuid.uuid4()) for _ in range(count)]
+        blobs = [{"hash": uuid.uuid4().hex * 2, "size": size, "created_at": now} for _ in keys]
+        files = [
+            {
+                "user_id": user_id, "file_key": key, "file_name": f"{key[:8]}.mp3", "file_size": size,
+                "duration": 60, "format": "mp3", "uploaded_at": now - timedelta(seconds=i),
+                "blob_hash": blob["hash"], "mime_type": "audio/mpeg", "processed_at": now,
+            }
+            for i, (key, blob) in enumerate(zip(keys, blobs))
+        ]
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                text("INSERT INTO audio_blobs (hash, size, ref_count, created_at) "
+                     "VALUES (:hash, :size, 1, :created_at)"),
+                blobs,
+            )
+            await conn.execute(
+                text("INSERT INTO audio_files (user_id, file_key, file_name, file_size, duration, format, "
+                     "uploaded_at, blob_hash, mime_type, processed_at) VALUES (:user_id, :file_key, "
+                     ":file_name, :file_size, :duration, :format, :uploaded_at, :blob_hash, :mime_type, "
+                     ":processed_at)"),
+                files,
+            )
+            await conn.execute(
+                text("INSERT INTO user_usage (user_id, file_count, total_bytes, total_duration, updated_at) "
+                     "VALUES (:user_id, :files, :bytes, :duration, :now) ON CONFLICT (user_id) DO UPDATE SET "
+                     "file_count = user_usage.file_count + EXCLUDED.file_count, "
+                     "total_bytes = user_usage.total_bytes + EXCLUDED.total_bytes, "
+                     "total_duration = user_usage.total_duration + EXCLUDED.total_duration"),
+                {"user_id": user_id, "files": count, "bytes": count * size, "duration": count * 60, "now": now},
+            )
+        return keys
+
+    async def close(self):
+        await self.engine.dispose()
+
+
+async def run_scenarios(args, url: str, base_url: str) -> dict:
+    from vocali_backend.auth_utils import create_access_token
+    from vocali_backend.services.password_hasher import pwd_context
+
+    seeder = Seeder(url)
+    hashed = pwd_context.hash(PASSWORD)
+
+    async def new_user():
+        email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+        user_id = await seeder.user(email, hashed)
+        return email, user_id, {"Authorization": f"Bearer {create_access_token(email)[0]}"}
+
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        try:
+            if "signin" in args.scenarios:
+                email, _, _ = await new_user()
+                body = {"email": email, "password": PASSWORD}
+                results["signin"] = await measure(
+                    "signin",
+                    [lambda timed: timed(client.post("/auth/signin", json=body))] * args.signins,
+                    args.concurrency,
+                )
+
+            if "upload" in args.scenarios:
+                _, _, headers = await new_user()
+                payload = memoryview(os.urandom(args.upload_mb * 1024 * 1024))
+
+                def upload(timed):
+                    files = {"file": ("bench.wav", UniqueUpload(payload), "audio/wav")}
+                    return timed(client.post("/audio/upload", headers=headers, files=files))
+
+                results["upload"] = await measure(
+                    "upload", [upload] * args.uploads, min(args.concurrency, args.upload_concurrency)
+                )
+
+            if "listing_cursor" in args.scenarios or "listing_offset" in args.scenarios:
+                _, user_id, headers = await new_user()
+                await seeder.files(user_id, args.files)
+                pages = (args.files + args.page_size - 1) // args.page_size
+
+                if "listing_cursor" in args.scenarios:
+                    async def walk(timed):
+                        # each page needs the cursor from the one before
+                        cursor = ""
+                        while cursor is not None:
+                            params = {"limit": args.page_size, "cursor": cursor}
+                            response = await timed(client.get("/audio/files", headers=headers, params=params))
+                            if response is None or response.status_code != 200:
+                                return
+                            cursor = response.json()["pagination"]["nextCursor"]
+
+                    results["listing_cursor"] = await measure(
+                        "listing_cursor", [walk] * args.walkers, args.walkers
+                    )
+
+                if "listing_offset" in args.scenarios:
+                    rng = random.Random(0)
+                    # the deepest half of the listing, where OFFSET hurts
+                    deep = [rng.randint(pages // 2 + 1, pages) for _ in range(pages * args.walkers)]
+
+                    def offset_page(n):
+                        params = {"limit": args.page_size, "page": n}
+                        return lambda timed: timed(client.get("/audio/files", headers=headers, params=params))
+
+                    results["listing_offset"] = await measure(
+                        "listing_offset", [offset_page(n) for n in deep], args.walkers
+                    )
+
+            if "delete" in args.scenarios:
+                _, user_id, headers = await new_user()
+                keys = await seeder.files(user_id, args.deletes)
+
+                def delete(key):
+                    params = {"fileKey": key}
+                    return lambda timed: timed(client.delete("/audio/files", headers=headers, params=params))
+
+                results["delete"] = await measure(
+                    "delete", [delete(k) for k in keys], args.concurrency
+                )
+
+            if "delete_batch" in args.scenarios:
+                _, user_id, headers = await new_user()
+                keys = await seeder.files(user_id, args.deletes)
+
+                def delete_batch(batch):
+                    body = {"fileKeys": batch}
+                    return lambda timed: timed(client.post("/audio/files/delete", headers=headers, json=body))
+
+                batches = [keys[i:i + 100] for i in range(0, len(keys), 100)]
+                results["delete_batch"] = await measure(
+                    "delete_batch", [delete_batch(b) for b in batches], args.concurrency
+                )
+
+            if "auth_flood" in args.scenarios:
+                email, _, _ = await new_user()
+                _, user_id, headers = await new_user()
+                await seeder.files(user_id, 100)
+                flood_limits = httpx.Limits(max_connections=args.flood)
+                outcomes = {}
+
+                async def attack(attacker):
+                    body = {"email": email, "password": "wrong-password"}
+                    try:
+                        status = (await attacker.post("/auth/signin", json=body)).status_code
+                    except httpx.HTTPError as e:
+                        status = type(e).__name__
+                    outcomes[str(status)] = outcomes.get(str(status), 0) + 1
+
+                async def probe(timed):
+                    for _ in range(args.probes):
+                        await timed(client.get("/audio/files", headers=headers, params={"limit": 20}))
+
+                # the probe's connection is already open when the flood starts
+                await client.get("/audio/files", headers=headers, params={"limit": 20})
+                async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=flood_limits) as attacker:
+                    flood = asyncio.gather(*(attack(attacker) for _ in range(args.flood)))
+                    results["auth_flood"] = await measure("auth_flood", [probe], 1)
+                    await flood
+                # rejected signins are the point here, they aren't errors
+                results["auth_flood"]["flood"] = outcomes
+                print(f"{'':>15}  flood responses {outcomes}")
+        finally:
+            await seeder.close()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    print(f"\n{'scenario':>15} {'p95 base':>10} {'p95 now':>10} {'change':>8} "
+          f"{'req/s base':>11} {'req/s now':>10} {'change':>8}")
+    for name, now in results.items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            print(f"{name:>15} (not in baseline)")
+            continue
+        p95_change = now["p95Ms"] / before["p95Ms"] - 1 if before["p95Ms"] else 0.0
+        rate_change = now["throughput"] / before["throughput"] - 1 if before["throughput"] else 0.0
+        flag = ""
+        if p95_change > tolerance or rate_change < -tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:>15} {before['p95Ms']:10.2f} {now['p95Ms']:10.2f} {p95_change:+8.1%} "
+              f"{before['throughput']:11.1f} {now['throughput']:10.1f} {rate_change:+8.1%}{flag}")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"),
+                        help="server to create the throwaway database on")
+    parser.add_argument("--keep-database", action="store_true")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--signins", type=int, default=200)
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--upload-mb", type=int, default=20)
+    parser.add_argument("--upload-concurrency", type=int, default=8)
+    parser.add_argument("--files", type=int, default=5000, help="files to page through")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--walkers", type=int, default=4, help="concurrent listing clients")
+    parser.add_argument("--deletes", type=int, default=500)
+    parser.add_argument("--flood", type=int, default=300, help="signins fired at once by auth_flood")
+    parser.add_argument("--probes", type=int, default=200, help="listing requests made during the flood")
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--baseline", help="JSON from an earlier --output to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative change in p95 and throughput")
+    args = parser.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if not args.database_url:
+        parser.error("set DATABASE_URL or pass --database-url")
+
+    server_url = make_url(args.database_url)
+    name = f"vocali_bench_{uuid.uuid4().hex[:8]}"
+    admin_url = server_url.set(database="postgres")
+    url = server_url.set(database=name).render_as_string(hide_password=False)
+    workdir = tempfile.mkdtemp(prefix="vocali_bench_")
+
+    # the app reads its settings at import time
+    os.environ["DATABASE_URL"] = url
+    os.environ.pop("DATABASE_READ_URL", None)
+    os.environ["STORAGE_BACKEND"] = "local"
+    os.environ["UPLOAD_DIR"] = os.path.join(workdir, "uploads")
+    os.environ["UPLOAD_STAGING_DIR"] = os.path.join(workdir, "staging")
+    os.environ.setdefault("SECRET_KEY", uuid.uuid4().hex)
+    os.environ.setdefault("AUTH_IP_RATE", "0")
+    os.environ.setdefault("AUTH_EMAIL_RATE", "0")
+
+    asyncio.run(create_database(admin_url, name))
+    server = None
+    try:
+        from vocali_backend.main import app
+
+        server = ServerThread(app)
+        server.start()
+        started = datetime.utcnow()
+        results = asyncio.run(run_scenarios(args, url, server.url))
+    finally:
+        if server:
+            server.stop()
+        if not args.keep_database:
+            asyncio.run(drop_database(admin_url, name))
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "startedAt": started.isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "parameters": {k: v for k, v in vars(args).items()
+                       if k not in ("database_url", "output", "baseline", "keep_database")},
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        ours = {k: v for k, v in report["parameters"].items() if k != "scenarios"}
+        theirs = {k: v for k, v in baseline.get("parameters", {}).items() if k != "scenarios"}
+        if ours != theirs:
+            print("warning: baseline was run with different parameters")
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
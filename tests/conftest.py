@@ -0,0 +1,156 @@
+"""Shared fixtures.
+
+Tests that need Postgres run against a throwaway database created on the
+server in TEST_DATABASE_URL, and are skipped when it isn't set:
+
+    TEST_DATABASE_URL=postgresql+asyncpg://postgres@localhost/postgres poetry run pytest
+
+Files go to a temp directory with local storage; nothing leaves the machine.
+"""
+import os
+import shutil
+import tempfile
+import uuid
+
+import httpx
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+_server_url = make_url(TEST_DATABASE_URL or "postgresql+asyncpg://localhost/postgres")
+_database = f"vocali_test_{uuid.uuid4().hex[:8]}"
+_workdir = tempfile.mkdtemp(prefix="vocali_test_")
+
+# the app reads its settings at import time, before any test module imports it
+os.environ["DATABASE_URL"] = _server_url.set(database=_database).render_as_string(hide_password=False)
+os.environ.pop("DATABASE_READ_URL", None)
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ["UPLOAD_DIR"] = os.path.join(_workdir, "uploads")
+os.environ["UPLOAD_STAGING_DIR"] = os.path.join(_workdir, "staging")
+os.environ.setdefault("SECRET_KEY", uuid.uuid4().hex)
+
+
+@pytest.fixture(scope="session")
+async def database():
+    if not TEST_DATABASE_URL:
+        pytest.skip("set TEST_DATABASE_URL to run the tests that need Postgres")
+    admin = create_async_engine(_server_url.set(database="postgres"), isolation_level="AUTOCOMMIT")
+    async with admin.connect() as conn:
+        await conn.execute(text(f'CREATE DATABASE "{_database}"'))
+
+    from vocali_backend.database import engine, init_db
+
+    await init_db()
+    yield
+    await engine.dispose()
+    async with admin.connect() as conn:
+        await conn.execute(text(f'DROP DATABASE IF EXISTS "{_database}" WITH (FORCE)'))
+    await admin.dispose()
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+@pytest.fixture
+async def db(database):
+    """An empty database for each test."""
+    yield
+    from vocali_backend.database import engine
+    from vocali_backend.models import Base
+
+    tables = ", ".join(f'"{t.name}"' for t in Base.metadata.sorted_tables)
+    async with engine.begin() as conn:
+        await conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+
+@pytest.fixture
+async def client(db):
+    from vocali_backend.main import app
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+        yield c
+
+
+@pytest.fixture
+def make_user(db):
+    """make_user(email) creates a verified user and returns auth headers for it."""
+    from vocali_backend.auth_utils import create_access_token
+    from vocali_backend.database import async_session
+    from vocali_backend.models import User
+
+    async def make(email: str = "user@example.com") -> dict:
+        async with async_session() as session:
+            session.add(User(
+                email=email,
+                first_name="Test",
+                last_name="User",
+                # never checked, these tests don't sign in
+                hashed_password="!",
+                is_verified=True,
+            ))
+            await session.commit()
+        token, _ = create_access_token(email)
+        return {"Authorization": f"Bearer {token}"}
+
+    return make
+
+
+@pytest.fixture
+def upload(client):
+    """upload(headers, name, data) posts a file and returns its fileKey."""
+
+    async def post(headers: dict, name: str, data: bytes) -> str:
+        response = await client.post(
+            "/audio/upload", files={"file": (name, data, "audio/wav")}, headers=headers
+        )
+        assert response.status_code == 200, response.text
+        return response.json()["fileKey"]
+
+    return post
+
+
+@pytest.fixture
+def send_watched(db):
+    """send_watched(path, headers) calls the app directly, without a client.
+
+    Returns the status, the body, and the number of connections checked out
+    of the pool each time a piece of the body was sent; httpx only hands
+    over a response once the app has finished.
+    """
+    from vocali_backend.database import engine
+    from vocali_backend.main import app
+
+    async def get(path: str, headers: dict):
+        path, _, query = path.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+            "client": ("127.0.0.1", 1),
+            "server": ("test", 80),
+        }
+        status, body, checked_out = None, bytearray(), []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                body.extend(message.get("body", b""))
+                checked_out.append(engine.sync_engine.pool.checkedout())
+
+        await app(scope, receive, send)
+        return status, bytes(body), checked_out
+
+    return get
@@ -0,0 +1,13 @@
+"""Downloads: the audio streams after the database work is done."""
+
+
+async def test_connection_is_back_while_the_file_streams(make_user, upload, send_watched):
+    headers = await make_user()
+    data = bytes(range(256)) * 1024
+    file_key = await upload(headers, "long.wav", data)
+
+    status, body, checked_out = await send_watched(f"/audio/files/{file_key}/content", headers)
+
+    assert (status, body) == (200, data)
+    # FileResponse sends 64 KiB at a time
+    assert len(checked_out) > 1 and set(checked_out) == {0}
@@ -0,0 +1,121 @@
+"""The outbox drained through the real Brevo client against a fake API."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlalchemy import select
+
+from vocali_backend.database import async_session
+from vocali_backend.models import EmailOutbox
+from vocali_backend.services import email_service
+from vocali_backend.services.email_service import (
+    EMAIL_FAILED,
+    EMAIL_PENDING,
+    EMAIL_SENT,
+    BrevoSender,
+    claim_emails,
+    queue_confirmation_email,
+    queue_reset_password_email,
+)
+from vocali_backend.workers.email_sender import EmailWorker
+
+# recipient -> status the fake API answers with, anything else gets 201
+RESPONSES = {
+    "rejected@example.com": 400,
+    "busy@example.com": 503,
+}
+
+
+class FakeBrevo(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append((self.path, self.headers.get("api-key"), body))
+        status = RESPONSES.get(body["to"][0]["email"], 201)
+        payload = json.dumps({"messageId": "<fake@brevo>"} if status == 201 else {"code": "error"})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def brevo(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBrevo)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    FakeBrevo.requests = []
+    monkeypatch.setenv("BREVO_API_KEY", "test-key")
+    monkeypatch.setenv("BREVO_SENDER_EMAIL", "noreply@example.com")
+    monkeypatch.setattr(email_service, "BREVO_API_HOST", f"http://127.0.0.1:{server.server_port}/v3")
+    sender = BrevoSender(2)
+    yield sender
+    sender.close()
+    server.shutdown()
+    server.server_close()
+
+
+async def drain(sender: BrevoSender):
+    async with async_session() as session:
+        messages = await claim_emails(session, "test-worker", 10)
+    await EmailWorker(sender, 10).send_batch(messages)
+
+
+async def outbox():
+    async with async_session() as session:
+        rows = await session.scalars(select(EmailOutbox))
+        return {row.to_email: row for row in rows}
+
+
+async def test_sends_through_the_api(db, brevo):
+    async with async_session() as session:
+        queue_confirmation_email(session, "new@example.com", "A1B2C3")
+        queue_reset_password_email(session, "old@example.com", "D4E5F6")
+        await session.commit()
+
+    await drain(brevo)
+
+    rows = await outbox()
+    assert {email: row.status for email, row in rows.items()} == {
+        "new@example.com": EMAIL_SENT,
+        "old@example.com": EMAIL_SENT,
+    }
+    assert all(row.sent_at is not None and row.locked_by is None for row in rows.values())
+
+    sent = {body["to"][0]["email"]: (path, key, body) for path, key, body in FakeBrevo.requests}
+    path, key, body = sent["new@example.com"]
+    assert (path, key) == ("/v3/smtp/email", "test-key")
+    assert body["sender"] == {"name": "Vocali", "email": "noreply@example.com"}
+    assert body["subject"] == "Email Confirmation"
+    assert "A1B2C3" in body["htmlContent"]
+    assert sent["old@example.com"][2]["subject"] == "Password Reset"
+    assert "D4E5F6" in sent["old@example.com"][2]["htmlContent"]
+
+
+async def test_rejected_is_failed_and_server_error_retried(db, brevo):
+    async with async_session() as session:
+        for email in ("ok@example.com", "rejected@example.com", "busy@example.com"):
+            queue_confirmation_email(session, email, "A1B2C3")
+        await session.commit()
+
+    await drain(brevo)
+
+    rows = await outbox()
+    assert rows["ok@example.com"].status == EMAIL_SENT
+
+    rejected = rows["rejected@example.com"]
+    assert (rejected.status, rejected.attempts) == (EMAIL_FAILED, 1)
+    assert rejected.last_error.startswith("ApiException")
+
+    busy = rows["busy@example.com"]
+    assert (busy.status, busy.attempts, busy.locked_by) == (EMAIL_PENDING, 1, None)
+    assert busy.run_after > rows["ok@example.com"].sent_at
+    # backing off, not claimable yet
+    async with async_session() as session:
+        assert await claim_emails(session, "test-worker", 10) == []
@@ -0,0 +1,54 @@
+"""GET /audio/export: a streamed ZIP of the user's files with a manifest."""
+import io
+import json
+import zipfile
+
+from vocali_backend.routes import audio
+
+
+async def test_archive(make_user, upload, send_watched):
+    headers = await make_user()
+    await upload(headers, "memo.wav", b"first" * 100)
+    await upload(headers, "memo.wav", b"second" * 100)
+    await upload(headers, "../../etc/passwd", b"third" * 100)
+    await upload(headers, "..\\evil.wav", b"fourth" * 100)
+
+    status, body, checked_out = await send_watched("/audio/export", headers)
+
+    assert status == 200
+    # only the short per-batch sessions, none while the archive is sent
+    assert set(checked_out) == {0}
+    with zipfile.ZipFile(io.BytesIO(body)) as archive:
+        assert archive.testzip() is None
+        names = archive.namelist()
+        manifest = json.loads(archive.read("manifest.json"))
+        contents = {name: archive.read(name) for name in names}
+
+    assert names[-1] == "manifest.json"
+    assert all(name.startswith("audio/") and ".." not in name.split("/") for name in names[:-1])
+    assert names[:2] == ["audio/memo.wav", "audio/memo (2).wav"]
+    paths = [item["path"] for item in manifest["files"]]
+    assert paths == names[:-1]
+    assert [contents[p] for p in paths] == [b"first" * 100, b"second" * 100, b"third" * 100, b"fourth" * 100]
+    assert (manifest["since"], manifest["nextCursor"]) == (0, None)
+
+
+async def test_parts_chain_with_the_cursor(client, make_user, upload, monkeypatch):
+    monkeypatch.setattr(audio, "EXPORT_MAX_FILES", 2)
+    headers = await make_user()
+    for i in range(3):
+        await upload(headers, f"memo {i}.wav", bytes([i]) * 100)
+
+    first = await client.get("/audio/export", headers=headers)
+    cursor = first.headers["X-Export-Next-Cursor"]
+    with zipfile.ZipFile(io.BytesIO(first.content)) as archive:
+        manifest = json.loads(archive.read("manifest.json"))
+    assert manifest["nextCursor"] == int(cursor)
+    assert [item["fileName"] for item in manifest["files"]] == ["memo 0.wav", "memo 1.wav"]
+
+    second = await client.get("/audio/export", params={"since": cursor}, headers=headers)
+    assert "X-Export-Next-Cursor" not in second.headers
+    with zipfile.ZipFile(io.BytesIO(second.content)) as archive:
+        manifest = json.loads(archive.read("manifest.json"))
+        assert archive.namelist() == ["audio/memo 2.wav", "manifest.json"]
+    assert (manifest["since"], manifest["nextCursor"]) == (int(cursor), None)
@@ -0,0 +1,35 @@
+"""/metrics: token gated, and scrapes never touch the database."""
+from vocali_backend import metrics
+from vocali_backend.database import async_read_session, read_engine
+from vocali_backend.metrics import refresh_queue_depths
+
+
+async def test_off_without_a_token(client):
+    assert (await client.get("/metrics")).status_code == 404
+
+
+async def test_needs_the_token(client, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "scrape-secret")
+
+    assert (await client.get("/metrics")).status_code == 401
+    wrong = await client.get("/metrics", headers={"Authorization": "Bearer nope"})
+    assert wrong.status_code == 401
+    response = await client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert "http_requests_total" in response.text
+
+
+async def test_queue_depths_are_cached(client, make_user, upload, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "scrape-secret")
+    headers = await make_user()
+    await upload(headers, "memo.wav", b"RIFF" + b"\x01" * 100)
+    async with async_read_session() as session:
+        await refresh_queue_depths(session)
+    await upload(headers, "memo2.wav", b"RIFF" + b"\x02" * 100)
+
+    pool = read_engine.sync_engine.pool
+    checkouts = pool.checkouts
+    response = await client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert pool.checkouts == checkouts
+    # counted before the second upload
+    assert 'job_queue_depth{queue="transcription",status="queued"} 1' in response.text
@@ -0,0 +1,59 @@
+"""reconcile_usage repairs drift without losing concurrent uploads."""
+import asyncio
+
+from sqlalchemy import delete, select
+
+from vocali_backend.commands.reconcile_usage import reconcile_batch
+from vocali_backend.database import async_session
+from vocali_backend.models import AudioFile, User, UserUsage
+from vocali_backend.services.usage_service import add_usage
+
+
+async def usage(user_id):
+    async with async_session() as session:
+        row = await session.get(UserUsage, user_id)
+        return None if row is None else (row.file_count, row.total_bytes)
+
+
+async def reconcile(user_id, dry_run=False):
+    async with async_session() as session:
+        return await reconcile_batch(session, [user_id], dry_run)
+
+
+async def user_with_lost_counter(make_user, upload):
+    headers = await make_user()
+    await upload(headers, "a.wav", b"a" * 100)
+    await upload(headers, "b.wav", b"b" * 50)
+    async with async_session() as session:
+        user_id = await session.scalar(select(User.id))
+        await session.execute(delete(UserUsage))
+        await session.commit()
+    return user_id
+
+
+async def test_restores_a_lost_counter(make_user, upload):
+    user_id = await user_with_lost_counter(make_user, upload)
+
+    assert await reconcile(user_id, dry_run=True) == 1
+    assert await usage(user_id) is None
+    assert await reconcile(user_id) == 1
+    assert await usage(user_id) == (2, 150)
+    assert await reconcile(user_id) == 0
+
+
+async def test_first_upload_during_reconcile_is_kept(make_user, upload):
+    user_id = await user_with_lost_counter(make_user, upload)
+
+    # an upload that creates the counter while the reconcile is running
+    async with async_session() as session:
+        session.add(AudioFile(
+            user_id=user_id, file_key="c", file_name="c.wav", file_size=25, format="wav", duration=0
+        ))
+        await session.flush()
+        await add_usage(session, user_id, files=1, size=25)
+        running = asyncio.create_task(reconcile(user_id))
+        await asyncio.sleep(0.2)
+        await session.commit()
+    await running
+
+    assert await usage(user_id) == (3, 175)
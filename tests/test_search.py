@@ -0,0 +1,88 @@
+"""GET /audio/search against Postgres full text search."""
+from sqlalchemy import select
+
+from vocali_backend.database import async_session
+from vocali_backend.models import AudioFile
+from vocali_backend.services.transcription_engines import EngineResult
+from vocali_backend.services.transcription_service import claim_jobs, complete_job
+
+
+async def transcribe(transcripts: dict):
+    """Complete the queued jobs with fixed texts, keyed by fileKey."""
+    async with async_session() as session:
+        jobs = await claim_jobs(session, "test-worker", 100)
+        keys = dict((await session.execute(select(AudioFile.id, AudioFile.file_key))).all())
+    for job in jobs:
+        text = transcripts.get(keys[job.audio_file_id])
+        if text is not None:
+            async with async_session() as session:
+                assert await complete_job(session, job, EngineResult(text=text, language="en"), "stub")
+
+
+async def search(client, headers, q, **params):
+    response = await client.get("/audio/search", params={"q": q, **params}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def names(page):
+    return [item["fileName"] for item in page["items"]]
+
+
+async def test_name_and_transcript_prefix_match(client, make_user, upload):
+    headers = await make_user()
+    by_name = await upload(headers, "budget_meeting-2024.wav", b"a" * 100)
+    by_transcript = await upload(headers, "memo.wav", b"b" * 100)
+    await upload(headers, "unrelated.wav", b"c" * 100)
+    await transcribe({by_transcript: "Notes from the weekly budgeting call", by_name: "Hello"})
+
+    # the name weighs more than the transcript
+    assert names(await search(client, headers, "budg")) == ["budget_meeting-2024.wav", "memo.wav"]
+    # punctuation in names splits words
+    assert names(await search(client, headers, "2024")) == ["budget_meeting-2024.wav"]
+    assert names(await search(client, headers, "WEEKLY")) == ["memo.wav"]
+    assert names(await search(client, headers, "nothing")) == []
+
+
+async def test_every_word_has_to_match(client, make_user, upload):
+    headers = await make_user()
+    await upload(headers, "budget call.wav", b"a" * 100)
+    await upload(headers, "budget review.wav", b"b" * 100)
+
+    assert names(await search(client, headers, "budget call")) == ["budget call.wav"]
+    # tsquery syntax is just more words
+    assert names(await search(client, headers, "budget | review")) == ["budget review.wav"]
+    assert names(await search(client, headers, "budget !review")) == ["budget review.wav"]
+
+
+async def test_only_own_files(client, make_user, upload):
+    alice = await make_user("alice@example.com")
+    bob = await make_user("bob@example.com")
+    await upload(alice, "secret plans.wav", b"a" * 100)
+    await upload(bob, "plans.wav", b"b" * 100)
+
+    assert names(await search(client, alice, "plans")) == ["secret plans.wav"]
+    assert names(await search(client, bob, "secret")) == []
+
+
+async def test_pages_have_no_gaps_or_repeats(client, make_user, upload):
+    headers = await make_user()
+    for i in range(7):
+        await upload(headers, f"standup {i}.wav", bytes([i]) * 100)
+
+    seen, cursor = [], None
+    while True:
+        page = await search(client, headers, "standup", limit=3, **({"cursor": cursor} if cursor else {}))
+        seen += names(page)
+        cursor = page["pagination"]["nextCursor"]
+        assert page["pagination"]["hasNextPage"] == (cursor is not None)
+        if cursor is None:
+            break
+    # equal ranks fall back to newest first
+    assert seen == [f"standup {i}.wav" for i in reversed(range(7))]
+
+
+async def test_query_without_words(client, make_user):
+    headers = await make_user()
+    response = await client.get("/audio/search", params={"q": "?! -"}, headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,162 @@
+"""The transcription queue end to end, with the stub engine."""
+import pytest
+from sqlalchemy import select, update
+
+from vocali_backend.database import async_session
+from vocali_backend.models import AudioFile, TranscriptionJob, TranscriptionResult
+from vocali_backend.services import transcription_service
+from vocali_backend.services.blob_service import audio_file_key
+from vocali_backend.services.storage import get_storage
+from vocali_backend.services.transcription_engines import StubEngine
+from vocali_backend.services.transcription_service import (
+    JOB_COMPLETED,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    claim_jobs,
+)
+from vocali_backend.workers.transcription import TranscriptionWorker
+
+WORKER = "test-worker"
+
+
+class FailingOnce(StubEngine):
+    def __init__(self):
+        self.calls = 0
+
+    async def transcribe(self, path, language=None):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("engine crashed")
+        return await super().transcribe(path, language)
+
+
+async def claim(limit: int = 10):
+    async with async_session() as session:
+        return await claim_jobs(session, WORKER, limit)
+
+
+async def job_of(file_key: str) -> TranscriptionJob:
+    async with async_session() as session:
+        return await session.scalar(
+            select(TranscriptionJob)
+            .join(AudioFile, AudioFile.id == TranscriptionJob.audio_file_id)
+            .where(AudioFile.file_key == file_key)
+        )
+
+
+async def result_of(file_key: str):
+    async with async_session() as session:
+        return await session.scalar(
+            select(TranscriptionResult)
+            .join(AudioFile, AudioFile.id == TranscriptionResult.audio_file_id)
+            .where(AudioFile.file_key == file_key)
+        )
+
+
+async def stored_path(file_key: str) -> str:
+    async with async_session() as session:
+        audio = await session.scalar(select(AudioFile).where(AudioFile.file_key == file_key))
+    return get_storage().local_path(audio_file_key(audio))
+
+
+async def test_claim_transcribe_complete(client, make_user, upload):
+    headers = await make_user()
+    file_key = await upload(headers, "memo.wav", b"RIFF" + b"\x01" * 4000)
+    assert (await job_of(file_key)).status == JOB_QUEUED
+
+    jobs = await claim()
+    assert [(j.status, j.attempts, j.locked_by) for j in jobs] == [(JOB_RUNNING, 1, WORKER)]
+    assert await claim() == []
+
+    engine = StubEngine()
+    await TranscriptionWorker(engine, 1).run_job(jobs[0])
+
+    job = await job_of(file_key)
+    assert (job.status, job.locked_by, job.last_error) == (JOB_COMPLETED, None, None)
+    expected = await engine.transcribe(await stored_path(file_key))
+    result = await result_of(file_key)
+    assert (result.text, result.method) == (expected.text, "stub")
+    assert result.word_count == len(expected.text.split())
+
+    listing = (await client.get("/audio/files", headers=headers)).json()
+    transcription = listing["items"][0]["metadata"]["transcription"]
+    assert (transcription["status"], transcription["text"]) == ("completed", expected.text)
+
+
+async def test_same_bytes_copy_the_transcript(make_user, upload):
+    headers = await make_user()
+    first = await upload(headers, "a.wav", b"same audio" * 100)
+    await TranscriptionWorker(StubEngine(), 1).run_job((await claim(1))[0])
+
+    second = await upload(headers, "b.wav", b"same audio" * 100)
+    engine = FailingOnce()
+    await TranscriptionWorker(engine, 1).run_job((await claim())[0])
+
+    assert engine.calls == 0
+    assert (await result_of(second)).method == "copy"
+    assert (await result_of(second)).text == (await result_of(first)).text
+
+
+async def test_failed_job_is_retried(make_user, upload, monkeypatch):
+    monkeypatch.setattr(transcription_service, "TRANSCRIPTION_BACKOFF_BASE", 0)
+    headers = await make_user()
+    file_key = await upload(headers, "memo.wav", b"RIFF" + b"\x02" * 4000)
+    worker = TranscriptionWorker(FailingOnce(), 1)
+
+    await worker.run_job((await claim())[0])
+    job = await job_of(file_key)
+    assert (job.status, job.attempts, job.locked_by) == (JOB_QUEUED, 1, None)
+    assert job.last_error == "RuntimeError: engine crashed"
+    assert await result_of(file_key) is None
+
+    retry = await claim()
+    assert [j.attempts for j in retry] == [2]
+    await worker.run_job(retry[0])
+    job = await job_of(file_key)
+    assert (job.status, job.attempts, job.last_error) == (JOB_COMPLETED, 2, None)
+    assert await result_of(file_key) is not None
+
+
+async def test_job_fails_after_the_last_attempt(make_user, upload, monkeypatch):
+    monkeypatch.setattr(transcription_service, "TRANSCRIPTION_MAX_ATTEMPTS", 1)
+    headers = await make_user()
+    file_key = await upload(headers, "memo.wav", b"RIFF" + b"\x03" * 4000)
+
+    await TranscriptionWorker(FailingOnce(), 1).run_job((await claim())[0])
+
+    job = await job_of(file_key)
+    assert (job.status, job.attempts) == (JOB_FAILED, 1)
+    assert await claim() == []
+
+
+async def test_stale_worker_does_not_overwrite(make_user, upload):
+    headers = await make_user()
+    file_key = await upload(headers, "memo.wav", b"RIFF" + b"\x04" * 4000)
+    jobs = await claim()
+    # requeued as stale and claimed by another worker while this one ran
+    async with async_session() as session:
+        await session.execute(update(TranscriptionJob).values(locked_by="other-worker"))
+        await session.commit()
+
+    await TranscriptionWorker(StubEngine(), 1).run_job(jobs[0])
+
+    job = await job_of(file_key)
+    assert (job.status, job.locked_by) == (JOB_RUNNING, "other-worker")
+    assert await result_of(file_key) is None
+
+
+@pytest.mark.parametrize("held", [True, False])
+async def test_heartbeat_reports_held_jobs(make_user, upload, held):
+    headers = await make_user()
+    await upload(headers, "memo.wav", b"RIFF" + b"\x05" * 4000)
+    job = (await claim())[0]
+    if not held:
+        async with async_session() as session:
+            await session.execute(update(TranscriptionJob).values(locked_by="other-worker"))
+            await session.commit()
+
+    async with async_session() as session:
+        assert await transcription_service.heartbeat_jobs(session, WORKER, [job.id]) == (
+            {job.id} if held else set()
+        )
@@ -0,0 +1,107 @@
+"""Resumable uploads: one writer per session, no connection held while streaming."""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from vocali_backend.database import async_session, engine
+from vocali_backend.models import AudioBlob, UploadSession
+from vocali_backend.services.storage import get_storage
+
+
+async def create(client, headers, total_size=None):
+    response = await client.post(
+        "/audio/uploads", json={"fileName": "long.wav", "totalSize": total_size}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["uploadId"]
+
+
+async def test_chunk_streams_without_a_connection(client, make_user):
+    headers = await make_user()
+    upload_id = await create(client, headers, total_size=8)
+    first_part_sent = asyncio.Event()
+    finish = asyncio.Event()
+
+    async def body():
+        yield b"RIFF"
+        first_part_sent.set()
+        await finish.wait()
+        yield b"WAVE"
+
+    chunk = asyncio.create_task(
+        client.put(f"/audio/uploads/{upload_id}", params={"offset": 0}, content=body(), headers=headers)
+    )
+    await first_part_sent.wait()
+    await asyncio.sleep(0.05)
+
+    assert engine.sync_engine.pool.checkedout() == 0
+    # the lease keeps every other writer out until the chunk is committed
+    other = await client.put(f"/audio/uploads/{upload_id}", params={"offset": 0}, content=b"x", headers=headers)
+    assert (other.status_code, other.json()["detail"]) == (409, "Upload is busy")
+    assert (await client.post(f"/audio/uploads/{upload_id}/complete", headers=headers)).status_code == 409
+    assert (await client.delete(f"/audio/uploads/{upload_id}", headers=headers)).status_code == 409
+    assert (await client.get(f"/audio/uploads/{upload_id}", headers=headers)).json()["offset"] == 0
+
+    finish.set()
+    response = await chunk
+    assert response.status_code == 200, response.text
+    assert response.json()["offset"] == 8
+    complete = await client.post(f"/audio/uploads/{upload_id}/complete", headers=headers)
+    assert (complete.status_code, complete.json()["fileSize"]) == (200, 8)
+
+
+async def test_failed_chunk_releases_the_lease(client, make_user):
+    headers = await make_user()
+    upload_id = await create(client, headers, total_size=4)
+
+    too_large = await client.put(f"/audio/uploads/{upload_id}", params={"offset": 0}, content=b"x" * 5, headers=headers)
+    assert too_large.status_code == 413
+    mismatch = await client.put(f"/audio/uploads/{upload_id}", params={"offset": 2}, content=b"xx", headers=headers)
+    assert (mismatch.status_code, mismatch.json()["detail"]["offset"]) == (409, 0)
+
+    response = await client.put(f"/audio/uploads/{upload_id}", params={"offset": 0}, content=b"RIFF", headers=headers)
+    assert (response.status_code, response.json()["offset"]) == (200, 4)
+
+
+async def test_stale_lease_is_taken_over(client, make_user):
+    headers = await make_user()
+    upload_id = await create(client, headers)
+    # left behind by a request that died mid-chunk
+    async with async_session() as session:
+        await session.execute(
+            update(UploadSession).values(locked_by="dead", locked_at=datetime.utcnow() - timedelta(hours=1))
+        )
+        await session.commit()
+
+    response = await client.put(f"/audio/uploads/{upload_id}", params={"offset": 0}, content=b"RIFF", headers=headers)
+    assert (response.status_code, response.json()["offset"]) == (200, 4)
+
+
+async def test_batch_writes_storage_without_row_locks(client, make_user, upload, monkeypatch):
+    headers = await make_user()
+    await upload(headers, "known.wav", b"known" * 100)
+    storage = get_storage()
+    put_stream = storage.put_stream
+    locked = []
+
+    async def checked_put_stream(key, chunks):
+        async with async_session() as session:
+            # NOWAIT fails if the batch holds the row of the known blob
+            await session.execute(select(AudioBlob).with_for_update(nowait=True))
+            locked.append(key)
+        return await put_stream(key, chunks)
+
+    monkeypatch.setattr(storage, "put_stream", checked_put_stream)
+    files = [
+        ("files", ("a.wav", b"known" * 100, "audio/wav")),
+        ("files", ("b.wav", b"new" * 100, "audio/wav")),
+        ("files", ("c.wav", b"new" * 100, "audio/wav")),
+    ]
+    response = await client.post("/audio/upload/batch", files=files, headers=headers)
+    assert response.status_code == 200, response.text
+    assert (response.json()["uploaded"], len(locked)) == (3, 1)
+
+    async with async_session() as session:
+        counts = dict((await session.execute(select(AudioBlob.hash, AudioBlob.ref_count))).all())
+    assert sorted(counts.values()) == [2, 2]
@@ -1,28 +1,29 @@
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple, Union
+import math
 import secrets
-from passlib.context import CryptContext
+import time
+import uuid
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 
+from .database import async_session
 from .models import User
 from .schemas import UserOut
+from .security import security
 import os
 from sqlalchemy import select
 
 
-pwd_context = CryptContext(schemes=["bcrypt_sha256"], deprecated="auto")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 SECRET_KEY = os.getenv("SECRET_KEY")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 15))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 30))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
 
 
 def generate_code() -> str:
@@ -30,39 +31,197 @@ def generate_code() -> str:
 
 
 def create_access_token(sub: str, expires_delta: Optional[timedelta] = None):
+    now = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode = {"sub": sub, "exp": expire, "type": "access"}
+        expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    # jti lets a single token be revoked, iat every token issued before a point
+    to_encode = {"sub": sub, "exp": expire, "iat": now, "jti": uuid.uuid4().hex, "type": "access"}
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt, int(expire.timestamp())
 
 
-def create_refresh_token(sub: str):
+def create_refresh_token(sub: str, jti: str, family_id: str) -> Tuple[str, datetime]:
+    """Only token_service should call this, it records the jti."""
     expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode = {"sub": sub, "exp": expire, "type": "refresh"}
+    to_encode = {"sub": sub, "exp": expire, "jti": jti, "fam": family_id, "type": "refresh"}
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    return encoded_jwt, expire
 
 
-async def get_current_user(token: str, session):
+def decode_token(token: str, token_type: str) -> Optional[dict]:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
     except JWTError:
         return None
+    if payload.get("type") != token_type or not payload.get("sub"):
+        return None
+    return payload
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The parts of a User that authentication and the routes need."""
+    id: int
+    email: str
+    first_name: str
+    last_name: str
+    is_active: bool
+    is_verified: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            is_active=bool(user.is_active),
+            is_verified=bool(user.is_verified),
+        )
+
+
+class PrincipalCache:
+    """TTL + LRU cache of principals keyed by token subject.
+
+    Invalidation only reaches this process, so the TTL bounds how long
+    other workers may keep serving a changed user.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, Tuple[float, Principal]]" = OrderedDict()
+        # bumped on every invalidation so a lookup that started before it
+        # can't put back what was just removed
+        self.generation = 0
+
+    def get(self, email: str) -> Optional[Principal]:
+        entry = self.entries.get(email)
+        if entry is None:
+            return None
+        expires, principal = entry
+        if expires < time.monotonic():
+            del self.entries[email]
+            return None
+        self.entries.move_to_end(email)
+        return principal
+
+    def put(self, principal: Principal, generation: int):
+        if generation != self.generation or self.max_size <= 0:
+            return
+        self.entries[principal.email] = (time.monotonic() + self.ttl, principal)
+        self.entries.move_to_end(principal.email)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, email: str):
+        self.generation += 1
+        self.entries.pop(email, None)
+
+    def clear(self):
+        self.generation += 1
+        self.entries.clear()
+
+
+principal_cache = PrincipalCache(AUTH_CACHE_TTL, AUTH_CACHE_SIZE)
+
+
+class TokenDenylist:
+    """Revoked access tokens, checked on every request without the database.
+
+    Holds single tokens by jti and whole subjects (every token issued up to
+    a point, after a password reset). Entries are dropped once the tokens
+    they cover have expired anyway, so the size is bounded by the number of
+    revocations within one access token lifetime. token_service keeps it in
+    sync with the revoked_tokens table.
+    """
+
+    def __init__(self):
+        self.jtis: Dict[str, float] = {}
+        # subject -> (tokens issued before this are revoked, forget after)
+        self.subjects: Dict[str, Tuple[float, float]] = {}
+
+    def revoke_jti(self, jti: str, expires: float):
+        self.jtis[jti] = max(expires, self.jtis.get(jti, 0))
+
+    def revoke_subject(self, subject: str, revoked_at: float, expires: float):
+        # iat is whole seconds; a token issued later in the same second as
+        # the revocation, like the signin right after a password reset,
+        # must keep working
+        revoked_at = math.floor(revoked_at)
+        current = self.subjects.get(subject)
+        if current is None or current[0] < revoked_at:
+            self.subjects[subject] = (revoked_at, expires)
+
+    def is_revoked(self, payload: dict) -> bool:
+        if payload.get("jti") in self.jtis:
+            return True
+        subject = self.subjects.get(payload["sub"])
+        # tokens from before jti and iat were added count as issued at 0
+        return subject is not None and payload.get("iat", 0) < subject[0]
+
+    def evict(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        self.jtis = {k: v for k, v in self.jtis.items() if v > now}
+        self.subjects = {k: v for k, v in self.subjects.items() if v[1] > now}
+
+
+token_denylist = TokenDenylist()
+
+
+def invalidate_principal(email: str):
+    """Call after changing anything that affects whether email may log in."""
+    principal_cache.invalidate(email)
+
+
+def _token_subject(token: str) -> Optional[str]:
+    payload = decode_token(token, "access")
+    if payload is None or token_denylist.is_revoked(payload):
+        return None
+    return payload["sub"]
 
+
+async def _load_principal(email: str, session) -> Optional[Principal]:
+    generation = principal_cache.generation
     user = await session.execute(select(User).where(User.email == email))
     user = user.scalar_one_or_none()
-    if user and user.is_active and user.is_verified:
-        return user
+    if user is None:
+        return None
+    principal = Principal.from_user(user)
+    principal_cache.put(principal, generation)
+    return principal
+
+
+def _usable(principal: Optional[Principal]) -> Optional[Principal]:
+    if principal and principal.is_active and principal.is_verified:
+        return principal
     return None
 
 
-def user_to_out(user: User, access_token: str, auth_time: int) -> UserOut:
+async def current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> Principal:
+    """Route dependency; resolved once per request.
+
+    A session is only opened on a cache miss, so authenticated requests
+    usually reach the handler without touching the database.
+    """
+    email = _token_subject(credentials.credentials)
+    if email is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    principal = principal_cache.get(email)
+    if principal is None:
+        async with async_session() as session:
+            principal = await _load_principal(email, session)
+    principal = _usable(principal)
+    if principal is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return principal
+
+
+def user_to_out(user: Union[User, Principal], access_token: str, auth_time: int) -> UserOut:
     issued_at = int(datetime.utcnow().timestamp())
     expires_at, _ = create_access_token(user.email)  # только для expiresAt
     expires_at = int(
@@ -0,0 +1,251 @@
+"""Find storage objects no row points at and delete them, or just report them.
+
+    python -m vocali_backend.commands.gc_storage [--grace-hours 24] [--batch-size 1000]
+        [--rate 0] [--dry-run] [--check-rows]
+
+Storage is walked as a stream, each batch of keys is checked against the
+database with one IN query per kind of owner. Objects younger than the
+grace period are left alone, an upload writes its object before its row
+commits. Keys that don't look like anything the app writes are only
+reported. --check-rows also looks the other way, for rows whose object is
+missing; those are reported, never deleted.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Set
+
+from sqlalchemy import select
+
+from ..database import async_session
+from ..models import AudioBlob, AudioFile, AudioRendition
+from ..services.blob_service import (
+    audio_file_key,
+    audio_peaks_key,
+    blob_key,
+    blob_peaks_key,
+    try_lock_blobs,
+)
+from ..services.storage import STORAGE_DELETE_CONCURRENCY, get_storage
+
+logger = logging.getLogger("vocali_backend.commands.gc_storage")
+
+# what LocalStorage.put_stream writes before the rename
+_TEMP_FILE = re.compile(r"\.[0-9a-f]{32}\.tmp$")
+
+TEMP = "temp"
+BLOB = "blob"
+PEAKS = "peaks"
+LEGACY_PEAKS = "legacy_peaks"
+RENDITION = "rendition"
+LEGACY = "legacy"
+
+
+@dataclass
+class Stats:
+    scanned: int = 0
+    recent: int = 0
+    unknown: int = 0
+    orphans: int = 0
+    orphan_bytes: int = 0
+    deleted: int = 0
+    skipped: int = 0
+    failed: int = 0
+
+
+def key_kind(key: str) -> Optional[str]:
+    """Which kind of row owns key, None for keys the app doesn't write."""
+    if _TEMP_FILE.search(key):
+        return TEMP
+    parts = key.split("/")
+    if parts[0] == "blobs" and len(parts) == 4:
+        return BLOB
+    if parts[0] == "peaks" and len(parts) == 3 and parts[2].endswith(".peaks"):
+        return LEGACY_PEAKS if parts[1] == "legacy" else PEAKS
+    if parts[0] == "renditions" and len(parts) == 3:
+        return RENDITION
+    # files from before content addressing: <file_key>_<file_name>
+    if len(parts) == 1 and "_" in key:
+        return LEGACY
+    return None
+
+
+async def owned_keys(session, keys: List[str]) -> Set[str]:
+    """The subset of keys some row points at, by the app's own key functions."""
+    blob_hashes, file_keys, renditions = set(), set(), []
+    for key in keys:
+        kind = key_kind(key)
+        name = key.rsplit("/", 1)[-1]
+        if kind == BLOB:
+            blob_hashes.add(name)
+        elif kind == PEAKS:
+            blob_hashes.add(name.removesuffix(".peaks"))
+        elif kind == LEGACY_PEAKS:
+            file_keys.add(name.removesuffix(".peaks"))
+        elif kind == RENDITION:
+            renditions.append(key)
+        elif kind == LEGACY:
+            file_keys.add(key.split("_", 1)[0])
+
+    owned = set()
+    if blob_hashes:
+        result = await session.execute(select(AudioBlob.hash).where(AudioBlob.hash.in_(blob_hashes)))
+        for h in result.scalars():
+            owned.update((blob_key(h), blob_peaks_key(h)))
+    if file_keys:
+        result = await session.execute(
+            select(AudioFile.file_key, AudioFile.file_name, AudioFile.blob_hash)
+            .where(AudioFile.file_key.in_(file_keys))
+        )
+        for row in result:
+            owned.update((audio_file_key(row), audio_peaks_key(row)))
+    if renditions:
+        result = await session.execute(
+            select(AudioRendition.storage_key).where(AudioRendition.storage_key.in_(renditions))
+        )
+        owned.update(result.scalars())
+    return owned
+
+
+async def delete_orphans(keys: List[str], stats: Stats):
+    storage = get_storage()
+    blobs = [k for k in keys if key_kind(k) == BLOB]
+    others = [k for k in keys if key_kind(k) != BLOB]
+    failed = await storage.delete_many(others) if others else []
+
+    if blobs:
+        async with async_session() as session:
+            # an upload about to reuse one of these holds its lock; ours last
+            # until commit, so no row can appear while the objects go
+            locked = await try_lock_blobs(session, [k.rsplit("/", 1)[-1] for k in blobs])
+            result = await session.execute(select(AudioBlob.hash).where(AudioBlob.hash.in_(locked)))
+            claimed = set(result.scalars())
+            dead = [blob_key(h) for h in locked if h not in claimed]
+            stats.skipped += len(blobs) - len(dead)
+            failed += await storage.delete_many(dead)
+            await session.commit()
+        keys = others + dead
+
+    for key in failed:
+        logger.warning("Could not delete %s", key)
+    stats.failed += len(failed)
+    stats.deleted += len(keys) - len(failed)
+
+
+async def collect(grace: timedelta, batch_size: int, rate: float, dry_run: bool) -> Stats:
+    stats = Stats()
+    cutoff = datetime.now(timezone.utc) - grace
+    started = time.monotonic()
+    batch = []
+
+    async def flush():
+        async with async_session() as session:
+            owned = await owned_keys(session, [key for key, _ in batch])
+        orphans = [(key, obj) for key, obj in batch if key not in owned]
+        for key, obj in orphans:
+            logger.info("Orphan %s (%d bytes, %s)", key, obj.size, obj.modified.isoformat())
+        stats.orphans += len(orphans)
+        stats.orphan_bytes += sum(obj.size for _, obj in orphans)
+        if orphans and not dry_run:
+            await delete_orphans([key for key, _ in orphans], stats)
+        batch.clear()
+
+    async for key, obj in get_storage().iter_keys():
+        stats.scanned += 1
+        if rate and stats.scanned % 100 == 0:
+            # keep the disk and the database usable for the live node
+            ahead = stats.scanned / rate - (time.monotonic() - started)
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+        if obj.modified > cutoff:
+            stats.recent += 1
+            continue
+        if key_kind(key) is None:
+            stats.unknown += 1
+            logger.warning("Unknown key %s, leaving it", key)
+            continue
+        batch.append((key, obj))
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    return stats
+
+
+async def check_rows(batch_size: int) -> int:
+    """Report blobs and legacy files whose object is gone; returns how many."""
+    storage = get_storage()
+    semaphore = asyncio.Semaphore(STORAGE_DELETE_CONCURRENCY)
+
+    async def exists(key):
+        async with semaphore:
+            return await storage.exists(key)
+
+    async def check(keys):
+        found = await asyncio.gather(*(exists(k) for k in keys))
+        gone = [k for k, ok in zip(keys, found) if not ok]
+        for key in gone:
+            logger.warning("Row without object: %s", key)
+        return len(gone)
+
+    missing, last_hash = 0, ""
+    while True:
+        async with async_session() as session:
+            result = await session.execute(
+                select(AudioBlob.hash)
+                .where(AudioBlob.hash > last_hash)
+                .order_by(AudioBlob.hash)
+                .limit(batch_size)
+            )
+            hashes = list(result.scalars())
+        if not hashes:
+            break
+        missing += await check([blob_key(h) for h in hashes])
+        last_hash = hashes[-1]
+
+    last_id = 0
+    while True:
+        async with async_session() as session:
+            result = await session.execute(
+                select(AudioFile.id, AudioFile.file_key, AudioFile.file_name, AudioFile.blob_hash)
+                .where(AudioFile.blob_hash.is_(None), AudioFile.id > last_id)
+                .order_by(AudioFile.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+        if not rows:
+            break
+        missing += await check([audio_file_key(r) for r in rows])
+        last_id = rows[-1].id
+    return missing
+
+
+async def main(grace_hours: float, batch_size: int, rate: float, dry_run: bool, rows: bool):
+    stats = await collect(timedelta(hours=grace_hours), batch_size, rate, dry_run)
+    logger.info(
+        "Scanned %d keys: %d orphans (%d bytes), %d %s, %d skipped, %d failed, "
+        "%d within the grace period, %d unknown",
+        stats.scanned, stats.orphans, stats.orphan_bytes,
+        stats.orphans if dry_run else stats.deleted, "would be deleted" if dry_run else "deleted",
+        stats.skipped, stats.failed, stats.recent, stats.unknown,
+    )
+    if rows:
+        logger.info("Found %d rows without an object", await check_rows(batch_size))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete storage objects no row points at")
+    parser.add_argument("--grace-hours", type=float, default=24)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=0, help="keys scanned per second, 0 for no limit")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--check-rows", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    asyncio.run(main(args.grace_hours, args.batch_size, args.rate, args.dry_run, args.check_rows))
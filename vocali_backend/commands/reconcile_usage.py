@@ -0,0 +1,122 @@
+"""Recompute user_usage from audio_files and fix any drift.
+
+    python -m vocali_backend.commands.reconcile_usage [--batch-size 500] [--dry-run]
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import asyncio
+import logging
+
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects.postgresql import insert
+
+from ..database import async_session
+from ..models import AudioFile, User, UserUsage
+
+logger = logging.getLogger("vocali_backend.commands.reconcile_usage")
+
+
+async def reconcile_batch(session, user_ids, dry_run: bool) -> int:
+    # a missing counter can't be locked, and a first upload could create
+    # it between the aggregate and the write below, which would then
+    # overwrite that upload's delta. So create the missing ones empty
+    # first; a dry run rolls them back.
+    created = await session.execute(
+        insert(UserUsage)
+        .from_select(
+            ["user_id", "file_count", "total_bytes", "total_duration", "updated_at"],
+            select(AudioFile.user_id, literal(0), literal(0), literal(0), func.now())
+            .where(AudioFile.user_id.in_(user_ids))
+            .distinct(),
+        )
+        .on_conflict_do_nothing(index_elements=[UserUsage.user_id])
+        .returning(UserUsage.user_id)
+    )
+    created = set(created.scalars())
+    # lock the counters: an upload that is mid-transaction either commits
+    # before the aggregate below runs, or applies its delta after
+    result = await session.execute(
+        select(UserUsage.user_id).where(UserUsage.user_id.in_(user_ids)).with_for_update()
+    )
+    locked = set(result.scalars())
+    actual = {
+        row.user_id: row
+        for row in await session.execute(
+            select(
+                AudioFile.user_id,
+                func.count().label("file_count"),
+                func.coalesce(func.sum(AudioFile.file_size), 0).label("total_bytes"),
+                func.coalesce(func.sum(AudioFile.duration), 0).label("total_duration"),
+            )
+            .where(AudioFile.user_id.in_(user_ids))
+            .group_by(AudioFile.user_id)
+        )
+    }
+    stored = {
+        row.user_id: row
+        for row in (
+            await session.execute(select(UserUsage).where(UserUsage.user_id.in_(user_ids)))
+        ).scalars()
+    }
+
+    fixes = []
+    for user_id in user_ids:
+        # no files when the counters were created and none to lock; one
+        # that appeared since came with its upload, the next run checks it
+        if user_id not in locked:
+            continue
+        row = actual.get(user_id)
+        values = {
+            "file_count": row.file_count if row else 0,
+            "total_bytes": row.total_bytes if row else 0,
+            "total_duration": row.total_duration if row else 0,
+        }
+        current = stored[user_id]
+        if user_id not in created and all(getattr(current, k) == v for k, v in values.items()):
+            continue
+        logger.info("User %s drifted: %s -> %s", user_id,
+                    None if user_id in created else {k: getattr(current, k) for k in values}, values)
+        fixes.append({"user_id": user_id, **values})
+
+    if dry_run:
+        await session.rollback()
+        return len(fixes)
+    if fixes:
+        stmt = insert(UserUsage).values(fixes)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[UserUsage.user_id],
+            set_={
+                "file_count": stmt.excluded.file_count,
+                "total_bytes": stmt.excluded.total_bytes,
+                "total_duration": stmt.excluded.total_duration,
+                "updated_at": func.now(),
+            },
+        ))
+    await session.commit()
+    return len(fixes)
+
+
+async def main(batch_size: int, dry_run: bool):
+    last_id, checked, fixed = 0, 0, 0
+    while True:
+        async with async_session() as session:
+            result = await session.execute(
+                select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+            )
+            user_ids = list(result.scalars())
+            if not user_ids:
+                break
+            fixed += await reconcile_batch(session, user_ids, dry_run)
+        checked += len(user_ids)
+        last_id = user_ids[-1]
+    logger.info("Checked %d users, %s %d", checked, "would fix" if dry_run else "fixed", fixed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repair drift in per-user storage usage")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    asyncio.run(main(args.batch_size, args.dry_run))
@@ -1,19 +1,124 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
+import time
 from .models import Base
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# optional replica for read-only routes, they fall back to the primary
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 30 * 60))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# set to 0 behind pgbouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long checkouts wait for a connection.
+
+    The wait includes opening a new connection when the pool grows into
+    its overflow, which is the latency a request actually sees.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def recreate(self):
+        # dispose() swaps in a fresh pool, keep the counters going
+        pool = super().recreate()
+        pool.checkouts, pool.timeouts = self.checkouts, self.timeouts
+        pool.wait_total, pool.wait_max = self.wait_total, self.wait_max
+        return pool
+
+
+def make_engine(url: str) -> AsyncEngine:
+    url = make_url(url)
+    connect_args = {}
+    if url.drivername == "postgresql+asyncpg":
+        url = url.update_query_dict({"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)})
+        connect_args["statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
+    return create_async_engine(
+        url,
+        echo=DB_ECHO,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+def pool_stats(engine: AsyncEngine) -> dict:
+    pool = engine.sync_engine.pool
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    checked_out = pool.checkedout()
+    checkouts = getattr(pool, "checkouts", 0)
+    return {
+        "size": pool.size(),
+        "maxOverflow": pool._max_overflow,
+        "checkedIn": pool.checkedin(),
+        "checkedOut": checked_out,
+        "overflow": max(pool.overflow(), 0),
+        "saturation": round(checked_out / capacity, 3) if capacity else None,
+        "checkouts": checkouts,
+        "timeouts": getattr(pool, "timeouts", 0),
+        "waitAvgMs": round(pool.wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+        "waitMaxMs": round(getattr(pool, "wait_max", 0.0) * 1000, 3),
+    }
+
+
+engine = make_engine(DATABASE_URL)
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+read_engine = make_engine(DATABASE_READ_URL) if DATABASE_READ_URL else engine
+async_read_session = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
 
 async def get_session() -> AsyncSession:
     async with async_session() as session:
         yield session
 
 
+async def get_read_session() -> AsyncSession:
+    """For routes that only read and can live with replica lag."""
+    async with async_read_session() as session:
+        yield session
+
+
+def all_pool_stats() -> dict:
+    stats = {"primary": pool_stats(engine)}
+    if read_engine is not engine:
+        stats["replica"] = pool_stats(read_engine)
+    return stats
+
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
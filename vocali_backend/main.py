@@ -1,22 +1,40 @@
 from dotenv import load_dotenv
 load_dotenv()
+import asyncio
 from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import uvicorn
 from contextlib import asynccontextmanager
-from .database import init_db, get_session
+from .database import all_pool_stats, engine, init_db, get_session, get_read_session, read_engine
+from .metrics import (
+    METRICS_TOKEN,
+    MetricsMiddleware,
+    check_metrics_token,
+    instrument_engine,
+    render_metrics,
+    run_queue_depth_refresher,
+)
 
 from .models import Base
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from .routes.auth import router as auth_router
 from .routes.audio import router as audio_router
+from .routes.uploads import router as uploads_router
+from .services.email_service import load_templates
+from .services.metadata_service import metadata_pipeline
+from .services.password_hasher import password_hasher
+from .services.rendition_service import rendition_pipeline
+from .services.token_service import start_denylist_sync
+from .services.upload_service import run_upload_sweeper
 
 
 app = FastAPI()
 
+instrument_engine(engine)
+instrument_engine(read_engine)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,15 +42,54 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # let the browser audio player see range and validator headers
+    expose_headers=[
+        "ETag", "Content-Range", "Accept-Ranges", "Content-Length",
+        "X-Peaks-Sample-Rate", "X-Peaks-Samples-Per-Peak", "X-Peaks-Bits",
+        "Content-Disposition", "X-Export-Next-Cursor",
+    ],
 )
 
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# added last so it wraps CORS; unhandled errors are counted as 500s
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
 app.include_router(audio_router, prefix="/audio", tags=["audio"])
+app.include_router(uploads_router, prefix="/audio/uploads", tags=["audio"])
+
+@app.get("/health")
+async def health():
+    # pool saturation and checkout waits, for sizing DB_POOL_SIZE
+    return {"status": "ok", "pools": all_pool_stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(check_metrics_token)])
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 
 @app.on_event("startup")
 async def startup_event():
     await init_db()
+    load_templates()
+    app.state.upload_sweeper = asyncio.create_task(run_upload_sweeper())
+    app.state.denylist_sync = await start_denylist_sync()
+    app.state.queue_depths = None
+    if METRICS_TOKEN:
+        app.state.queue_depths = asyncio.create_task(run_queue_depth_refresher())
+    await metadata_pipeline.start()
+    await rendition_pipeline.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.upload_sweeper.cancel()
+    app.state.denylist_sync.cancel()
+    if app.state.queue_depths:
+        app.state.queue_depths.cancel()
+    await metadata_pipeline.stop()
+    await rendition_pipeline.stop()
+    password_hasher.shutdown()
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,388 @@
+"""In-process metrics in the Prometheus text format.
+
+A deliberately small registry: counters and gauges (kept here or read
+from a callback at scrape time) and histograms with fixed buckets.
+Updates are plain dict operations on the event loop thread, no locks.
+Every worker process keeps its own numbers, scrape each one. Scrapes
+need METRICS_TOKEN as a bearer token, without it the endpoint is off.
+"""
+import asyncio
+import logging
+import os
+import re
+import secrets
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import all_pool_stats, async_read_session
+from .models import EmailOutbox, TranscriptionJob
+from .services.email_service import EMAIL_PENDING, EMAIL_SENDING
+from .services.metadata_service import metadata_pipeline
+from .services.password_hasher import password_hasher
+from .services.rate_limit import concurrency_limiters, rate_limiters
+from .services.rendition_service import rendition_pipeline
+from .services.transcription_service import JOB_QUEUED, JOB_RUNNING
+
+logger = logging.getLogger(__name__)
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# queue depths are counted in the background this often, never per scrape
+METRICS_QUEUE_INTERVAL = float(os.getenv("METRICS_QUEUE_INTERVAL", 15))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class _Value(Metric):
+    """A single number per label set, kept here or read at scrape time."""
+
+    def __init__(self, *args, callback: Optional[Callable[[], Dict[Tuple, float]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple, float] = {}
+        # returns {label values: value}, for numbers that already live elsewhere
+        self.callback = callback
+
+    def samples(self):
+        values = self.callback() if self.callback else self.values
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in values.items()]
+
+
+class Counter(_Value):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, *labels):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(_Value):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def inc(self, amount: float = 1, *labels):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, *labels):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket..., +Inf count], sum
+        self.values: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        # counts are stored per bucket and only made cumulative when rendered
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def samples(self):
+        lines = []
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total[0])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self.metrics) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests handled.", ("method", "route", "status")
+)
+http_latency = registry.histogram(
+    "http_request_duration_seconds", "Time from request start to the end of the response.",
+    ("method", "route"),
+)
+http_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being handled right now.")
+http_request_bytes = registry.counter(
+    "http_request_body_bytes_total", "Request body bytes received, uploads mostly.", ("route",)
+)
+http_response_bytes = registry.counter(
+    "http_response_body_bytes_total", "Response body bytes sent, downloads mostly.", ("route",)
+)
+db_query_latency = registry.histogram(
+    "db_query_duration_seconds", "Statement execution time by normalized SQL.",
+    ("statement",), buckets=QUERY_BUCKETS,
+)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware so the only per-request cost is two wrappers.
+
+    The route label is the path template FastAPI puts in scope["route"]
+    after routing, so /audio/files/{fileKey}/content is one series however
+    many files there are.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        content_length = 0
+        received = 0
+        sent = 0
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status, content_length, sent
+            kind = message["type"]
+            if kind == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name == b"content-length":
+                        content_length = int(value)
+            elif kind == "http.response.body":
+                sent += len(message.get("body", b""))
+            elif kind == "http.response.pathsend":
+                # the server sends the file itself
+                sent += content_length
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            http_in_flight.dec()
+            path = getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+            method = scope["method"]
+            http_requests.inc(1, method, path, str(status))
+            http_latency.observe(time.perf_counter() - started, method, path)
+            if received:
+                http_request_bytes.inc(received, path)
+            if sent:
+                http_response_bytes.inc(sent, path)
+
+
+_IN_LIST = re.compile(r"\((?:\s*\$\d+(?:::[\w ]+(?:\[\])?)?\s*,?)+\)(?:, \(\.\.\.\))*")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|(?<![$\w])\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+# column lists make up most of a statement and say little about its cost
+_SELECT_LIST = re.compile(r"\bSELECT (?:(?!\bFROM\b).)+? FROM\b")
+_INSERT_LIST = re.compile(r"\b(INSERT INTO \S+) \([^)]*\)")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement: str) -> str:
+    """Collapse a statement to its shape so similar queries share a series."""
+    statement = _SPACE.sub(" ", statement).strip()
+    statement = _SELECT_LIST.sub("SELECT ... FROM", statement)
+    statement = _INSERT_LIST.sub(r"\1 (...)", statement)
+    statement = _IN_LIST.sub("(...)", statement)
+    statement = _LITERAL.sub("?", statement)
+    return statement[:200]
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["metrics_started"].pop()
+    db_query_latency.observe(time.perf_counter() - started, normalize_sql(statement))
+
+
+def _execute_failed(exception_context):
+    # after_cursor_execute doesn't run for failed statements
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("metrics_started"):
+        conn.info["metrics_started"].pop()
+
+
+def instrument_engine(engine):
+    """Time every statement run through engine (an AsyncEngine or Engine)."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "before_cursor_execute", _before_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_execute)
+    event.listen(sync_engine, "handle_error", _execute_failed)
+
+
+def _pool_values(key: str):
+    def read():
+        return {(name,): stats[key] for name, stats in all_pool_stats().items()}
+    return read
+
+
+db_pool_checked_out = registry.gauge(
+    "db_pool_connections_checked_out", "Connections in use.", ("pool",),
+    callback=_pool_values("checkedOut"),
+)
+db_pool_checkouts = registry.counter(
+    "db_pool_checkouts_total", "Connection checkouts since startup.", ("pool",),
+    callback=_pool_values("checkouts"),
+)
+db_pool_timeouts = registry.counter(
+    "db_pool_timeouts_total", "Checkouts that gave up waiting for a connection.", ("pool",),
+    callback=_pool_values("timeouts"),
+)
+metadata_queue_depth = registry.gauge(
+    "metadata_queue_depth", "Uploads waiting for metadata extraction in this process.",
+    callback=lambda: {(): metadata_pipeline.queue.qsize()},
+)
+rendition_queue_depth = registry.gauge(
+    "rendition_queue_depth", "Blobs waiting to be transcoded in this process.",
+    callback=lambda: {(): rendition_pipeline.queue.qsize()},
+)
+password_hash_in_flight = registry.gauge(
+    "password_hash_in_flight", "Password hashes running or waiting for a worker thread.",
+    callback=lambda: {(): password_hasher.in_flight},
+)
+admission_waiting = registry.gauge(
+    "admission_waiting", "Requests queued for an admission slot.", ("route",),
+    callback=lambda: {(l.name,): l.waiting for l in concurrency_limiters},
+)
+admission_rejected = registry.counter(
+    "admission_rejected_total", "Requests turned away with a 503, queue full or wait too long.",
+    ("route",), callback=lambda: {(l.name,): l.rejected for l in concurrency_limiters},
+)
+rate_limited = registry.counter(
+    "rate_limited_total", "Requests turned away with a 429 by a token bucket.", ("bucket",),
+    callback=lambda: {(l.name,): l.rejected for l in rate_limiters},
+)
+rate_limit_keys = registry.gauge(
+    "rate_limit_keys", "Clients tracked by a token bucket limiter.", ("bucket",),
+    callback=lambda: {(l.name,): len(l.buckets) for l in rate_limiters},
+)
+job_queue_depth = registry.gauge(
+    "job_queue_depth",
+    f"Rows in the database work queues that aren't finished, up to {METRICS_QUEUE_INTERVAL:g}s old.",
+    ("queue", "status"),
+)
+
+# only unfinished statuses, the claim indexes cover these and finished
+# rows would turn every scrape into a table scan
+_QUEUES = (
+    ("transcription", TranscriptionJob, (JOB_QUEUED, JOB_RUNNING)),
+    ("email", EmailOutbox, (EMAIL_PENDING, EMAIL_SENDING)),
+)
+
+
+async def refresh_queue_depths(session: AsyncSession):
+    for queue, model, statuses in _QUEUES:
+        result = await session.execute(
+            select(model.status, func.count())
+            .where(model.status.in_(statuses))
+            .group_by(model.status)
+        )
+        counts = dict(result.all())
+        for status in statuses:
+            job_queue_depth.set(counts.get(status, 0), queue, status)
+
+
+async def run_queue_depth_refresher():
+    while True:
+        try:
+            async with async_read_session() as session:
+                await refresh_queue_depths(session)
+        except Exception:
+            logger.exception("Queue depth refresh failed")
+        await asyncio.sleep(METRICS_QUEUE_INTERVAL)
+
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def check_metrics_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)):
+    """Route dependency for /metrics, which exposes internals and must not be public."""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if credentials is None or not secrets.compare_digest(
+        credentials.credentials.encode(), METRICS_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def render_metrics() -> str:
+    return registry.render()
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, func, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Float, Text, JSON, Index, func, text, ForeignKey
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import relationship
@@ -27,6 +28,11 @@ class User(Base):
 
 class AudioFile(Base):
     __tablename__ = "audio_files"
+    __table_args__ = (
+        # the listing pages newest first with a (uploaded_at, id) cursor
+        Index("ix_audio_files_user_uploaded", "user_id", text("uploaded_at DESC"), "id"),
+        Index("ix_audio_files_search", "search_vector", postgresql_using="gin"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -35,6 +41,159 @@ class AudioFile(Base):
     file_size = Column(Integer)
     duration = Column(Integer, default=0)
     format = Column(String)
-    uploaded_at = Column(DateTime, default=datetime.utcnow)
+    uploaded_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    blob_hash = Column(String, ForeignKey("audio_blobs.hash"), nullable=True, index=True)
+    sample_rate = Column(Integer, nullable=True)
+    channels = Column(Integer, nullable=True)
+    bitrate = Column(Integer, nullable=True)
+    codec = Column(String, nullable=True)
+    mime_type = Column(String, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+    # file name (weight A) and transcript (weight B), see search_service
+    search_vector = Column(TSVECTOR, nullable=True)
 
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+
+class AudioBlob(Base):
+    __tablename__ = "audio_blobs"
+
+    hash = Column(String, primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AudioRendition(Base):
+    """A transcoded playback copy of a blob, one row per blob and variant.
+
+    Rows that are skipped or failed stay so the blob isn't retried; only
+    ready rows have an object at storage_key.
+    """
+    __tablename__ = "audio_renditions"
+    __table_args__ = (
+        Index("ix_audio_renditions_blob_variant", "blob_hash", "variant", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    blob_hash = Column(String, ForeignKey("audio_blobs.hash", ondelete="CASCADE"), nullable=False)
+    variant = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    storage_key = Column(String, nullable=True)
+    mime_type = Column(String, nullable=True)
+    size = Column(BigInteger, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    file_name = Column(String, nullable=False)
+    total_size = Column(BigInteger, nullable=True)
+    received_bytes = Column(BigInteger, nullable=False, default=0)
+    # lease held by the request appending a chunk, taken and released in
+    # short transactions so no row lock is held while the body streams
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class TranscriptionJob(Base):
+    __tablename__ = "transcription_jobs"
+    __table_args__ = (
+        # workers claim with WHERE status = 'queued' AND run_after <= now()
+        Index("ix_transcription_jobs_claim", "status", "run_after"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    audio_file_id = Column(
+        Integer, ForeignKey("audio_files.id", ondelete="CASCADE"), nullable=False, unique=True
+    )
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TranscriptionResult(Base):
+    __tablename__ = "transcriptions"
+
+    audio_file_id = Column(
+        Integer, ForeignKey("audio_files.id", ondelete="CASCADE"), primary_key=True
+    )
+    language = Column(String, nullable=False)
+    text = Column(Text, nullable=False)
+    word_count = Column(Integer, nullable=False)
+    character_count = Column(Integer, nullable=False)
+    confidence = Column(Float, nullable=True)
+    method = Column(String, nullable=True)
+    completed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UserUsage(Base):
+    __tablename__ = "user_usage"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    file_count = Column(Integer, nullable=False, default=0)
+    total_bytes = Column(BigInteger, nullable=False, default=0)
+    total_duration = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index("ix_email_outbox_claim", "status", "run_after"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    to_email = Column(String, nullable=False)
+    template = Column(String, nullable=False)
+    context = Column(JSON, nullable=False, default=dict)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    # the token's jti claim; the token itself is never stored
+    jti = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    # every token rotated from one signin shares a family
+    family_id = Column(String, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    replaced_by = Column(String, nullable=True)
+    revoked_at = Column(DateTime, nullable=True)
+
+
+class RevokedToken(Base):
+    """Access tokens that must stop working before they expire.
+
+    A row names either one token (jti) or every token of a subject issued
+    up to revoked_at. Workers poll it to keep their in-memory denylist in
+    sync; rows are useless once expires_at has passed.
+    """
+    __tablename__ = "revoked_tokens"
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String, nullable=True)
+    subject = Column(String, nullable=True)
+    # database clock, so workers polling by it agree on the order
+    revoked_at = Column(DateTime, nullable=False, server_default=text("(now() at time zone 'utc')"), index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
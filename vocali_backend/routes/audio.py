@@ -1,127 +1,340 @@
 import requests
 
-from sqlalchemy import select, func
-from fastapi import UploadFile, File, APIRouter, Depends, HTTPException
+from sqlalchemy import select, insert, and_, func, or_
+from datetime import datetime
+from typing import Dict, List, Optional
+import json
+import logging
 import os
+from fastapi import UploadFile, File, APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 import uuid
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi.security import HTTPAuthorizationCredentials
 
-from ..models import AudioFile
-from ..database import get_session
-from ..security import security
-from ..auth_utils import get_current_user
-from ..schemas import AudioFileOut, AudioMetadata, Transcription
+from ..models import AudioFile, AudioRendition, TranscriptionJob, TranscriptionResult
+from ..database import async_read_session, get_read_session, get_session
+from ..auth_utils import Principal, current_user
+from ..schemas import (
+    AUDIO_FILE_LIST,
+    EXPORTED_FILE,
+    AudioFileItem,
+    BatchDeleteRequest,
+    TranscriptionItem,
+)
+from ..services.blob_service import audio_file_key, audio_peaks_key, store_upload, store_uploads
+from ..services.delete_service import (
+    DELETED,
+    FAILED,
+    NOT_FOUND,
+    delete_files_by_key,
+    delete_files_older_than,
+)
+from ..services.download_service import (
+    CONTENT_CACHE_CONTROL,
+    accepts,
+    content_etag,
+    content_filename,
+    content_headers,
+    content_last_modified,
+    content_media_type,
+    content_url,
+    is_not_modified,
+)
+from ..services.export_service import (
+    EXPORT_BATCH_SIZE,
+    EXPORT_MAX_BYTES,
+    EXPORT_MAX_FILES,
+    ZipStream,
+    archive_name,
+)
+from ..services.metadata_service import metadata_pipeline
+from ..services.pagination import (
+    decode_cursor,
+    decode_rank_cursor,
+    encode_cursor,
+    encode_rank_cursor,
+)
+from ..services.search_service import file_search_vector, parse_search
+from ..services.rendition_service import RENDITION_READY
+from ..services.storage import get_storage
+from ..services.transcode import RENDITION_VARIANT
+from ..services.transcription_service import (
+    TRANSCRIPTION_STATUS,
+    enqueue_transcription,
+    enqueue_transcriptions,
+)
+from ..services.usage_service import (
+    USER_QUOTA_BYTES,
+    USER_QUOTA_DURATION,
+    USER_QUOTA_FILES,
+    add_usage,
+    check_quota,
+    get_usage,
+)
+from ..services.waveform import MAX_HEADER_SIZE, read_level
 from fastapi import Query
 
 
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", 100))
+UPLOAD_BATCH_CONCURRENCY = int(os.getenv("UPLOAD_BATCH_CONCURRENCY", 4))
+
+
+# only what the listing shows, no ORM entities are built for it
+_LISTING_COLUMNS = (
+    AudioFile.id,
+    AudioFile.file_key,
+    AudioFile.file_name,
+    AudioFile.file_size,
+    AudioFile.duration,
+    AudioFile.format,
+    AudioFile.uploaded_at,
+    AudioFile.mime_type,
+    TranscriptionJob.status.label("job_status"),
+    TranscriptionResult.language,
+    TranscriptionResult.text,
+    TranscriptionResult.completed_at,
+    TranscriptionResult.word_count,
+    TranscriptionResult.method,
+    TranscriptionResult.confidence,
+    TranscriptionResult.character_count,
+)
+
+
+def _transcription_item(row) -> TranscriptionItem:
+    if row.text is None:
+        return {
+            "language": "en",
+            "text": "",
+            "status": TRANSCRIPTION_STATUS.get(row.job_status, "pending"),
+            "completedAt": None,
+            "wordCount": None,
+            "method": None,
+            "confidence": None,
+            "characterCount": None,
+        }
+    return {
+        "language": row.language,
+        "text": row.text,
+        "status": "completed",
+        "completedAt": row.completed_at,
+        "wordCount": row.word_count,
+        "method": row.method,
+        "confidence": row.confidence,
+        "characterCount": row.character_count,
+    }
+
+
+def _audio_file_item(row, user_id: int) -> AudioFileItem:
+    duration = row.duration or 0
+    return {
+        "userId": user_id,
+        "fileKey": row.file_key,
+        "fileName": row.file_name,
+        "fileSize": row.file_size,
+        "duration": duration,
+        "format": row.format,
+        "uploadedAt": row.uploaded_at,
+        "lastModified": row.uploaded_at,
+        "status": "ready",
+        "metadata": {
+            "originalName": row.file_name,
+            "duration": duration,
+            "extension": row.format,
+            "transcription": _transcription_item(row),
+            "fileSize": row.file_size,
+            "format": row.format,
+            "uploadedAt": row.uploaded_at,
+            "mimeType": content_media_type(row),
+        },
+        "downloadUrl": content_url(row),
+    }
+
 
 @router.post("/upload")
 async def upload_audio(
     file: UploadFile = File(...),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    user: Principal = Depends(current_user),
     session: AsyncSession = Depends(get_session),
 ):
-    user = await get_current_user(credentials.credentials, session)
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # создаём папку если нет
-    os.makedirs("uploads", exist_ok=True)
-
     file_key = str(uuid.uuid4())
-    file_location = f"uploads/{file_key}_{file.filename}"
 
-    # сохраняем файл
-    with open(file_location, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    await check_quota(session, user.id, file.size or 0)
+
+    # одинаковые файлы хранятся один раз, по хэшу содержимого
+    checksum, file_size = await store_upload(session, file)
 
     audio = AudioFile(
         user_id=user.id,
         file_key=file_key,
         file_name=file.filename,
-        file_size=len(content),
+        file_size=file_size,
         format=file.filename.split(".")[-1],
-        duration=0
-
+        duration=0,
+        blob_hash=checksum,
+        search_vector=file_search_vector(file.filename),
     )
 
     session.add(audio)
+    await session.flush()
+    enqueue_transcription(session, audio)
+    await add_usage(session, user.id, files=1, size=file_size, enforce=True)
     await session.commit()
-    await session.refresh(audio)
 
-    return {"message": "File uploaded"}
+    metadata_pipeline.enqueue(audio.id)
+
+    return {
+        "message": "File uploaded",
+        "fileKey": file_key,
+        "fileSize": file_size,
+        "checksum": checksum,
+    }
 
 
-@router.get("/files")
-async def get_audio_files(
-    page: int = Query(1, ge=1),
-    limit: int = Query(10, ge=1, le=100),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+@router.post("/upload/batch")
+async def upload_audio_batch(
+    files: List[UploadFile] = File(...),
+    user: Principal = Depends(current_user),
     session: AsyncSession = Depends(get_session),
 ):
-    user = await get_current_user(credentials.credentials, session)
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-  
-    offset = (page - 1) * limit
-
-   
-    total_result = await session.execute(
-        select(func.count()).select_from(AudioFile).where(AudioFile.user_id == user.id)
-    )
-    total_items = total_result.scalar_one()
+    """Upload many files in one request.
 
-  
-    result = await session.execute(
-        select(AudioFile)
-        .where(AudioFile.user_id == user.id)
-        .order_by(AudioFile.uploaded_at.desc())
-        .offset(offset)
-        .limit(limit)
-    )
-
-    files = result.scalars().all()
-
-    items = [
-        AudioFileOut(
-            userId=user.id,
-            fileKey=file.file_key,
-            fileName=file.file_name,
-            fileSize=file.file_size,
-            duration=file.duration or 0,
-            format=file.format,
-            uploadedAt=file.uploaded_at,
-            lastModified=file.uploaded_at,
-            status="ready",
-            metadata=AudioMetadata(
-                originalName=file.file_name,
-                duration=file.duration or 0,
-                extension=file.format,
-                transcription=Transcription(
-                    language="en",
-                    text="",
-                    status="pending"
-                ),
-                fileSize=file.file_size,
-                format=file.format,
-                uploadedAt=file.uploaded_at,
-                mimeType="audio/mpeg"
-            ),
-            downloadUrl=f"/uploads/{file.file_key}_{file.file_name}"
+    Files are hashed and written to storage in parallel, then all rows are
+    inserted with one statement and committed once. Files that fail are
+    reported per file and don't stop the rest.
+    """
+    if len(files) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {UPLOAD_BATCH_MAX_FILES} files per request",
         )
-        for file in files
+
+    await check_quota(session, user.id, sum(f.size or 0 for f in files), files=len(files))
+
+    stored = await store_uploads(session, files, UPLOAD_BATCH_CONCURRENCY)
+
+    rows = [
+        {
+            "user_id": user.id,
+            "file_key": str(uuid.uuid4()),
+            "file_name": file.filename,
+            "file_size": result.size,
+            "format": file.filename.split(".")[-1],
+            "duration": 0,
+            "blob_hash": result.blob_hash,
+            "uploaded_at": datetime.utcnow(),
+            "search_vector": file_search_vector(file.filename),
+        }
+        for file, result in zip(files, stored)
+        if result.error is None
     ]
+    audio_ids = []
+    if rows:
+        result = await session.execute(insert(AudioFile).values(rows).returning(AudioFile.id))
+        audio_ids = list(result.scalars())
+        await enqueue_transcriptions(session, audio_ids)
+        await add_usage(
+            session, user.id, files=len(rows), size=sum(r["file_size"] for r in rows), enforce=True
+        )
+    await session.commit()
 
-    total_pages = (total_items + limit - 1) // limit
+    for audio_id in audio_ids:
+        metadata_pipeline.enqueue(audio_id)
+
+    rows = iter(rows)
+    results = []
+    for file, result in zip(files, stored):
+        if result.error is not None:
+            detail = getattr(result.error, "detail", None) or "Could not store file"
+            results.append({"fileName": file.filename, "status": "error", "detail": detail})
+            continue
+        row = next(rows)
+        results.append({
+            "fileName": file.filename,
+            "status": "uploaded",
+            "fileKey": row["file_key"],
+            "fileSize": result.size,
+            "checksum": result.blob_hash,
+        })
 
     return {
-        "items": items,
-        "pagination": {
+        "uploaded": len(audio_ids),
+        "failed": len(files) - len(audio_ids),
+        "results": results,
+    }
+
+
+@router.get("/files")
+async def get_audio_files(
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    includeTotal: bool = Query(False),
+    user: Principal = Depends(current_user),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """List the user's files, newest first.
+
+    Passing cursor (empty for the first page) switches to keyset pagination:
+    every page costs the same however deep it is, and the total is only
+    counted when includeTotal is set. Without it the old page/limit mode is
+    used and the total is always returned.
+    """
+    keyset = cursor is not None
+
+    query = (
+        select(*_LISTING_COLUMNS)
+        .outerjoin(TranscriptionJob, TranscriptionJob.audio_file_id == AudioFile.id)
+        .outerjoin(TranscriptionResult, TranscriptionResult.audio_file_id == AudioFile.id)
+        .where(AudioFile.user_id == user.id)
+        # id breaks ties between files uploaded in the same microsecond
+        .order_by(AudioFile.uploaded_at.desc(), AudioFile.id)
+    )
+    if keyset:
+        if cursor:
+            uploaded_at, audio_id = decode_cursor(cursor)
+            # the redundant <= lets postgres start the index scan at the cursor
+            query = query.where(
+                AudioFile.uploaded_at <= uploaded_at,
+                or_(
+                    AudioFile.uploaded_at < uploaded_at,
+                    and_(AudioFile.uploaded_at == uploaded_at, AudioFile.id > audio_id),
+                ),
+            )
+        # one extra row tells whether there is a next page
+        query = query.limit(limit + 1)
+    else:
+        query = query.offset((page - 1) * limit).limit(limit)
+
+    result = await session.execute(query)
+    files = result.all()
+
+    has_next = False
+    if keyset and len(files) > limit:
+        files = files[:limit]
+        has_next = True
+
+    total_items = None
+    if includeTotal or not keyset:
+        usage = await get_usage(session, user.id)
+        total_items = usage.file_count if usage else 0
+
+    items = [_audio_file_item(row, user.id) for row in files]
+
+    if keyset:
+        last = files[-1] if files else None
+        pagination = {
+            "limit": limit,
+            "nextCursor": encode_cursor(last.uploaded_at, last.id) if has_next else None,
+            "hasNextPage": has_next,
+            "totalItems": total_items,
+        }
+    else:
+        total_pages = (total_items + limit - 1) // limit
+        pagination = {
             "page": page,
             "limit": limit,
             "totalItems": total_items,
@@ -129,46 +342,336 @@ async def get_audio_files(
             "hasNextPage": page < total_pages,
             "hasPreviousPage": page > 1,
         }
+
+    # serialized straight to bytes, skipping FastAPI's validate-and-encode pass
+    return Response(
+        AUDIO_FILE_LIST.dump_json({"items": items, "pagination": pagination}),
+        media_type="application/json",
+    )
+
+
+@router.get("/search")
+async def search_audio_files(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    user: Principal = Depends(current_user),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Search the user's files by name and transcript, best matches first.
+
+    Every word has to match, as a prefix. Pages are keyset paginated on
+    (rank, id); the name weighs more than the transcript.
+    """
+    tsquery = parse_search(q)
+    rank = func.ts_rank(AudioFile.search_vector, tsquery)
+
+    query = (
+        select(*_LISTING_COLUMNS, rank.label("rank"))
+        .outerjoin(TranscriptionJob, TranscriptionJob.audio_file_id == AudioFile.id)
+        .outerjoin(TranscriptionResult, TranscriptionResult.audio_file_id == AudioFile.id)
+        .where(AudioFile.user_id == user.id, AudioFile.search_vector.op("@@")(tsquery))
+        .order_by(rank.desc(), AudioFile.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        last_rank, audio_id = decode_rank_cursor(cursor)
+        query = query.where(
+            or_(rank < last_rank, and_(rank == last_rank, AudioFile.id < audio_id))
+        )
+
+    result = await session.execute(query)
+    files = result.all()
+
+    has_next = len(files) > limit
+    files = files[:limit]
+    last = files[-1] if files else None
+
+    items = [_audio_file_item(row, user.id) for row in files]
+    pagination = {
+        "limit": limit,
+        "nextCursor": encode_rank_cursor(last.rank, last.id) if has_next else None,
+        "hasNextPage": has_next,
     }
+    return Response(
+        AUDIO_FILE_LIST.dump_json({"items": items, "pagination": pagination}),
+        media_type="application/json",
+    )
 
 
-@router.delete("/files")
-async def delete_audio_file(
-    fileKey:str = Query(...),
-      credentials: HTTPAuthorizationCredentials = Depends(security), 
-      session: AsyncSession = Depends(get_session)
+async def _export_rows(user_id: int, after_id: int, last_id: int):
+    # a short session per batch, an export can stream for a long time
+    while True:
+        async with async_read_session() as session:
+            result = await session.execute(
+                select(*_LISTING_COLUMNS, AudioFile.blob_hash)
+                .outerjoin(TranscriptionJob, TranscriptionJob.audio_file_id == AudioFile.id)
+                .outerjoin(TranscriptionResult, TranscriptionResult.audio_file_id == AudioFile.id)
+                .where(
+                    AudioFile.user_id == user_id,
+                    AudioFile.id > after_id,
+                    AudioFile.id <= last_id,
+                )
+                .order_by(AudioFile.id)
+                .limit(EXPORT_BATCH_SIZE)
+            )
+            rows = result.all()
+        if not rows:
+            return
+        for row in rows:
+            yield row
+        after_id = rows[-1].id
+
+
+async def _export_archive(user_id: int, since: int, last_id: int, next_cursor: Optional[int]):
+    storage = get_storage()
+    archive = ZipStream()
+    paths: Dict[int, str] = {}
+
+    async for row in _export_rows(user_id, since, last_id):
+        chunks = storage.open_stream(audio_file_key(row))
+        try:
+            # before the entry is started, a missing object must not leave half of one
+            chunk = await anext(chunks, None)
+        except FileNotFoundError:
+            logger.warning("Export of user %s: no stored bytes for %s", user_id, row.file_key)
+            continue
+        name = archive.unique_name(archive_name(row.file_name, row.file_key))
+        try:
+            with archive.open(name, row.uploaded_at, row.file_size) as entry:
+                while chunk is not None:
+                    entry.write(chunk)
+                    yield archive.drain()
+                    chunk = await anext(chunks, None)
+        finally:
+            await chunks.aclose()
+        paths[row.id] = name
+
+    # second pass for the manifest, so transcripts are never all in memory
+    with archive.open("manifest.json", datetime.utcnow()) as manifest:
+        manifest.write(f'{{"since": {since}, "nextCursor": {json.dumps(next_cursor)}, "files": ['.encode())
+        separator = b""
+        async for row in _export_rows(user_id, since, last_id):
+            item = {**_audio_file_item(row, user_id), "path": paths.get(row.id)}
+            manifest.write(separator + EXPORTED_FILE.dump_json(item))
+            separator = b","
+            yield archive.drain()
+        manifest.write(b"]}")
+    yield archive.close()
+
+
+@router.get("/export")
+async def export_audio_files(
+    since: int = Query(0, ge=0),
+    user: Principal = Depends(current_user),
+    # only sizes the part; the archive reads its rows in sessions of its own
+    session: AsyncSession = Depends(get_read_session, scope="function"),
 ):
-    user = await get_current_user(credentials.credentials, session)
+    """Download the user's files as a ZIP with a manifest.json, oldest first.
+
+    The archive is built while it is sent, with entries stored as they are
+    since audio doesn't compress. One archive holds at most EXPORT_MAX_FILES
+    files and about EXPORT_MAX_BYTES; when more remain, X-Export-Next-Cursor
+    (nextCursor in the manifest) is the since for the next part.
+    """
+    running_size = func.sum(func.coalesce(AudioFile.file_size, 0)).over(order_by=AudioFile.id)
+    result = await session.execute(
+        select(AudioFile.id, running_size.label("running_size"))
+        .where(AudioFile.user_id == user.id, AudioFile.id > since)
+        .order_by(AudioFile.id)
+        .limit(EXPORT_MAX_FILES + 1)
+    )
+    rows = result.all()
+    # at least one file per part, however large it is
+    part = [
+        row for i, row in enumerate(rows[:EXPORT_MAX_FILES])
+        if i == 0 or row.running_size <= EXPORT_MAX_BYTES
+    ]
+    last_id = part[-1].id if part else since
+    next_cursor = last_id if len(rows) > len(part) else None
 
-    if not user:
-        raise HTTPException(
-            status_code = 401,
-            detail = "Invalid token"
+    headers = {
+        "Content-Disposition": f'attachment; filename="vocali-export-{since}.zip"',
+        "Cache-Control": "no-store",
+    }
+    if next_cursor is not None:
+        headers["X-Export-Next-Cursor"] = str(next_cursor)
+    return StreamingResponse(
+        _export_archive(user.id, since, last_id, next_cursor),
+        media_type="application/zip",
+        headers=headers,
+    )
+
+
+@router.get("/usage")
+async def get_audio_usage(
+    user: Principal = Depends(current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    usage = await get_usage(session, user.id)
+    return {
+        "fileCount": usage.file_count if usage else 0,
+        "totalBytes": usage.total_bytes if usage else 0,
+        "totalDuration": usage.total_duration if usage else 0,
+        "quota": {
+            "files": USER_QUOTA_FILES or None,
+            "bytes": USER_QUOTA_BYTES or None,
+            "duration": USER_QUOTA_DURATION or None,
+        },
+    }
+
+
+@router.api_route("/files/{fileKey}/content", methods=["GET", "HEAD"])
+async def get_audio_content(
+    fileKey: str,
+    request: Request,
+    variant: Optional[str] = Query(None, pattern="^(original|compact)$"),
+    user: Principal = Depends(current_user),
+    # closed when this returns, not after a download that can take minutes
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    """Serve a file's audio.
+
+    The compact playback rendition is sent when there is one and Accept
+    allows its type. variant=original always sends the uploaded bytes,
+    variant=compact the rendition whatever Accept says, falling back to
+    the original until the rendition exists.
+    """
+    result = await session.execute(
+        select(AudioFile, AudioRendition)
+        .outerjoin(
+            AudioRendition,
+            and_(
+                AudioRendition.blob_hash == AudioFile.blob_hash,
+                AudioRendition.variant == RENDITION_VARIANT,
+                AudioRendition.status == RENDITION_READY,
+            ),
         )
-    
+        .where(
+            AudioFile.file_key == fileKey,
+            AudioFile.user_id == user.id
+        )
+    )
+    row = result.first()
+    if not row:
+        raise HTTPException(status_code=404, detail="File not found")
+    audio, rendition = row
+    if rendition is not None and (
+        variant == "original" or (variant is None and not accepts(request, rendition.mime_type))
+    ):
+        rendition = None
+
+    headers = content_headers(audio, rendition)
+    if is_not_modified(request, content_etag(audio, rendition), content_last_modified(audio)):
+        return Response(status_code=304, headers=headers)
+
+    storage = get_storage()
+    if rendition is not None:
+        key, media_type = rendition.storage_key, rendition.mime_type
+    else:
+        key, media_type = audio_file_key(audio), content_media_type(audio)
+
+    # FileResponse handles Range/If-Range itself and uses the server's
+    # pathsend extension for whole-file responses where it is available
+    local_path = storage.local_path(key)
+    if local_path:
+        return FileResponse(local_path, media_type=media_type, headers=headers)
+
+    # remote storage serves the bytes (and ranges) itself
+    url = storage.download_url(key, content_filename(audio, rendition))
+    return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
+
+
+@router.get("/files/{fileKey}/peaks")
+async def get_audio_peaks(
+    fileKey: str,
+    request: Request,
+    level: int = Query(0, ge=0),
+    user: Principal = Depends(current_user),
+    session: AsyncSession = Depends(get_session),
+):
     result = await session.execute(
         select(AudioFile).where(
             AudioFile.file_key == fileKey,
             AudioFile.user_id == user.id
         )
     )
-
     audio = result.scalar_one_or_none()
-
     if not audio:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # peaks never change for a file, so clients can keep them forever
+    headers = {
+        "ETag": f'"{audio.blob_hash or audio.file_key}-peaks-{level}"',
+        "Cache-Control": CONTENT_CACHE_CONTROL,
+    }
+    if is_not_modified(request, headers["ETag"], content_last_modified(audio)):
+        return Response(status_code=304, headers=headers)
+
+    storage = get_storage()
+    key = audio_peaks_key(audio)
+    try:
+        header = b"".join([c async for c in storage.open_stream(key, 0, MAX_HEADER_SIZE - 1)])
+        sample_rate, bits, samples_per_peak, offset, length = read_level(header, level)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Peaks not ready")
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Unknown peaks level")
+
+    data = b""
+    if length:
+        data = b"".join([c async for c in storage.open_stream(key, offset, offset + length - 1)])
+
+    headers.update({
+        "X-Peaks-Sample-Rate": str(sample_rate),
+        "X-Peaks-Samples-Per-Peak": str(samples_per_peak),
+        "X-Peaks-Bits": str(bits),
+    })
+    return Response(content=data, media_type="application/octet-stream", headers=headers)
+
+
+@router.delete("/files")
+async def delete_audio_file(
+    fileKey:str = Query(...),
+      user: Principal = Depends(current_user),
+      session: AsyncSession = Depends(get_session)
+):
+    
+    status = (await delete_files_by_key(session, user.id, [fileKey]))[fileKey]
+
+    if status == NOT_FOUND:
         raise HTTPException(
             status_code = 404,
             detail = "File not found"
         )
-    
-    file_path = f"uploads/{audio.file_key}_{audio.file_name}"
+    if status != DELETED:
+        raise HTTPException(
+            status_code = 500,
+            detail = "Could not delete file"
+        )
 
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    return {"message": "File deleted successfully"}
 
-    await session.delete(audio)
-    await session.commit()
 
-    return {"message": "File deleted successfully"}
+@router.post("/files/delete")
+async def delete_audio_files(
+    data: BatchDeleteRequest,
+    user: Principal = Depends(current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """Delete many files at once, by key or by upload date.
 
+    Files are removed in batches that commit on their own, so the response
+    may mix deleted and failed keys.
+    """
+    complete = True
+    if data.fileKeys is not None:
+        statuses = await delete_files_by_key(session, user.id, data.fileKeys)
+    else:
+        statuses, complete = await delete_files_older_than(session, user.id, data.olderThan)
 
+    return {
+        "results": [{"fileKey": key, "status": status} for key, status in statuses.items()],
+        "deleted": sum(1 for s in statuses.values() if s == DELETED),
+        "complete": complete and all(s != FAILED for s in statuses.values()),
+    }
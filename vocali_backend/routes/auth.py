@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from vocali_backend.services.email_service import send_reset_password_email
+from vocali_backend.services.email_service import queue_reset_password_email
 from ..database import get_session
 from ..models import User
 from ..schemas import *
@@ -9,57 +9,78 @@ from ..auth_utils import *
 from datetime import datetime, timedelta
 from ..security import security
 from fastapi.security import  HTTPAuthorizationCredentials
-from ..services.email_service import send_confirmation_email
-from fastapi import BackgroundTasks
+from ..services.email_service import queue_confirmation_email
+from ..services.password_hasher import password_hasher
+from ..services.rate_limit import auth_route_limiter, email_limiter, ip_limiter
+from ..services.token_service import (
+    issue_refresh_token,
+    revoke_access_token,
+    revoke_all_tokens,
+    revoke_refresh_token,
+    rotate_refresh_token,
+)
 
 router = APIRouter()
 
+# routes that run bcrypt: rate limited per client, then admitted a few at
+# a time so a flood can't take the CPU from everything else
+signup_limiter = auth_route_limiter("signup")
+signin_limiter = auth_route_limiter("signin")
+reset_limiter = auth_route_limiter("confirm-forgot-password")
+
+
+
+@router.post("/signup", dependencies=[Depends(ip_limiter.by_client_ip)])
+async def signup(user_data: UserCreate, session: AsyncSession = Depends(get_session)):
+    async with signup_limiter:
+        existing = await session.execute(select(User).where(User.email == user_data.email))
+        if existing.scalar_one_or_none():
+            raise HTTPException(status_code=400, detail="Email already registered")
+        hashed_pwd = await password_hasher.hash(user_data.password)
+        code = generate_code()
+        expires = datetime.utcnow() + timedelta(minutes=10)
+
+        user = User(
+            email=user_data.email,
+            first_name=user_data.firstName,
+            last_name=user_data.lastName,
+            hashed_password=hashed_pwd,
+            confirmation_code=code,
+            confirmation_code_expires=expires
+        )
 
+        session.add(user)
+        # the email is only queued if the user is actually created
+        queue_confirmation_email(session, user_data.email, code)
+        await session.commit()
+        await session.refresh(user)
 
-@router.post("/signup")
-async def signup(user_data: UserCreate, background_tasks: BackgroundTasks, session: AsyncSession = Depends(get_session)):
-    existing = await session.execute(select(User).where(User.email == user_data.email))
-    if existing.scalar_one_or_none():
-        raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_pwd = get_password_hash(user_data.password)
-    code = generate_code()
-    expires = datetime.utcnow() + timedelta(minutes=10)
-
-    user = User(
-        email=user_data.email,
-        first_name=user_data.firstName,
-        last_name=user_data.lastName,
-        hashed_password=hashed_pwd,
-        confirmation_code=code,
-        confirmation_code_expires=expires
-    )
-
-    session.add(user)
-    await session.commit()
-    await session.refresh(user)
-
-    background_tasks.add_task(
-        send_confirmation_email,
-        user_data.email,
-        code
-    )
-    return {"message": "User created, check email for confirmation code"}
+        return {"message": "User created, check email for confirmation code"}
 
 
-@router.post("/signin")
+@router.post("/signin", dependencies=[Depends(ip_limiter.by_client_ip)])
 async def signin(credentials: Login, session: AsyncSession = Depends(get_session)):
-    user = await session.execute(select(User).where(User.email == credentials.email))
-    user = user.scalar_one_or_none()
-    if not user or not verify_password(credentials.password, user.hashed_password):
-        raise HTTPException(status_code=401, detail="Invalid credentials")
-    if not user.is_verified:
-        raise HTTPException(status_code=403, detail="Email not verified")
-
-    access_token = create_access_token(user.email)[0]
-    refresh_token = create_refresh_token(user.email)
-    auth_time = int(datetime.utcnow().timestamp())
-
-    return {"accessToken": access_token, "refreshToken": refresh_token}
+    email_limiter.check(credentials.email.lower())
+    async with signin_limiter:
+        user = await session.execute(select(User).where(User.email == credentials.email))
+        user = user.scalar_one_or_none()
+        if not user:
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+        valid, new_hash = await password_hasher.verify_and_update(credentials.password, user.hashed_password)
+        if not valid:
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+        if not user.is_verified:
+            raise HTTPException(status_code=403, detail="Email not verified")
+        if new_hash:
+            # the hashing policy changed since this password was set
+            user.hashed_password = new_hash
+
+        access_token = create_access_token(user.email)[0]
+        refresh_token = issue_refresh_token(session, user)
+        await session.commit()
+        auth_time = int(datetime.utcnow().timestamp())
+
+        return {"accessToken": access_token, "refreshToken": refresh_token}
 
 @router.post("/confirm-signup")
 async def confirm_signup(data:ConfirmSignup, session: AsyncSession = Depends(get_session)):
@@ -78,10 +99,11 @@ async def confirm_signup(data:ConfirmSignup, session: AsyncSession = Depends(get
     user.confirmation_code = None
     user.confirmation_code_expires = None
     
+    refresh_token = issue_refresh_token(session, user)
     await session.commit()
+    invalidate_principal(user.email)
 
     access_token = create_access_token(user.email)[0]
-    refresh_token = create_refresh_token(user.email)
 
     return {
         "accessToken": access_token,
@@ -89,7 +111,7 @@ async def confirm_signup(data:ConfirmSignup, session: AsyncSession = Depends(get
     }
 
 @router.post("/resend-confirmation-code")
-async def resend_confirmation(email_data: dict, background_tasks: BackgroundTasks, session: AsyncSession = Depends(get_session)):
+async def resend_confirmation(email_data: dict, session: AsyncSession = Depends(get_session)):
     user = await session.execute(
         select(User).where(
             User.email == email_data["email"],
@@ -107,21 +129,16 @@ async def resend_confirmation(email_data: dict, background_tasks: BackgroundTask
 
     user.confirmation_code = code
     user.confirmation_code_expires = expires
+    queue_confirmation_email(session, email_data["email"], code)
 
     await session.commit()
 
-    background_tasks.add_task(
-        send_confirmation_email,
-        email_data["email"],
-        code
-)
-
     return {"message": "Code resent"}
 
 
 @router.post("/forgot-password")
 async def forgot_password(
-    email_data: ForgotPassword, background_tasks: BackgroundTasks, session: AsyncSession = Depends(get_session)
+    email_data: ForgotPassword, session: AsyncSession = Depends(get_session)
 ):
 
     user = await session.execute(select(User).where(User.email == email_data.email))
@@ -136,46 +153,60 @@ async def forgot_password(
 
     user.reset_code = code
     user.reset_code_expires = expires
+    queue_reset_password_email(session, user.email, code)
 
     await session.commit()
 
-    background_tasks.add_task(
-        send_reset_password_email,
-        user.email,
-        code
-)
-
     return {"message": "Reset code sent to email"}
 
 
-@router.post("/confirm-forgot-password")
+@router.post("/confirm-forgot-password", dependencies=[Depends(ip_limiter.by_client_ip)])
 async def confirm_forgot_password(
     data: ConfirmForgotPassword, session: AsyncSession = Depends(get_session)
 ):
+    # also caps guessing at the six hex digit reset code
+    email_limiter.check(data.email.lower())
+    async with reset_limiter:
+        user = await session.execute(select(User).where(User.email == data.email))
 
-    user = await session.execute(select(User).where(User.email == data.email))
+        user = user.scalar_one_or_none()
+        if not user or \
+           user.reset_code != data.confirmationCode or \
+           datetime.utcnow() > user.reset_code_expires:
+            raise HTTPException(status_code=400, detail="Invalid or expired code")
 
-    user = user.scalar_one_or_none()
-    if not user or \
-       user.reset_code != data.confirmationCode or \
-       datetime.utcnow() > user.reset_code_expires:
-        raise HTTPException(status_code=400, detail="Invalid or expired code")
+        user.hashed_password = await password_hasher.hash(data.newPassword)
 
-    user.hashed_password = get_password_hash(data.newPassword)
+        user.reset_code = None
+        user.reset_code_expires = None
+        # whoever knew the old password may hold tokens, end every session
+        await revoke_all_tokens(session, user)
 
-    user.reset_code = None
-    user.reset_code_expires = None
+        await session.commit()
+        invalidate_principal(user.email)
 
-    await session.commit()
+        return {"message": "Password reset successful"}
 
-    return {"message": "Password reset successful"}
+
+@router.post("/refresh")
+async def refresh(data: RefreshRequest, session: AsyncSession = Depends(get_session)):
+    """Trade a refresh token for a new access token and a new refresh token."""
+    user, refresh_token = await rotate_refresh_token(session, data.refreshToken)
+    access_token = create_access_token(user.email)[0]
+    return {"accessToken": access_token, "refreshToken": refresh_token}
 
 
 @router.post("/logout")
 async def logout(
+    data: Optional[LogoutRequest] = None,
     credentials: HTTPAuthorizationCredentials = Depends(security),
+    user: Principal = Depends(current_user),
     session: AsyncSession = Depends(get_session),
 ):
+    await revoke_access_token(session, credentials.credentials)
+    if data and data.refreshToken:
+        await revoke_refresh_token(session, data.refreshToken, user.id)
+    await session.commit()
 
     return {"message": "Logged out"}
 
@@ -183,12 +214,8 @@ async def logout(
 @router.get("/me")
 async def get_profile(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    session: AsyncSession = Depends(get_session),
+    user: Principal = Depends(current_user),
 ):
-    user = await get_current_user(credentials.credentials, session)
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
     auth_time = int(datetime.utcnow().timestamp())
     access_token = credentials.credentials  
     user_out = user_to_out(user, access_token, auth_time)
@@ -0,0 +1,240 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..auth_utils import Principal, current_user
+from ..database import get_session
+from ..models import AudioFile, UploadSession
+from ..schemas import UploadSessionCreate, UploadSessionOut
+from ..services.blob_service import store_staged_file
+from ..services.metadata_service import metadata_pipeline
+from ..services.search_service import file_search_vector
+from ..services.transcription_service import enqueue_transcription
+from ..services.usage_service import add_usage, check_quota
+from ..services.upload_service import (
+    MAX_UPLOAD_SIZE,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_LEASE_TIMEOUT,
+    UPLOAD_STAGING_DIR,
+    append_stream,
+    partial_size,
+    partial_upload_path,
+    remove_file,
+)
+
+router = APIRouter()
+
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def _session_out(upload: UploadSession) -> UploadSessionOut:
+    return UploadSessionOut(
+        uploadId=upload.id,
+        fileName=upload.file_name,
+        offset=upload.received_bytes,
+        totalSize=upload.total_size,
+        chunkSize=UPLOAD_CHUNK_SIZE,
+    )
+
+
+async def _get_upload(
+    upload_id: str, user_id: int, session: AsyncSession, lock: bool = False
+) -> UploadSession:
+    query = select(UploadSession).where(
+        UploadSession.id == upload_id,
+        UploadSession.user_id == user_id,
+    )
+    if lock:
+        query = query.with_for_update(nowait=True)
+    try:
+        result = await session.execute(query)
+    except DBAPIError as e:
+        if getattr(e.orig, "sqlstate", None) == LOCK_NOT_AVAILABLE:
+            raise HTTPException(status_code=409, detail="Upload is busy")
+        raise
+    upload = result.scalar_one_or_none()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if lock and _leased(upload):
+        raise HTTPException(status_code=409, detail="Upload is busy")
+    return upload
+
+
+def _leased(upload: UploadSession) -> bool:
+    # a lease outlives its request only if that request died mid-chunk
+    cutoff = datetime.utcnow() - timedelta(seconds=UPLOAD_LEASE_TIMEOUT)
+    return upload.locked_by is not None and upload.locked_at >= cutoff
+
+
+async def _release_lease(session: AsyncSession, upload_id: str, lease: str):
+    await session.execute(
+        update(UploadSession)
+        .where(UploadSession.id == upload_id, UploadSession.locked_by == lease)
+        .values(locked_by=None, locked_at=None)
+    )
+    await session.commit()
+
+
+@router.post("", response_model=UploadSessionOut)
+async def create_upload(
+    data: UploadSessionCreate,
+    user: Principal = Depends(current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    if data.totalSize and data.totalSize > MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File exceeds maximum upload size of {MAX_UPLOAD_SIZE} bytes",
+        )
+
+    await check_quota(session, user.id, data.totalSize or 0)
+
+    upload = UploadSession(
+        id=str(uuid.uuid4()),
+        user_id=user.id,
+        file_name=os.path.basename(data.fileName),
+        total_size=data.totalSize,
+        received_bytes=0,
+    )
+    session.add(upload)
+    await session.commit()
+
+    return _session_out(upload)
+
+
+@router.get("/{upload_id}", response_model=UploadSessionOut)
+async def get_upload(
+    upload_id: str,
+    user: Principal = Depends(current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    upload = await _get_upload(upload_id, user.id, session)
+    return _session_out(upload)
+
+
+@router.put("/{upload_id}", response_model=UploadSessionOut)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    user: Principal = Depends(current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    # only one request may append to a session at a time. The lease is
+    # taken and released in short transactions; while the chunk streams in
+    # no row lock is held and no connection is checked out.
+    upload = await _get_upload(upload_id, user.id, session, lock=True)
+    path = partial_upload_path(upload.id)
+
+    # the partial file is the source of truth if it was lost or cut short
+    actual_size = await partial_size(path)
+    if actual_size < upload.received_bytes:
+        upload.received_bytes = actual_size
+
+    lease = uuid.uuid4().hex
+    upload.locked_by = lease
+    upload.locked_at = upload.updated_at = datetime.utcnow()
+    await session.commit()
+
+    try:
+        if offset != upload.received_bytes:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Offset mismatch", "offset": upload.received_bytes},
+            )
+
+        max_size = min(upload.total_size or MAX_UPLOAD_SIZE, MAX_UPLOAD_SIZE)
+        os.makedirs(UPLOAD_STAGING_DIR, exist_ok=True)
+        written = await append_stream(request.stream(), path, offset, max_size=max_size)
+    except BaseException:
+        await _release_lease(session, upload.id, lease)
+        raise
+
+    # only counts if the lease wasn't taken over as stale in the meantime
+    result = await session.execute(
+        update(UploadSession)
+        .where(UploadSession.id == upload.id, UploadSession.locked_by == lease)
+        .values(
+            received_bytes=offset + written,
+            updated_at=datetime.utcnow(),
+            locked_by=None,
+            locked_at=None,
+        )
+        .returning(UploadSession)
+        .execution_options(populate_existing=True)
+    )
+    upload = result.scalar_one_or_none()
+    await session.commit()
+    if upload is None:
+        raise HTTPException(status_code=409, detail="Upload is busy")
+
+    return _session_out(upload)
+
+
+@router.post("/{upload_id}/complete")
+async def complete_upload(
+    upload_id: str,
+    user: Principal = Depends(current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    upload = await _get_upload(upload_id, user.id, session, lock=True)
+
+    if upload.received_bytes == 0 or (
+        upload.total_size is not None and upload.received_bytes != upload.total_size
+    ):
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Upload is incomplete", "offset": upload.received_bytes},
+        )
+
+    await check_quota(session, user.id, upload.received_bytes)
+
+    checksum = await store_staged_file(
+        session, partial_upload_path(upload.id), upload.received_bytes
+    )
+
+    file_key = upload.id
+    audio = AudioFile(
+        user_id=user.id,
+        file_key=file_key,
+        file_name=upload.file_name,
+        file_size=upload.received_bytes,
+        format=upload.file_name.split(".")[-1],
+        duration=0,
+        blob_hash=checksum,
+        search_vector=file_search_vector(upload.file_name),
+    )
+    session.add(audio)
+    await session.delete(upload)
+    await session.flush()
+    enqueue_transcription(session, audio)
+    await add_usage(session, user.id, files=1, size=audio.file_size, enforce=True)
+    await session.commit()
+
+    metadata_pipeline.enqueue(audio.id)
+
+    return {
+        "message": "File uploaded",
+        "fileKey": file_key,
+        "fileSize": audio.file_size,
+        "checksum": checksum,
+    }
+
+
+@router.delete("/{upload_id}")
+async def abort_upload(
+    upload_id: str,
+    user: Principal = Depends(current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    upload = await _get_upload(upload_id, user.id, session, lock=True)
+    await session.delete(upload)
+    await session.commit()
+    await remove_file(partial_upload_path(upload_id))
+
+    return {"message": "Upload aborted"}
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field, TypeAdapter, model_validator
+from typing import Any, Dict, List, Optional
+from typing_extensions import TypedDict
 from datetime import datetime
 
 
@@ -52,6 +53,14 @@ class Login(BaseModel):
     password: str
 
 
+class RefreshRequest(BaseModel):
+    refreshToken: str
+
+
+class LogoutRequest(BaseModel):
+    refreshToken: Optional[str] = None
+
+
 class Transcription(BaseModel):
     language: str
     text: str
@@ -88,4 +97,82 @@ class AudioFileOut(BaseModel):
     downloadUrl: str
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# the listing builds plain dicts and serializes them in one go through
+# AUDIO_FILE_LIST, the shapes match the models above
+
+class TranscriptionItem(TypedDict):
+    language: str
+    text: str
+    status: str
+    completedAt: Optional[datetime]
+    wordCount: Optional[int]
+    method: Optional[str]
+    confidence: Optional[float]
+    characterCount: Optional[int]
+
+
+class AudioMetadataItem(TypedDict):
+    originalName: Optional[str]
+    duration: int
+    extension: Optional[str]
+    transcription: TranscriptionItem
+    fileSize: Optional[int]
+    format: Optional[str]
+    uploadedAt: datetime
+    mimeType: str
+
+
+class AudioFileItem(TypedDict):
+    userId: int
+    fileKey: str
+    fileName: Optional[str]
+    fileSize: Optional[int]
+    duration: int
+    format: Optional[str]
+    uploadedAt: datetime
+    lastModified: datetime
+    status: str
+    metadata: AudioMetadataItem
+    downloadUrl: str
+
+
+class AudioFileList(TypedDict):
+    items: List[AudioFileItem]
+    pagination: Dict[str, Any]
+
+
+AUDIO_FILE_LIST = TypeAdapter(AudioFileList)
+
+
+class ExportedFileItem(AudioFileItem):
+    # where the bytes are in the archive, None if they couldn't be read
+    path: Optional[str]
+
+
+EXPORTED_FILE = TypeAdapter(ExportedFileItem)
+
+
+class UploadSessionCreate(BaseModel):
+    fileName: str = Field(min_length=1)
+    totalSize: Optional[int] = Field(None, ge=1)
+
+
+class UploadSessionOut(BaseModel):
+    uploadId: str
+    fileName: str
+    offset: int
+    totalSize: Optional[int] = None
+    chunkSize: int
+
+
+class BatchDeleteRequest(BaseModel):
+    fileKeys: Optional[List[str]] = Field(None, min_length=1, max_length=1000)
+    olderThan: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def one_filter(self):
+        if (self.fileKeys is None) == (self.olderThan is None):
+            raise ValueError("Pass either fileKeys or olderThan")
+        return self
@@ -0,0 +1,75 @@
+"""Container header parsing for uploaded audio.
+
+Kept free of app imports so it can run inside worker processes without
+pulling in the database or web stack.
+"""
+from typing import Optional
+
+import mutagen
+
+# magic bytes -> MIME type, checked in order
+_SIGNATURES = (
+    (0, b"RIFF", 8, b"WAVE", "audio/wav"),
+    (0, b"fLaC", None, None, "audio/flac"),
+    (0, b"OggS", None, None, "audio/ogg"),
+    (0, b"ID3", None, None, "audio/mpeg"),
+    (4, b"ftyp", None, None, "audio/mp4"),
+)
+
+_CODECS = {
+    "WAVE": "pcm",
+    "MP3": "mp3",
+    "FLAC": "flac",
+    "OggVorbis": "vorbis",
+    "OggOpus": "opus",
+    "OggFLAC": "flac",
+    "OggSpeex": "speex",
+}
+
+
+def sniff_mime(header: bytes) -> Optional[str]:
+    for offset, magic, offset2, magic2, mime in _SIGNATURES:
+        if header[offset:offset + len(magic)] != magic:
+            continue
+        if magic2 is not None and header[offset2:offset2 + len(magic2)] != magic2:
+            continue
+        return mime
+    # MPEG audio frame sync without an ID3 tag
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0:
+        return "audio/mpeg"
+    return None
+
+
+def probe_file(path: str) -> Optional[dict]:
+    """Read stream info from the container headers, no decoding.
+
+    Returns None when the file is not a recognised audio container.
+    """
+    with open(path, "rb") as f:
+        header = f.read(16)
+
+    try:
+        audio = mutagen.File(path)
+    except mutagen.MutagenError:
+        audio = None
+    if audio is None or audio.info is None:
+        mime = sniff_mime(header)
+        return {"mime_type": mime} if mime else None
+
+    info = audio.info
+    kind = type(audio).__name__
+    # mutagen lists the most specific type first
+    mime = audio.mime[0] if audio.mime else None
+    if kind == "OggOpus":
+        sample_rate = 48000
+    else:
+        sample_rate = getattr(info, "sample_rate", None)
+
+    return {
+        "duration": int(round(info.length or 0)),
+        "sample_rate": sample_rate or None,
+        "channels": getattr(info, "channels", None) or None,
+        "bitrate": getattr(info, "bitrate", None) or None,
+        "codec": getattr(info, "codec", None) or _CODECS.get(kind, kind.lower()),
+        "mime_type": sniff_mime(header) or mime,
+    }
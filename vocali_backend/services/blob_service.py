@@ -0,0 +1,282 @@
+import asyncio
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+from sqlalchemy import BigInteger, Integer, String, column, delete, func, select, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import AudioBlob, AudioFile, AudioRendition
+from .storage import get_storage
+from .upload_service import file_sha256, hash_upload_file, iter_upload_file, remove_file
+
+
+def blob_key(blob_hash: str) -> str:
+    # two levels of fan-out keep directories small with millions of blobs
+    return f"blobs/{blob_hash[:2]}/{blob_hash[2:4]}/{blob_hash}"
+
+
+def audio_file_key(audio: AudioFile) -> str:
+    if audio.blob_hash:
+        return blob_key(audio.blob_hash)
+    # files uploaded before content addressing
+    return f"{audio.file_key}_{audio.file_name}"
+
+
+def blob_peaks_key(blob_hash: str) -> str:
+    return f"peaks/{blob_hash[:2]}/{blob_hash}.peaks"
+
+
+def audio_peaks_key(audio: AudioFile) -> str:
+    if audio.blob_hash:
+        return blob_peaks_key(audio.blob_hash)
+    return f"peaks/legacy/{audio.file_key}.peaks"
+
+
+def blob_lock_id(blob_hash: str) -> int:
+    # 60 bits of the hash, a positive bigint; a collision only costs a wait
+    return int(blob_hash[:15], 16)
+
+
+async def lock_new_blobs(session: AsyncSession, blob_hashes: List[str]):
+    """Hold off the storage GC from these blobs until the transaction ends.
+
+    Taken before looking for a leftover object to reuse: without it the
+    GC could delete that object between the check and the commit of the
+    new row. Shared, so uploads of the same bytes don't wait on each other.
+    """
+    locks = values(column("lock_id", BigInteger), name="locks").data(
+        [(blob_lock_id(h),) for h in blob_hashes]
+    )
+    await session.execute(select(func.pg_advisory_xact_lock_shared(locks.c.lock_id)))
+
+
+async def try_lock_blobs(session: AsyncSession, blob_hashes: List[str]) -> List[str]:
+    """Exclusive locks for the storage GC; returns the hashes it got.
+
+    Never waits, a blob an upload is working on is simply skipped.
+    """
+    locks = values(column("hash", String), column("lock_id", BigInteger), name="locks").data(
+        [(h, blob_lock_id(h)) for h in blob_hashes]
+    )
+    result = await session.execute(
+        select(locks.c.hash).where(func.pg_try_advisory_xact_lock(locks.c.lock_id))
+    )
+    return list(result.scalars())
+
+
+async def acquire_blob(session: AsyncSession, blob_hash: str) -> bool:
+    """Take a reference on an existing blob, False if there is none."""
+    result = await session.execute(
+        update(AudioBlob)
+        .where(AudioBlob.hash == blob_hash)
+        .values(ref_count=AudioBlob.ref_count + 1)
+        .returning(AudioBlob.hash)
+    )
+    return result.scalar_one_or_none() is not None
+
+
+async def register_blob(session: AsyncSession, blob_hash: str, size: int):
+    stmt = insert(AudioBlob).values(
+        hash=blob_hash, size=size, ref_count=1, created_at=datetime.utcnow()
+    )
+    # two users can upload the same new file at the same time
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AudioBlob.hash],
+        set_={"ref_count": AudioBlob.ref_count + 1},
+    )
+    await session.execute(stmt)
+
+
+async def release_blobs(session: AsyncSession, counts: Dict[str, int]) -> Dict[str, List[str]]:
+    """Drop references to many blobs at once and delete the rows of those left unused.
+
+    counts maps a hash to how many references go away. Returns the storage
+    keys of every blob that went away, by hash; nothing is deleted from
+    storage here. Pass them to delete_released once the transaction has
+    committed, so a rollback never leaves rows without their bytes.
+    """
+    if not counts:
+        return {}
+    # a stable lock order keeps two batch deletes from deadlocking
+    await session.execute(
+        select(AudioBlob.hash)
+        .where(AudioBlob.hash.in_(list(counts)))
+        .order_by(AudioBlob.hash)
+        .with_for_update()
+    )
+    deltas = values(
+        column("hash", String), column("released", Integer), name="deltas"
+    ).data(list(counts.items()))
+    await session.execute(
+        update(AudioBlob)
+        .where(AudioBlob.hash == deltas.c.hash)
+        .values(ref_count=AudioBlob.ref_count - deltas.c.released)
+    )
+    unused = AudioBlob.hash.in_(list(counts)) & (AudioBlob.ref_count <= 0)
+    # before the blobs, the cascade would take the rendition keys with it
+    renditions = await session.execute(
+        delete(AudioRendition)
+        .where(AudioRendition.blob_hash.in_(select(AudioBlob.hash).where(unused)))
+        .returning(AudioRendition.blob_hash, AudioRendition.storage_key)
+    )
+    rendition_keys = renditions.all()
+    result = await session.execute(delete(AudioBlob).where(unused).returning(AudioBlob.hash))
+    released = {h: [blob_key(h), blob_peaks_key(h)] for h in result.scalars()}
+    for blob_hash, key in rendition_keys:
+        if key and blob_hash in released:
+            released[blob_hash].append(key)
+    return released
+
+
+async def release_blob(session: AsyncSession, blob_hash: str) -> Dict[str, List[str]]:
+    return await release_blobs(session, {blob_hash: 1})
+
+
+async def delete_released(session: AsyncSession, released: Dict[str, List[str]]) -> List[str]:
+    """Delete the objects of blobs released by a committed transaction.
+
+    Runs in a transaction of its own. An upload of the same bytes may have
+    registered the blob again since, or hold lock_new_blobs while it reuses
+    the object; those blobs are skipped and their objects kept. Returns the
+    keys that could not be deleted, they are left to the storage GC.
+    """
+    if not released:
+        return []
+    locked = await try_lock_blobs(session, list(released))
+    result = await session.execute(select(AudioBlob.hash).where(AudioBlob.hash.in_(locked)))
+    claimed = set(result.scalars())
+    dead = [h for h in locked if h not in claimed]
+    keys = [key for h in dead for key in released[h]]
+    failed = await get_storage().delete_many(keys)
+    await session.commit()
+    return failed
+
+
+async def store_upload(session: AsyncSession, file: UploadFile) -> Tuple[str, int]:
+    """Store an uploaded file as a content-addressed blob.
+
+    The spooled upload is hashed first; when the blob already exists only
+    its reference count changes and nothing is written. Returns the hash
+    and the size. Whether the bytes were already stored is never told to
+    the client, it would reveal what other users uploaded.
+    """
+    size, blob_hash = await hash_upload_file(file)
+    if await acquire_blob(session, blob_hash):
+        return blob_hash, size
+
+    storage = get_storage()
+    key = blob_key(blob_hash)
+    await lock_new_blobs(session, [blob_hash])
+    # left over from an upload whose transaction never committed
+    if not await storage.exists(key):
+        await file.seek(0)
+        await storage.put_stream(key, iter_upload_file(file))
+    await register_blob(session, blob_hash, size)
+    return blob_hash, size
+
+
+async def store_staged_file(session: AsyncSession, path: str, size: int) -> str:
+    blob_hash = await file_sha256(path)
+    if await acquire_blob(session, blob_hash):
+        await remove_file(path)
+        return blob_hash
+
+    storage = get_storage()
+    key = blob_key(blob_hash)
+    await lock_new_blobs(session, [blob_hash])
+    if await storage.exists(key):
+        await remove_file(path)
+    else:
+        await storage.put_file(key, path)
+    await register_blob(session, blob_hash, size)
+    return blob_hash
+
+
+@dataclass
+class StoredUpload:
+    blob_hash: Optional[str] = None
+    size: int = 0
+    error: Optional[Exception] = None
+
+
+async def store_uploads(
+    session: AsyncSession, files: List[UploadFile], concurrency: int
+) -> List[StoredUpload]:
+    """store_upload for many files, with the slow parts run in parallel.
+
+    Hashing and writing to storage run concurrently, at most concurrency at
+    a time. Only the shared blob locks are held while storage is written;
+    afterwards one statement takes references on known blobs and registers
+    new ones, so no row is locked for longer than that. A file that fails
+    is reported in its result and doesn't affect the others.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(coro):
+        async with semaphore:
+            return await coro
+
+    results = [StoredUpload() for _ in files]
+    hashed = await asyncio.gather(
+        *(bounded(hash_upload_file(f)) for f in files), return_exceptions=True
+    )
+    counts: Counter = Counter()
+    first: Dict[str, int] = {}
+    for i, outcome in enumerate(hashed):
+        if isinstance(outcome, Exception):
+            results[i].error = outcome
+            continue
+        results[i].size, results[i].blob_hash = outcome
+        counts[outcome[1]] += 1
+        first.setdefault(outcome[1], i)
+    if not counts:
+        return results
+
+    # taken before the check, so neither a blob seen here nor an object
+    # written below can be deleted by the GC until the commit
+    await lock_new_blobs(session, list(counts))
+    result = await session.execute(select(AudioBlob.hash).where(AudioBlob.hash.in_(list(counts))))
+    existing = set(result.scalars())
+
+    storage = get_storage()
+
+    async def write(blob_hash: str):
+        key = blob_key(blob_hash)
+        # left over from an upload whose transaction never committed
+        if not await storage.exists(key):
+            file = files[first[blob_hash]]
+            await file.seek(0)
+            await storage.put_stream(key, iter_upload_file(file))
+
+    missing = [h for h in counts if h not in existing]
+    written = await asyncio.gather(*(bounded(write(h)) for h in missing), return_exceptions=True)
+    stored = set(counts)
+    for blob_hash, outcome in zip(missing, written):
+        if isinstance(outcome, Exception):
+            stored.discard(blob_hash)
+            for r in results:
+                if r.blob_hash == blob_hash:
+                    r.error = outcome
+
+    # a blob seen above may have been released since, the insert brings it
+    # back; rows are locked in hash order so two batches can't deadlock
+    blobs = [
+        {
+            "hash": blob_hash,
+            "size": results[first[blob_hash]].size,
+            "ref_count": counts[blob_hash],
+            "created_at": datetime.utcnow(),
+        }
+        for blob_hash in sorted(stored)
+    ]
+    if blobs:
+        stmt = insert(AudioBlob).values(blobs)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[AudioBlob.hash],
+            set_={"ref_count": AudioBlob.ref_count + stmt.excluded.ref_count},
+        ))
+    return results
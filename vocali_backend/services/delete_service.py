@@ -0,0 +1,119 @@
+import logging
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import AudioFile
+from .blob_service import audio_file_key, audio_peaks_key, delete_released, release_blobs
+from .storage import get_storage
+from .usage_service import add_usage
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", 100))
+
+DELETED = "deleted"
+NOT_FOUND = "not_found"
+FAILED = "error"
+
+
+async def _delete_batch(session: AsyncSession, user_id: int, condition) -> List[str]:
+    """Delete one batch of the user's files and commit; returns their keys."""
+    result = await session.execute(
+        delete(AudioFile)
+        .where(AudioFile.user_id == user_id, condition)
+        .returning(
+            AudioFile.file_key,
+            AudioFile.file_name,
+            AudioFile.blob_hash,
+            AudioFile.file_size,
+            AudioFile.duration,
+        )
+    )
+    rows = result.all()
+    if not rows:
+        await session.rollback()
+        return []
+
+    await add_usage(
+        session,
+        user_id,
+        files=-len(rows),
+        size=-sum(r.file_size or 0 for r in rows),
+        duration=-sum(r.duration or 0 for r in rows),
+    )
+    released = await release_blobs(session, Counter(r.blob_hash for r in rows if r.blob_hash))
+    await session.commit()
+
+    # objects go only once the rows are gone for good; anything left
+    # behind by a failure or a crash from here on is for the storage GC
+    try:
+        failed = await delete_released(session, released)
+        # files uploaded before content addressing belong to their row alone
+        legacy = [r for r in rows if not r.blob_hash]
+        if legacy:
+            failed += await get_storage().delete_many(
+                [audio_file_key(r) for r in legacy] + [audio_peaks_key(r) for r in legacy]
+            )
+    except Exception:
+        logger.exception("Could not delete the storage objects of user %s's files", user_id)
+        await session.rollback()
+    else:
+        if failed:
+            logger.warning("Could not delete %d storage objects: %s", len(failed), failed[:10])
+    return [r.file_key for r in rows]
+
+
+async def delete_files_by_key(
+    session: AsyncSession, user_id: int, file_keys: List[str]
+) -> Dict[str, str]:
+    """Delete the given files of a user; returns a status per key.
+
+    Every batch commits on its own, so a failure only affects its batch.
+    """
+    statuses: Dict[str, str] = {}
+    keys = list(dict.fromkeys(file_keys))
+    for i in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[i:i + DELETE_BATCH_SIZE]
+        try:
+            deleted = set(await _delete_batch(session, user_id, AudioFile.file_key.in_(batch)))
+        except Exception:
+            logger.exception("Batch delete failed for user %s", user_id)
+            await session.rollback()
+            statuses.update((k, FAILED) for k in batch)
+            continue
+        statuses.update((k, DELETED if k in deleted else NOT_FOUND) for k in batch)
+    return statuses
+
+
+async def delete_files_older_than(
+    session: AsyncSession, user_id: int, older_than: datetime
+) -> Tuple[Dict[str, str], bool]:
+    """Delete every file of a user uploaded before older_than.
+
+    Returns a status per deleted key and whether the run got through
+    everything; it stops at the first failing batch.
+    """
+    statuses: Dict[str, str] = {}
+    while True:
+        candidates = (
+            select(AudioFile.id)
+            .where(AudioFile.user_id == user_id, AudioFile.uploaded_at < older_than)
+            .order_by(AudioFile.id)
+            .limit(DELETE_BATCH_SIZE)
+            # rows another request is deleting right now are left to it
+            .with_for_update(skip_locked=True)
+        )
+        try:
+            deleted = await _delete_batch(session, user_id, AudioFile.id.in_(candidates))
+        except Exception:
+            logger.exception("Batch delete failed for user %s", user_id)
+            await session.rollback()
+            return statuses, False
+        statuses.update((k, DELETED) for k in deleted)
+        if len(deleted) < DELETE_BATCH_SIZE:
+            return statuses, True
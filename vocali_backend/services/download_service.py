@@ -0,0 +1,112 @@
+import mimetypes
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import quote
+
+from starlette.requests import Request
+
+from ..models import AudioFile, AudioRendition
+
+# a fileKey always points at the same bytes, so clients may keep them
+CONTENT_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def content_url(audio: AudioFile) -> str:
+    return f"/audio/files/{audio.file_key}/content"
+
+
+def content_etag(audio: AudioFile, rendition: Optional[AudioRendition] = None) -> str:
+    if rendition is not None:
+        return f'"{rendition.blob_hash}.{rendition.variant}"'
+    # the blob hash is the sha256 of the bytes, which makes it a strong validator
+    return f'"{audio.blob_hash or audio.file_key}"'
+
+
+def content_last_modified(audio: AudioFile) -> datetime:
+    return audio.uploaded_at.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def content_media_type(audio: AudioFile) -> str:
+    # sniffed by the metadata pipeline, the file name is only a fallback
+    if audio.mime_type:
+        return audio.mime_type
+    return mimetypes.guess_type(audio.file_name or "")[0] or "application/octet-stream"
+
+
+def content_filename(audio: AudioFile, rendition: Optional[AudioRendition] = None) -> str:
+    name = audio.file_name or audio.file_key
+    if rendition is not None:
+        # a saved copy should open as what it is, not as the original format
+        name = f"{os.path.splitext(name)[0]}.{rendition.storage_key.rsplit('.', 1)[-1]}"
+    return name
+
+
+def content_headers(audio: AudioFile, rendition: Optional[AudioRendition] = None) -> Dict[str, str]:
+    return {
+        "ETag": content_etag(audio, rendition),
+        "Last-Modified": format_datetime(content_last_modified(audio), usegmt=True),
+        "Cache-Control": CONTENT_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"inline; filename*=UTF-8''{quote(content_filename(audio, rendition))}",
+        # which bytes are sent depends on Accept, caches must key on it
+        "Vary": "Accept",
+    }
+
+
+def accepts(request: Request, media_type: str) -> bool:
+    """Whether the Accept header allows media_type; no header allows anything.
+
+    The most specific matching range decides, so "audio/ogg;q=0, */*"
+    refuses audio/ogg.
+    """
+    header = request.headers.get("accept")
+    if not header:
+        return True
+    wildcard = media_type.split("/")[0] + "/*"
+    best = None
+    for part in header.split(","):
+        media_range, *params = [p.strip() for p in part.split(";")]
+        media_range = media_range.lower()
+        if media_range == media_type:
+            specificity = 2
+        elif media_range == wildcard:
+            specificity = 1
+        elif media_range == "*/*":
+            specificity = 0
+        else:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if best is None or specificity > best[0]:
+            best = (specificity, quality)
+    return best is not None and best[1] > 0
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since as RFC 9110 asks."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # weak comparison is what If-None-Match uses
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified <= since
+    return False
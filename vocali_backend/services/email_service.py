@@ -1,84 +1,200 @@
-from jinja2 import Environment, FileSystemLoader
-from datetime import datetime
+from jinja2 import Environment, FileSystemLoader, Template
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import asyncio
+import logging
 import os
+import random
 import sib_api_v3_sdk
 from sib_api_v3_sdk.rest import ApiException
 from dotenv import load_dotenv
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import EmailOutbox
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# point this at a local fake server to test sending end to end
+BREVO_API_HOST = os.getenv("BREVO_API_HOST")
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 8))
+EMAIL_BACKOFF_BASE = int(os.getenv("EMAIL_BACKOFF_BASE", 15))
+EMAIL_BACKOFF_MAX = int(os.getenv("EMAIL_BACKOFF_MAX", 60 * 60))
+EMAIL_LOCK_TIMEOUT = int(os.getenv("EMAIL_LOCK_TIMEOUT", 5 * 60))
+# sent rows carry one-time codes, don't keep them around
+EMAIL_RETENTION_DAYS = int(os.getenv("EMAIL_RETENTION_DAYS", 7))
+
+EMAIL_PENDING = "pending"
+EMAIL_SENDING = "sending"
+EMAIL_SENT = "sent"
+EMAIL_FAILED = "failed"
+
+# template name -> (file, subject)
+EMAIL_TEMPLATES = {
+    "confirmation": ("confirmation.html", "Email Confirmation"),
+    "reset_password": ("reset_password.html", "Password Reset"),
+}
+
 env = Environment(
     loader=FileSystemLoader(os.path.join(BASE_DIR, "templates"))
 )
 
+_compiled: Dict[str, Template] = {}
 
-def _render_template(template_name: str, **context):
-    template = env.get_template(template_name)
-    return template.render(**context)
 
+def load_templates():
+    """Compile every template up front so sending never touches the disk."""
+    for name, (file_name, _) in EMAIL_TEMPLATES.items():
+        _compiled[name] = env.get_template(file_name)
 
 
+def render_email(template: str, context: dict):
+    if not _compiled:
+        load_templates()
+    _, subject = EMAIL_TEMPLATES[template]
+    return subject, _compiled[template].render(year=datetime.utcnow().year, **context)
 
-def _send_email(to_email: str, subject: str, html_content: str):
 
-    api_key = os.getenv("BREVO_API_KEY")
-    sender_email = os.getenv("BREVO_SENDER_EMAIL")
+def queue_email(session: AsyncSession, to_email: str, template: str, **context):
+    """Add an email to the outbox; it is sent once the caller commits."""
+    if template not in EMAIL_TEMPLATES:
+        raise ValueError(f"Unknown email template: {template}")
+    session.add(EmailOutbox(to_email=to_email, template=template, context=context, status=EMAIL_PENDING))
 
-    if not api_key or not sender_email:
-        raise RuntimeError("BREVO configuration missing in environment variables")
 
-    configuration = sib_api_v3_sdk.Configuration()
-    configuration.api_key['api-key'] = api_key
+def queue_confirmation_email(session: AsyncSession, to_email: str, code: str):
+    queue_email(session, to_email, "confirmation", code=code)
 
-    api_instance = sib_api_v3_sdk.TransactionalEmailsApi(
-        sib_api_v3_sdk.ApiClient(configuration)
-    )
 
-    email = sib_api_v3_sdk.SendSmtpEmail(
-        to=[{"email": to_email}],
-        sender={
-            "name": "Vocali",
-            "email": sender_email
-        },
-        subject=subject,
-        html_content=html_content,
-    )
+def queue_reset_password_email(session: AsyncSession, to_email: str, code: str):
+    queue_email(session, to_email, "reset_password", code=code)
+
+
+class BrevoSender:
+    """One API client, and so one pool of keep-alive connections, for the
+    lifetime of the sender. The SDK is blocking, calls run on a thread pool."""
 
-    try:
-        response = api_instance.send_transac_email(email)
-        print(f"Email sent successfully to {to_email}")
-        return response
+    def __init__(self, concurrency: int):
+        api_key = os.getenv("BREVO_API_KEY")
+        self.sender_email = os.getenv("BREVO_SENDER_EMAIL")
 
-    except ApiException as e:
-        print("Brevo API error:")
-        print(e)
-        raise
+        if not api_key or not self.sender_email:
+            raise RuntimeError("BREVO configuration missing in environment variables")
 
-    except Exception as e:
-        print("Unexpected email error:")
-        print(e)
-        raise
+        configuration = sib_api_v3_sdk.Configuration()
+        configuration.api_key['api-key'] = api_key
+        if BREVO_API_HOST:
+            configuration.host = BREVO_API_HOST
+        configuration.connection_pool_maxsize = concurrency
 
+        self.client = sib_api_v3_sdk.ApiClient(configuration)
+        self.api = sib_api_v3_sdk.TransactionalEmailsApi(self.client)
+        self.executor = ThreadPoolExecutor(concurrency, thread_name_prefix="brevo")
 
+    def _send(self, to_email: str, subject: str, html_content: str):
+        email = sib_api_v3_sdk.SendSmtpEmail(
+            to=[{"email": to_email}],
+            sender={
+                "name": "Vocali",
+                "email": self.sender_email
+            },
+            subject=subject,
+            html_content=html_content,
+        )
+        return self.api.send_transac_email(email)
 
+    async def send(self, message: EmailOutbox):
+        subject, html = render_email(message.template, message.context)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._send, message.to_email, subject, html)
 
-def send_confirmation_email(to_email: str, code: str):
-    html = _render_template(
-        "confirmation.html",
-        code=code,
-        year=datetime.utcnow().year
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.client.rest_client.pool_manager.clear()
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    if isinstance(error, KeyError):
+        # template that no longer exists
+        return True
+    # a rejected address or payload won't get better by retrying, rate
+    # limits and server errors will
+    status = getattr(error, "status", None)
+    return isinstance(error, ApiException) and status is not None and 400 <= status < 500 and status != 429
+
+
+async def claim_emails(session: AsyncSession, worker_id: str, limit: int) -> List[EmailOutbox]:
+    now = datetime.utcnow()
+    candidates = (
+        select(EmailOutbox.id)
+        .where(EmailOutbox.status == EMAIL_PENDING, EmailOutbox.run_after <= now)
+        .order_by(EmailOutbox.run_after)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    result = await session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(candidates))
+        .values(
+            status=EMAIL_SENDING,
+            attempts=EmailOutbox.attempts + 1,
+            locked_by=worker_id,
+            locked_at=now,
+        )
+        .returning(EmailOutbox)
     )
-    _send_email(to_email, "Email Confirmation", html)
+    messages = list(result.scalars())
+    await session.commit()
+    return messages
 
 
+async def requeue_stale_emails(session: AsyncSession) -> int:
+    cutoff = datetime.utcnow() - timedelta(seconds=EMAIL_LOCK_TIMEOUT)
+    result = await session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.status == EMAIL_SENDING, EmailOutbox.locked_at < cutoff)
+        .values(status=EMAIL_PENDING, locked_by=None, locked_at=None)
+    )
+    await session.commit()
+    return result.rowcount
 
 
-def send_reset_password_email(to_email: str, code: str):
-    html = _render_template(
-        "reset_password.html",
-        code=code,
-        year=datetime.utcnow().year
+async def prune_sent_emails(session: AsyncSession) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=EMAIL_RETENTION_DAYS)
+    result = await session.execute(
+        delete(EmailOutbox).where(EmailOutbox.status == EMAIL_SENT, EmailOutbox.sent_at < cutoff)
     )
-    _send_email(to_email, "Password Reset", html)
\ No newline at end of file
+    await session.commit()
+    return result.rowcount
+
+
+async def finish_batch(
+    session: AsyncSession,
+    sent: List[EmailOutbox],
+    failed: List[Tuple[EmailOutbox, Exception]],
+):
+    """Record the outcome of a whole batch in one transaction."""
+    now = datetime.utcnow()
+    if sent:
+        await session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id.in_([m.id for m in sent]))
+            .values(status=EMAIL_SENT, sent_at=now, locked_by=None, locked_at=None, last_error=None)
+        )
+    for message, error in failed:
+        values = {"locked_by": None, "locked_at": None, "last_error": f"{type(error).__name__}: {error}"[:2000]}
+        if is_permanent_failure(error) or message.attempts >= EMAIL_MAX_ATTEMPTS:
+            values["status"] = EMAIL_FAILED
+        else:
+            delay = min(EMAIL_BACKOFF_BASE * 2 ** (message.attempts - 1), EMAIL_BACKOFF_MAX)
+            values["status"] = EMAIL_PENDING
+            values["run_after"] = now + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+        await session.execute(
+            update(EmailOutbox).where(EmailOutbox.id == message.id).values(**values)
+        )
+    await session.commit()
@@ -0,0 +1,77 @@
+import io
+import os
+import zipfile
+from datetime import datetime
+from typing import IO, Optional, Set
+
+EXPORT_MAX_FILES = int(os.getenv("EXPORT_MAX_FILES", 5000))
+# per archive; a larger library is exported in parts chained by a cursor
+EXPORT_MAX_BYTES = int(os.getenv("EXPORT_MAX_BYTES", 4 * 1024 ** 3))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 100))
+
+
+class _Sink(io.RawIOBase):
+    """Where zipfile writes: counts the position, can't seek, is drained."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+
+class ZipStream:
+    """A ZIP archive produced piece by piece, entries stored as they are.
+
+    The output can't seek, so zipfile writes each entry's CRC and sizes in
+    a data descriptor after its bytes rather than patching the header. Only
+    the bytes written since the last drain are held, plus one ZipInfo per
+    entry for the central directory.
+    """
+
+    def __init__(self):
+        self.sink = _Sink()
+        self.zip = zipfile.ZipFile(self.sink, "w", compression=zipfile.ZIP_STORED)
+        self.names: Set[str] = set()
+
+    def open(self, name: str, modified: datetime, size: Optional[int] = None) -> IO[bytes]:
+        info = zipfile.ZipInfo(name, modified.timetuple()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        info.file_size = size or 0
+        # zipfile picks zip64 from the declared size; unknown sizes always get it
+        return self.zip.open(info, "w", force_zip64=size is None)
+
+    def unique_name(self, name: str) -> str:
+        """name, or name with a counter when the archive already has it."""
+        stem, ext = os.path.splitext(name)
+        candidate, n = name, 1
+        while candidate in self.names:
+            n += 1
+            candidate = f"{stem} ({n}){ext}"
+        self.names.add(candidate)
+        return candidate
+
+    def drain(self) -> bytes:
+        data = bytes(self.sink.buffer)
+        self.sink.buffer.clear()
+        return data
+
+    def close(self) -> bytes:
+        """Write the central directory and return the rest of the archive."""
+        self.zip.close()
+        return self.drain()
+
+
+def archive_name(file_name: Optional[str], fallback: str) -> str:
+    # entry names are paths inside the archive, nothing may climb out of audio/
+    name = (file_name or "").replace("\\", "_").replace("/", "_").strip(". ")
+    return f"audio/{name or fallback}"
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update
+
+from ..database import async_session
+from ..models import AudioFile
+from .audio_probe import probe_file
+from .blob_service import audio_file_key, audio_peaks_key
+from .rendition_service import rendition_pipeline
+from .storage import get_storage, local_copy
+from .usage_service import add_usage
+from .waveform import compute_peaks
+
+logger = logging.getLogger(__name__)
+
+METADATA_WORKERS = int(os.getenv("METADATA_WORKERS", 2))
+METADATA_QUEUE_SIZE = int(os.getenv("METADATA_QUEUE_SIZE", 10000))
+METADATA_BACKFILL_LIMIT = int(os.getenv("METADATA_BACKFILL_LIMIT", 5000))
+
+METADATA_COLUMNS = ("duration", "sample_rate", "channels", "bitrate", "codec", "mime_type")
+
+
+class MetadataPipeline:
+    """Fills in stream info and waveform peaks once an upload has returned.
+
+    Header parsing runs in a process pool so a burst of uploads never
+    competes with request handling for the GIL. The queue only holds ids;
+    rows that were never processed are picked up again on startup.
+    """
+
+    def __init__(self, workers: int = METADATA_WORKERS, queue_size: int = METADATA_QUEUE_SIZE):
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.tasks = []
+
+    def enqueue(self, audio_id: int):
+        try:
+            self.queue.put_nowait(audio_id)
+        except asyncio.QueueFull:
+            # processed_at stays NULL, the next backfill catches it
+            logger.warning("Metadata queue full, deferring audio file %s", audio_id)
+
+    async def start(self):
+        # spawn keeps the children free of the parent's event loop and sockets
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        await self.backfill()
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def backfill(self):
+        async with async_session() as session:
+            result = await session.execute(
+                select(AudioFile.id)
+                .where(AudioFile.processed_at.is_(None))
+                .order_by(AudioFile.id)
+                .limit(METADATA_BACKFILL_LIMIT)
+            )
+            for audio_id in result.scalars():
+                self.enqueue(audio_id)
+
+    async def _worker(self):
+        while True:
+            audio_id = await self.queue.get()
+            try:
+                await self.process(audio_id)
+            except Exception:
+                logger.exception("Metadata extraction failed for audio file %s", audio_id)
+            finally:
+                self.queue.task_done()
+
+    async def process(self, audio_id: int):
+        # no connection is held while the file is being probed
+        async with async_session() as session:
+            audio = await session.get(AudioFile, audio_id)
+            if audio is None or audio.processed_at is not None:
+                return
+            values = await _copy_from_sibling(session, audio)
+
+        if values is None:
+            storage = get_storage()
+            loop = asyncio.get_running_loop()
+            async with local_copy(storage, audio_file_key(audio)) as path:
+                values = await loop.run_in_executor(self.executor, probe_file, path) or {}
+                try:
+                    peaks = await loop.run_in_executor(
+                        self.executor, compute_peaks, path, values.get("mime_type")
+                    )
+                except Exception:
+                    # a waveform is nice to have, the stream info still counts
+                    logger.exception("Peaks computation failed for audio file %s", audio_id)
+                    peaks = None
+            if peaks:
+                await storage.put_stream(audio_peaks_key(audio), _single_chunk(peaks))
+
+        values["processed_at"] = datetime.utcnow()
+        async with async_session() as session:
+            # processed_at guards against counting the duration twice
+            result = await session.execute(
+                update(AudioFile)
+                .where(AudioFile.id == audio_id, AudioFile.processed_at.is_(None))
+                .values(**values)
+                .returning(AudioFile.user_id)
+            )
+            user_id = result.scalar_one_or_none()
+            if user_id is not None and values.get("duration"):
+                await add_usage(session, user_id, duration=values["duration"])
+            await session.commit()
+
+        if audio.blob_hash:
+            rendition_pipeline.enqueue(audio.blob_hash)
+
+
+async def _single_chunk(data: bytes):
+    yield data
+
+
+async def _copy_from_sibling(session, audio: AudioFile) -> Optional[dict]:
+    # deduplicated uploads share bytes, so they share stream info too
+    if not audio.blob_hash:
+        return None
+    result = await session.execute(
+        select(*(getattr(AudioFile, c) for c in METADATA_COLUMNS))
+        .where(
+            AudioFile.blob_hash == audio.blob_hash,
+            AudioFile.processed_at.is_not(None),
+        )
+        .limit(1)
+    )
+    row = result.first()
+    return dict(row._mapping) if row else None
+
+
+metadata_pipeline = MetadataPipeline()
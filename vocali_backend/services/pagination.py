@@ -0,0 +1,42 @@
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+from fastapi import HTTPException
+
+
+def _encode(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> list:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    return json.loads(raw)
+
+
+def encode_cursor(uploaded_at: datetime, audio_id: int) -> str:
+    return _encode([uploaded_at.isoformat(), audio_id])
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; a tampered or stale format is a 400."""
+    try:
+        uploaded_at, audio_id = _decode(cursor)
+        return datetime.fromisoformat(uploaded_at), int(audio_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_rank_cursor(rank: float, audio_id: int) -> str:
+    # json writes floats with repr, the rank comes back bit for bit
+    return _encode([rank, audio_id])
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        rank, audio_id = _decode(cursor)
+        return float(rank), int(audio_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
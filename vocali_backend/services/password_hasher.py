@@ -0,0 +1,67 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+# changing the work factor makes existing hashes "need update", they are
+# rewritten on the user's next login
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", 12))
+# bcrypt releases the GIL, so threads run in parallel; 0 hashes inline
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# requests waiting for a worker beyond this get a 503 instead of piling up
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt_sha256"],
+    deprecated="auto",
+    bcrypt_sha256__default_rounds=PASSWORD_BCRYPT_ROUNDS,
+    bcrypt_sha256__min_rounds=PASSWORD_BCRYPT_ROUNDS,
+    bcrypt_sha256__max_rounds=PASSWORD_BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasher:
+    """Runs bcrypt off the event loop with a bounded backlog.
+
+    At most `workers` hashes run at once and at most `max_pending` more
+    wait for a slot; anything beyond that is rejected straight away so a
+    login storm can't build an unbounded queue of slow requests.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="bcrypt") if workers > 0 else None
+        self.in_flight = 0
+
+    async def _run(self, fn, *args):
+        if self.executor is None:
+            return fn(*args)
+        if self.in_flight >= self.workers + self.max_pending:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many authentication requests, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Returns (valid, new hash or None if the stored one is fine)."""
+        return await self._run(pwd_context.verify_and_update, password, hashed)
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher()
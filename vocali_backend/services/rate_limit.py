@@ -0,0 +1,143 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import List
+
+from fastapi import HTTPException, Request
+
+# requests running a CPU-heavy auth route at once, per route and process
+AUTH_CONCURRENCY = int(os.getenv("AUTH_CONCURRENCY", 8))
+# requests allowed to wait for a slot, beyond that they are turned away
+AUTH_QUEUE_SIZE = int(os.getenv("AUTH_QUEUE_SIZE", 32))
+AUTH_QUEUE_TIMEOUT = float(os.getenv("AUTH_QUEUE_TIMEOUT", 5))
+# attempts per minute and burst size, 0 turns the limit off
+AUTH_IP_RATE = float(os.getenv("AUTH_IP_RATE", 30))
+AUTH_IP_BURST = int(os.getenv("AUTH_IP_BURST", 10))
+AUTH_EMAIL_RATE = float(os.getenv("AUTH_EMAIL_RATE", 10))
+AUTH_EMAIL_BURST = int(os.getenv("AUTH_EMAIL_BURST", 5))
+# clients tracked per bucket, the least recently seen are forgotten first
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+
+
+class ConcurrencyLimiter:
+    """At most `limit` requests inside, at most `max_queue` waiting.
+
+    A request that finds the queue full, or waits longer than `timeout`,
+    gets a 503 right away rather than holding a connection while the
+    backlog grows.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def _overloaded(self):
+        self.rejected += 1
+        return HTTPException(
+            status_code=503,
+            detail="Server is busy, try again shortly",
+            headers={"Retry-After": str(max(1, math.ceil(self.timeout)))},
+        )
+
+    async def __aenter__(self):
+        if self.semaphore is None:
+            return
+        if self.semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise self._overloaded()
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                raise self._overloaded()
+            finally:
+                self.waiting -= 1
+        else:
+            await self.semaphore.acquire()
+        self.active += 1
+
+    async def __aexit__(self, *exc):
+        if self.semaphore is None:
+            return
+        self.active -= 1
+        self.semaphore.release()
+
+
+class TokenBucketLimiter:
+    """Token buckets keyed by client, in one LRU-ordered dict.
+
+    Each key costs one [tokens, updated] pair. A bucket that has been
+    idle long enough to refill is equivalent to a missing one, so evicting
+    the least recently seen keys first loses very little.
+    """
+
+    def __init__(self, name: str, per_minute: float, burst: int, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.name = name
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.rejected = 0
+
+    def take(self, key: str) -> float:
+        """Spend a token; returns 0 if there was one, else seconds until there is."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [float(self.burst), now]
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self.buckets.move_to_end(key)
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def check(self, key: str):
+        wait = self.take(key)
+        if wait:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many attempts, try again later",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+    async def by_client_ip(self, request: Request):
+        # behind a proxy run uvicorn with --proxy-headers so this is the client
+        self.check(request.client.host if request.client else "unknown")
+
+
+concurrency_limiters: List[ConcurrencyLimiter] = []
+rate_limiters: List[TokenBucketLimiter] = []
+
+
+def auth_route_limiter(name: str) -> ConcurrencyLimiter:
+    limiter = ConcurrencyLimiter(name, AUTH_CONCURRENCY, AUTH_QUEUE_SIZE, AUTH_QUEUE_TIMEOUT)
+    concurrency_limiters.append(limiter)
+    return limiter
+
+
+def auth_rate_limiter(name: str, per_minute: float, burst: int) -> TokenBucketLimiter:
+    limiter = TokenBucketLimiter(name, per_minute, burst)
+    rate_limiters.append(limiter)
+    return limiter
+
+
+# shared by every route that checks a password, so one client can't
+# multiply its budget by switching endpoints
+ip_limiter = auth_rate_limiter("ip", AUTH_IP_RATE, AUTH_IP_BURST)
+email_limiter = auth_rate_limiter("email", AUTH_EMAIL_RATE, AUTH_EMAIL_BURST)
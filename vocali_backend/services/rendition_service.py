@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import exists, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+
+from ..database import async_session
+from ..models import AudioBlob, AudioRendition
+from .blob_service import blob_key
+from .storage import get_storage, local_copy
+from .transcode import RENDITION_VARIANT, rendition_format, transcode
+from .upload_service import UPLOAD_STAGING_DIR, remove_file
+
+logger = logging.getLogger(__name__)
+
+# 0 turns transcoding off, the originals are served as before
+RENDITION_WORKERS = int(os.getenv("RENDITION_WORKERS", 1))
+RENDITION_QUEUE_SIZE = int(os.getenv("RENDITION_QUEUE_SIZE", 10000))
+RENDITION_BACKFILL_LIMIT = int(os.getenv("RENDITION_BACKFILL_LIMIT", 5000))
+# a rendition has to be this much smaller than the original to be kept
+RENDITION_MIN_SAVING = float(os.getenv("RENDITION_MIN_SAVING", 0.2))
+
+RENDITION_READY = "ready"
+RENDITION_SKIPPED = "skipped"
+RENDITION_FAILED = "failed"
+
+
+def rendition_key(blob_hash: str) -> str:
+    extension = rendition_format().extension
+    return f"renditions/{blob_hash[:2]}/{blob_hash}.{RENDITION_VARIANT}.{extension}"
+
+
+class RenditionPipeline:
+    """Makes the compact playback rendition of every stored blob.
+
+    Renditions belong to the bytes, so deduplicated uploads share one.
+    ffmpeg runs from a process pool sized apart from the metadata one, so
+    a long transcode never holds up stream info for new uploads. The queue
+    holds blob hashes; blobs with no rendition row for the current variant
+    are picked up again on startup.
+    """
+
+    def __init__(self, workers: int = RENDITION_WORKERS, queue_size: int = RENDITION_QUEUE_SIZE):
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.tasks = []
+
+    def enqueue(self, blob_hash: str):
+        if self.executor is None:
+            return
+        try:
+            self.queue.put_nowait(blob_hash)
+        except asyncio.QueueFull:
+            logger.warning("Rendition queue full, deferring blob %s", blob_hash)
+
+    async def start(self):
+        if self.workers <= 0:
+            return
+        # an unknown RENDITION_FORMAT fails startup, not every transcode
+        rendition_format()
+        if shutil.which("ffmpeg") is None:
+            logger.warning("ffmpeg not found, playback renditions are disabled")
+            return
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        await self.backfill()
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def backfill(self):
+        async with async_session() as session:
+            result = await session.execute(
+                select(AudioBlob.hash)
+                .where(
+                    ~exists().where(
+                        AudioRendition.blob_hash == AudioBlob.hash,
+                        AudioRendition.variant == RENDITION_VARIANT,
+                    )
+                )
+                .order_by(AudioBlob.created_at)
+                .limit(RENDITION_BACKFILL_LIMIT)
+            )
+            for blob_hash in result.scalars():
+                self.enqueue(blob_hash)
+
+    async def _worker(self):
+        while True:
+            blob_hash = await self.queue.get()
+            try:
+                await self.process(blob_hash)
+            except Exception:
+                logger.exception("Transcoding failed for blob %s", blob_hash)
+            finally:
+                self.queue.task_done()
+
+    async def process(self, blob_hash: str):
+        async with async_session() as session:
+            done = await session.scalar(
+                select(AudioRendition.id).where(
+                    AudioRendition.blob_hash == blob_hash,
+                    AudioRendition.variant == RENDITION_VARIANT,
+                )
+            )
+        if done is not None:
+            return
+
+        extension = rendition_format().extension
+        storage = get_storage()
+        loop = asyncio.get_running_loop()
+        # next to the uploads, so put_file is a rename on local storage
+        await run_in_threadpool(os.makedirs, UPLOAD_STAGING_DIR, exist_ok=True)
+        fd, dest = await run_in_threadpool(
+            tempfile.mkstemp, prefix="rendition-", suffix=f".{extension}", dir=UPLOAD_STAGING_DIR
+        )
+        os.close(fd)
+        try:
+            async with local_copy(storage, blob_key(blob_hash)) as path:
+                source_size = os.path.getsize(path)
+                try:
+                    size = await loop.run_in_executor(self.executor, transcode, path, dest)
+                except Exception as e:
+                    logger.warning("Could not transcode blob %s: %s", blob_hash, e)
+                    values = {"status": RENDITION_FAILED, "error": str(e)[:2000]}
+                else:
+                    values = await _store(blob_hash, dest, size, source_size)
+        finally:
+            await remove_file(dest)
+
+        if not await _record(blob_hash, values) and values.get("storage_key"):
+            await storage.delete(values["storage_key"])
+
+
+async def _store(blob_hash: str, path: str, size: int, source_size: int) -> dict:
+    if size > source_size * (1 - RENDITION_MIN_SAVING):
+        # already compact, the original is served as it is
+        return {"status": RENDITION_SKIPPED, "size": size}
+    key = rendition_key(blob_hash)
+    await get_storage().put_file(key, path)
+    return {
+        "status": RENDITION_READY,
+        "storage_key": key,
+        "mime_type": rendition_format().mime_type,
+        "size": size,
+    }
+
+
+async def _record(blob_hash: str, values: dict) -> bool:
+    """Insert the rendition row; False if the blob is gone by now."""
+    async with async_session() as session:
+        try:
+            await session.execute(
+                insert(AudioRendition)
+                .values(blob_hash=blob_hash, variant=RENDITION_VARIANT, **values)
+                .on_conflict_do_nothing(index_elements=[AudioRendition.blob_hash, AudioRendition.variant])
+            )
+            await session.commit()
+        except IntegrityError:
+            # the last file using the blob was deleted while it was transcoding
+            return False
+    return True
+
+
+rendition_pipeline = RenditionPipeline()
@@ -0,0 +1,69 @@
+import os
+import re
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, literal_column, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import AudioFile, TranscriptionResult
+
+# 'simple' doesn't stem, so it works the same for every language. Changing
+# it needs the search_vector backfill from the migration run again.
+SEARCH_TEXT_CONFIG = os.getenv("SEARCH_TEXT_CONFIG", "simple")
+SEARCH_MAX_TERMS = int(os.getenv("SEARCH_MAX_TERMS", 8))
+
+_WORD = re.compile(r"\w+")
+
+
+# setweight wants a "char", which a bound varchar parameter won't cast to
+_WEIGHT_NAME = literal_column("'A'")
+_WEIGHT_TRANSCRIPT = literal_column("'B'")
+
+
+def _name_vector(file_name):
+    # "my_call-2024.mp3" should match "call" and "2024", not one long token
+    words = func.regexp_replace(func.coalesce(file_name, ""), "[[:punct:]]+", " ", "g")
+    return func.setweight(func.to_tsvector(SEARCH_TEXT_CONFIG, words), _WEIGHT_NAME)
+
+
+def _transcript_vector(text):
+    return func.setweight(func.to_tsvector(SEARCH_TEXT_CONFIG, func.coalesce(text, "")), _WEIGHT_TRANSCRIPT)
+
+
+def file_search_vector(file_name: str):
+    """search_vector for a new row, before it has a transcript."""
+    return _name_vector(file_name)
+
+
+async def index_transcript(session: AsyncSession, audio_file_id: int):
+    """Fold a file's transcript into its search_vector; the caller commits."""
+    transcript = (
+        select(TranscriptionResult.text)
+        .where(TranscriptionResult.audio_file_id == AudioFile.id)
+        .scalar_subquery()
+    )
+    await session.execute(
+        update(AudioFile)
+        .where(AudioFile.id == audio_file_id)
+        .values(search_vector=_name_vector(AudioFile.file_name).op("||")(_transcript_vector(transcript)))
+    )
+
+
+def search_query(text: str) -> Optional[str]:
+    """A to_tsquery string matching every word of text as a prefix.
+
+    Only \\w+ runs are kept, so nothing in it is tsquery syntax. None when
+    there is nothing to search for.
+    """
+    words = _WORD.findall(text.lower())[:SEARCH_MAX_TERMS]
+    if not words:
+        return None
+    return " & ".join(f"{w}:*" for w in words)
+
+
+def parse_search(text: str):
+    query = search_query(text)
+    if query is None:
+        raise HTTPException(status_code=400, detail="Search query has no words")
+    return func.to_tsquery(SEARCH_TEXT_CONFIG, query)
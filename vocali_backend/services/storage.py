@@ -0,0 +1,415 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import islice
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi.concurrency import run_in_threadpool
+
+from .upload_service import UPLOAD_DIR
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # only needed for STORAGE_BACKEND=s3
+    boto3 = None
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_READ_CHUNK_SIZE = int(os.getenv("STORAGE_READ_CHUNK_SIZE", 256 * 1024))
+STORAGE_DELETE_CONCURRENCY = int(os.getenv("STORAGE_DELETE_CONCURRENCY", 16))
+# directory entries read per trip to the threadpool when walking local storage
+STORAGE_LIST_BATCH = int(os.getenv("STORAGE_LIST_BATCH", 1000))
+
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID")
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY")
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", 8 * 1024 * 1024))
+S3_PRESIGN_EXPIRES = int(os.getenv("S3_PRESIGN_EXPIRES", 15 * 60))
+
+
+@dataclass
+class StoredObject:
+    size: int
+    modified: datetime
+
+
+class Storage(ABC):
+    """Where audio bytes live. Keys are relative, slash separated paths."""
+
+    @abstractmethod
+    async def put_stream(self, key: str, chunks: AsyncIterator[bytes]):
+        ...
+
+    @abstractmethod
+    async def put_file(self, key: str, source_path: str):
+        """Move a local file into storage. The source is consumed."""
+
+    @abstractmethod
+    def open_stream(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """Yield the bytes of key from start to end inclusive.
+
+        Raises FileNotFoundError when key does not exist.
+        """
+
+    @abstractmethod
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        ...
+
+    async def exists(self, key: str) -> bool:
+        return await self.stat(key) is not None
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    async def delete_many(self, keys: List[str]) -> List[str]:
+        """Delete keys concurrently. Returns the keys that could not be deleted."""
+        semaphore = asyncio.Semaphore(STORAGE_DELETE_CONCURRENCY)
+
+        async def delete_one(key):
+            async with semaphore:
+                await self.delete(key)
+
+        results = await asyncio.gather(*(delete_one(k) for k in keys), return_exceptions=True)
+        return [key for key, result in zip(keys, results) if isinstance(result, Exception)]
+
+    @abstractmethod
+    def iter_keys(self, prefix: str = "") -> AsyncIterator[Tuple[str, StoredObject]]:
+        """Yield every key under the directory prefix with its size and mtime.
+
+        Keys stream in no particular order and are never all held in memory.
+        """
+
+    def download_url(self, key: str, filename: Optional[str] = None) -> Optional[str]:
+        """URL clients can fetch key from directly, None if the API serves it."""
+        return None
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of key when the bytes are on this node."""
+        return None
+
+
+class LocalStorage(Storage):
+    def __init__(self, root: str):
+        # absolute, so paths stay valid in worker processes
+        self.root = os.path.abspath(root)
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    async def put_stream(self, key: str, chunks: AsyncIterator[bytes]):
+        path = self.local_path(key)
+        await run_in_threadpool(os.makedirs, os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        f = await run_in_threadpool(open, tmp, "wb")
+        try:
+            async for chunk in chunks:
+                await run_in_threadpool(f.write, chunk)
+        except BaseException:
+            await run_in_threadpool(f.close)
+            await run_in_threadpool(_remove_quietly, tmp)
+            raise
+        await run_in_threadpool(f.close)
+        # readers only ever see complete files
+        await run_in_threadpool(os.replace, tmp, path)
+
+    async def put_file(self, key: str, source_path: str):
+        path = self.local_path(key)
+        await run_in_threadpool(os.makedirs, os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        # staging can live on another volume, shutil.move falls back to a copy
+        await run_in_threadpool(shutil.move, source_path, tmp)
+        await run_in_threadpool(os.replace, tmp, path)
+
+    async def open_stream(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        f = await run_in_threadpool(open, self.local_path(key), "rb")
+        try:
+            await run_in_threadpool(f.seek, start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = STORAGE_READ_CHUNK_SIZE
+                if remaining is not None:
+                    size = min(size, remaining)
+                chunk = await run_in_threadpool(f.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            await run_in_threadpool(f.close)
+
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            st = await run_in_threadpool(os.stat, self.local_path(key))
+        except FileNotFoundError:
+            return None
+        return StoredObject(
+            size=st.st_size,
+            modified=datetime.fromtimestamp(st.st_mtime, tz=timezone.utc),
+        )
+
+    async def delete(self, key: str):
+        await run_in_threadpool(_remove_quietly, self.local_path(key))
+
+    async def iter_keys(self, prefix: str = "") -> AsyncIterator[Tuple[str, StoredObject]]:
+        walker = self._walk(self.local_path(prefix) if prefix else self.root)
+        while True:
+            batch = await run_in_threadpool(_take, walker, STORAGE_LIST_BATCH)
+            if not batch:
+                break
+            for item in batch:
+                yield item
+
+    def _walk(self, top: str) -> Iterator[Tuple[str, StoredObject]]:
+        # only directories wait on the stack, entries come straight off scandir
+        pending = [top]
+        while pending:
+            try:
+                entries = os.scandir(pending.pop())
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        key = os.path.relpath(entry.path, self.root).replace(os.sep, "/")
+                        yield key, StoredObject(
+                            size=st.st_size,
+                            modified=datetime.fromtimestamp(st.st_mtime, tz=timezone.utc),
+                        )
+
+
+class S3Storage(Storage):
+    """S3 compatible object storage (AWS, MinIO, R2...).
+
+    boto3 is blocking, so every call goes through the threadpool. Downloads
+    are handed to clients as presigned URLs and never pass through the API.
+    """
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None):
+        if boto3 is None:
+            raise RuntimeError("boto3 is required for STORAGE_BACKEND=s3")
+        if not bucket:
+            raise RuntimeError("S3_BUCKET missing in environment variables")
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=S3_REGION,
+            aws_access_key_id=S3_ACCESS_KEY_ID,
+            aws_secret_access_key=S3_SECRET_ACCESS_KEY,
+            # MinIO and most self-hosted stores want path style addressing
+            config=BotoConfig(
+                signature_version="s3v4",
+                s3={"addressing_style": "path"} if endpoint_url else {},
+            ),
+        )
+
+    async def put_stream(self, key: str, chunks: AsyncIterator[bytes]):
+        # buffer at most one part in memory; small files skip multipart
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        try:
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                if len(buffer) >= S3_PART_SIZE:
+                    if upload_id is None:
+                        upload_id = await self._create_multipart(key)
+                    parts.append(await self._upload_part(key, upload_id, len(parts) + 1, bytes(buffer)))
+                    buffer.clear()
+
+            if upload_id is None:
+                await run_in_threadpool(
+                    self.client.put_object, Bucket=self.bucket, Key=key, Body=bytes(buffer)
+                )
+                return
+
+            if buffer:
+                parts.append(await self._upload_part(key, upload_id, len(parts) + 1, bytes(buffer)))
+            await run_in_threadpool(
+                self.client.complete_multipart_upload,
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            if upload_id is not None:
+                await run_in_threadpool(
+                    self.client.abort_multipart_upload,
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                )
+            raise
+
+    async def _create_multipart(self, key: str) -> str:
+        response = await run_in_threadpool(
+            self.client.create_multipart_upload, Bucket=self.bucket, Key=key
+        )
+        return response["UploadId"]
+
+    async def _upload_part(self, key: str, upload_id: str, number: int, body: bytes) -> dict:
+        response = await run_in_threadpool(
+            self.client.upload_part,
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=number,
+            Body=body,
+        )
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    async def put_file(self, key: str, source_path: str):
+        # upload_file switches to parallel multipart for large files on its own
+        await run_in_threadpool(self.client.upload_file, source_path, self.bucket, key)
+        await run_in_threadpool(_remove_quietly, source_path)
+
+    async def open_stream(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        params = {"Bucket": self.bucket, "Key": key}
+        if start or end is not None:
+            params["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            response = await run_in_threadpool(self.client.get_object, **params)
+        except ClientError as e:
+            if _is_not_found(e):
+                raise FileNotFoundError(key) from e
+            raise
+        body = response["Body"]
+        chunks = body.iter_chunks(STORAGE_READ_CHUNK_SIZE)
+        try:
+            while True:
+                chunk = await run_in_threadpool(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            response = await run_in_threadpool(
+                self.client.head_object, Bucket=self.bucket, Key=key
+            )
+        except ClientError as e:
+            if _is_not_found(e):
+                return None
+            raise
+        return StoredObject(size=response["ContentLength"], modified=response["LastModified"])
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=key)
+
+    async def delete_many(self, keys: List[str]) -> List[str]:
+        # one request per 1000 keys instead of one per key
+        failed = []
+        for i in range(0, len(keys), 1000):
+            batch = keys[i:i + 1000]
+            try:
+                response = await run_in_threadpool(
+                    self.client.delete_objects,
+                    Bucket=self.bucket,
+                    Delete={"Objects": [{"Key": k} for k in batch], "Quiet": True},
+                )
+            except ClientError:
+                failed.extend(batch)
+                continue
+            failed.extend(error["Key"] for error in response.get("Errors", []))
+        return failed
+
+    async def iter_keys(self, prefix: str = "") -> AsyncIterator[Tuple[str, StoredObject]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        pages = iter(paginator.paginate(Bucket=self.bucket, Prefix=f"{prefix}/" if prefix else ""))
+        while True:
+            # one page is up to 1000 keys
+            page = await run_in_threadpool(next, pages, None)
+            if page is None:
+                break
+            for item in page.get("Contents", []):
+                yield item["Key"], StoredObject(size=item["Size"], modified=item["LastModified"])
+
+    def download_url(self, key: str, filename: Optional[str] = None) -> Optional[str]:
+        # signing is a local HMAC, no request is made here
+        params = {"Bucket": self.bucket, "Key": key}
+        if filename:
+            params["ResponseContentDisposition"] = (
+                f"attachment; filename*=UTF-8''{quote(filename)}"
+            )
+        return self.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=S3_PRESIGN_EXPIRES
+        )
+
+
+def _is_not_found(error: "ClientError") -> bool:
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+
+@asynccontextmanager
+async def local_copy(storage: Storage, key: str) -> AsyncIterator[str]:
+    """Yield a filesystem path holding the bytes of key.
+
+    Local storage hands out the real path; remote objects are downloaded
+    to a temporary file that is removed afterwards.
+    """
+    path = storage.local_path(key)
+    if path:
+        yield path
+        return
+
+    fd, tmp = await run_in_threadpool(tempfile.mkstemp, prefix="vocali-")
+    f = await run_in_threadpool(os.fdopen, fd, "wb")
+    try:
+        try:
+            async for chunk in storage.open_stream(key):
+                await run_in_threadpool(f.write, chunk)
+        finally:
+            await run_in_threadpool(f.close)
+        yield tmp
+    finally:
+        await run_in_threadpool(_remove_quietly, tmp)
+
+
+def _take(iterator: Iterator, n: int) -> list:
+    return list(islice(iterator, n))
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+_storage: Optional[Storage] = None
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "s3":
+            _storage = S3Storage(S3_BUCKET, endpoint_url=S3_ENDPOINT_URL)
+        elif STORAGE_BACKEND == "local":
+            _storage = LocalStorage(UPLOAD_DIR)
+        else:
+            raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _storage
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..auth_utils import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    create_refresh_token,
+    decode_token,
+    token_denylist,
+)
+from ..database import async_session
+from ..models import RefreshToken, RevokedToken, User
+
+logger = logging.getLogger(__name__)
+
+# how stale another worker's view of a revocation may be
+TOKEN_DENYLIST_SYNC_INTERVAL = float(os.getenv("TOKEN_DENYLIST_SYNC_INTERVAL", 2))
+# rows can commit out of revoked_at order, each poll looks this far back
+TOKEN_DENYLIST_LOOKBACK = int(os.getenv("TOKEN_DENYLIST_LOOKBACK", 60))
+TOKEN_PRUNE_INTERVAL = int(os.getenv("TOKEN_PRUNE_INTERVAL", 60 * 60))
+
+
+def _epoch(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _add_refresh_token(session: AsyncSession, user: User, family_id: str) -> Tuple[str, str]:
+    jti = uuid.uuid4().hex
+    token, expires_at = create_refresh_token(user.email, jti, family_id)
+    session.add(RefreshToken(jti=jti, user_id=user.id, family_id=family_id, expires_at=expires_at))
+    return jti, token
+
+
+def issue_refresh_token(session: AsyncSession, user: User) -> str:
+    """A refresh token starting a new family, for a signin; the caller commits."""
+    return _add_refresh_token(session, user, uuid.uuid4().hex)[1]
+
+
+async def rotate_refresh_token(session: AsyncSession, token: str) -> Tuple[User, str]:
+    """Swap a refresh token for a new one in the same family and commit.
+
+    Each token works once. Presenting one that was already rotated means
+    two parties hold it, so the whole family is revoked and whoever has
+    the newest token has to sign in again too.
+    """
+    payload = decode_token(token, "refresh")
+    if payload is None or not payload.get("jti"):
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    result = await session.execute(
+        select(RefreshToken, User)
+        .join(User, User.id == RefreshToken.user_id)
+        .where(RefreshToken.jti == payload["jti"])
+        .with_for_update(of=RefreshToken)
+    )
+    row = result.first()
+    if row is None:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    stored, user = row
+
+    if stored.replaced_by is not None or stored.revoked_at is not None:
+        if stored.revoked_at is None:
+            logger.warning("Refresh token reuse for user %s, revoking family %s", user.id, stored.family_id)
+            await revoke_refresh_family(session, stored.family_id)
+            await session.commit()
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    if stored.expires_at < datetime.utcnow() or not user.is_active or not user.is_verified:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    stored.replaced_by, new_token = _add_refresh_token(session, user, stored.family_id)
+    await session.commit()
+    return user, new_token
+
+
+async def revoke_refresh_family(session: AsyncSession, family_id: str):
+    await session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+
+
+async def revoke_refresh_token(session: AsyncSession, token: str, user_id: int):
+    """Logout: end the session the refresh token belongs to."""
+    payload = decode_token(token, "refresh")
+    if payload is None or not payload.get("fam"):
+        return
+    await session.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.family_id == payload["fam"],
+            RefreshToken.user_id == user_id,
+            RefreshToken.revoked_at.is_(None),
+        )
+        .values(revoked_at=datetime.utcnow())
+    )
+
+
+async def revoke_access_token(session: AsyncSession, token: str):
+    """Deny one access token until it expires; the caller commits.
+
+    This worker stops accepting it at once, the others on their next sync.
+    """
+    payload = decode_token(token, "access")
+    if payload is None or not payload.get("jti"):
+        return
+    expires_at = datetime.utcfromtimestamp(payload["exp"])
+    session.add(RevokedToken(jti=payload["jti"], expires_at=expires_at))
+    token_denylist.revoke_jti(payload["jti"], payload["exp"])
+
+
+async def revoke_all_tokens(session: AsyncSession, user: User):
+    """After a password reset: every refresh token and every access token
+    issued so far stop working. The caller commits."""
+    now = datetime.utcnow()
+    await session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user.id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+    expires_at = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    session.add(RevokedToken(subject=user.email, expires_at=expires_at))
+    token_denylist.revoke_subject(user.email, _epoch(now), _epoch(expires_at))
+
+
+class DenylistSync:
+    """Copies revoked_tokens into this worker's token_denylist."""
+
+    def __init__(self):
+        self.cursor: Optional[datetime] = None
+
+    async def poll(self, session: AsyncSession) -> int:
+        query = select(RevokedToken).where(RevokedToken.expires_at > func.timezone("utc", func.now()))
+        if self.cursor is not None:
+            query = query.where(
+                RevokedToken.revoked_at > self.cursor - timedelta(seconds=TOKEN_DENYLIST_LOOKBACK)
+            )
+        result = await session.execute(query)
+        rows = result.scalars().all()
+        for row in rows:
+            if row.jti:
+                token_denylist.revoke_jti(row.jti, _epoch(row.expires_at))
+            if row.subject:
+                token_denylist.revoke_subject(row.subject, _epoch(row.revoked_at), _epoch(row.expires_at))
+            if self.cursor is None or row.revoked_at > self.cursor:
+                self.cursor = row.revoked_at
+        if self.cursor is None:
+            # nothing revoked yet, start looking from now on
+            self.cursor = (await session.execute(select(func.timezone("utc", func.now())))).scalar_one()
+        token_denylist.evict()
+        return len(rows)
+
+
+async def prune_tokens(session: AsyncSession) -> int:
+    now = datetime.utcnow()
+    revoked = await session.execute(delete(RevokedToken).where(RevokedToken.expires_at < now))
+    refresh = await session.execute(delete(RefreshToken).where(RefreshToken.expires_at < now))
+    await session.commit()
+    return revoked.rowcount + refresh.rowcount
+
+
+async def _run_denylist_sync(sync: DenylistSync):
+    last_prune = 0.0
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(TOKEN_DENYLIST_SYNC_INTERVAL)
+        try:
+            async with async_session() as session:
+                await sync.poll(session)
+                if loop.time() - last_prune > TOKEN_PRUNE_INTERVAL:
+                    last_prune = loop.time()
+                    removed = await prune_tokens(session)
+                    if removed:
+                        logger.info("Pruned %d expired tokens", removed)
+        except Exception:
+            logger.exception("Token denylist sync failed")
+
+
+async def start_denylist_sync() -> asyncio.Task:
+    """Load the current revocations before serving, then keep polling."""
+    sync = DenylistSync()
+    async with async_session() as session:
+        await sync.poll(session)
+    return asyncio.create_task(_run_denylist_sync(sync))
@@ -0,0 +1,60 @@
+"""Compact playback renditions made with ffmpeg.
+
+The rendition format and bitrate come from the environment; the variant
+name encodes both, so changing either produces new renditions instead of
+reusing ones made with the old settings.
+
+Like audio_probe this module has no app imports, it runs in worker processes.
+"""
+import os
+import subprocess
+from typing import List, NamedTuple
+
+
+class RenditionFormat(NamedTuple):
+    mime_type: str
+    extension: str
+    ffmpeg_args: List[str]
+
+
+RENDITION_FORMATS = {
+    "opus": RenditionFormat("audio/ogg", "opus", ["-c:a", "libopus", "-f", "ogg"]),
+    # faststart moves the index up front so players can start before the end arrives
+    "aac": RenditionFormat("audio/mp4", "m4a", ["-c:a", "aac", "-movflags", "+faststart", "-f", "mp4"]),
+}
+
+RENDITION_FORMAT = os.getenv("RENDITION_FORMAT", "opus")
+# kbit/s; 64 is transparent enough for speech in either format
+RENDITION_BITRATE = int(os.getenv("RENDITION_BITRATE", 64))
+RENDITION_TIMEOUT = int(os.getenv("RENDITION_TIMEOUT", 30 * 60))
+
+RENDITION_VARIANT = f"{RENDITION_FORMAT}-{RENDITION_BITRATE}k"
+
+
+def rendition_format() -> RenditionFormat:
+    try:
+        return RENDITION_FORMATS[RENDITION_FORMAT]
+    except KeyError:
+        raise RuntimeError(f"Unknown RENDITION_FORMAT: {RENDITION_FORMAT}")
+
+
+def transcode(source: str, dest: str) -> int:
+    """Write the rendition of source to dest and return its size.
+
+    Raises RuntimeError with ffmpeg's message when it can't be made.
+    """
+    fmt = rendition_format()
+    process = subprocess.run(
+        [
+            "ffmpeg", "-nostdin", "-v", "error", "-y", "-i", source,
+            "-vn", "-map_metadata", "-1", "-b:a", f"{RENDITION_BITRATE}k",
+            *fmt.ffmpeg_args, dest,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        timeout=RENDITION_TIMEOUT,
+    )
+    if process.returncode != 0:
+        message = process.stderr.decode(errors="replace").strip()
+        raise RuntimeError(message[-2000:] or f"ffmpeg exited with {process.returncode}")
+    return os.path.getsize(dest)
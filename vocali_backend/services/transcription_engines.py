@@ -0,0 +1,76 @@
+import hashlib
+import importlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+
+@dataclass
+class EngineResult:
+    text: str
+    language: str
+    confidence: Optional[float] = None
+
+
+class TranscriptionEngine(ABC):
+    """Turns a local audio file into text.
+
+    Implementations are loaded by TRANSCRIPTION_ENGINE, either a built-in
+    name or a "package.module:ClassName" path.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def transcribe(self, path: str, language: Optional[str] = None) -> EngineResult:
+        ...
+
+
+class StubEngine(TranscriptionEngine):
+    """Deterministic fake engine for tests and local development.
+
+    The same bytes always produce the same text, so results can be asserted
+    on without any speech model installed.
+    """
+
+    name = "stub"
+
+    WORDS = (
+        "the", "quick", "brown", "fox", "jumps", "over", "lazy", "dog",
+        "voice", "memo", "meeting", "notes", "call", "record", "today", "plan",
+    )
+
+    async def transcribe(self, path: str, language: Optional[str] = None) -> EngineResult:
+        digest = await run_in_threadpool(_sha256_file, path)
+        count = 8 + digest[0] % 24
+        words = [self.WORDS[digest[i % len(digest)] % len(self.WORDS)] for i in range(count)]
+        return EngineResult(
+            text=" ".join(words).capitalize() + ".",
+            language=language or "en",
+            confidence=round(0.75 + (digest[1] % 25) / 100, 2),
+        )
+
+
+BUILTIN_ENGINES = {
+    StubEngine.name: StubEngine,
+}
+
+
+def load_engine(spec: str) -> TranscriptionEngine:
+    if spec in BUILTIN_ENGINES:
+        return BUILTIN_ENGINES[spec]()
+    module_name, _, class_name = spec.partition(":")
+    if not class_name:
+        raise RuntimeError(f"Unknown transcription engine: {spec}")
+    engine_class = getattr(importlib.import_module(module_name), class_name)
+    return engine_class()
+
+
+def _sha256_file(path: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.digest()
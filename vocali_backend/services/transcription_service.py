@@ -0,0 +1,198 @@
+import os
+import random
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from sqlalchemy import and_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import AudioFile, TranscriptionJob, TranscriptionResult
+from .search_service import index_transcript
+from .transcription_engines import EngineResult
+
+TRANSCRIPTION_MAX_ATTEMPTS = int(os.getenv("TRANSCRIPTION_MAX_ATTEMPTS", 5))
+TRANSCRIPTION_BACKOFF_BASE = int(os.getenv("TRANSCRIPTION_BACKOFF_BASE", 30))
+TRANSCRIPTION_BACKOFF_MAX = int(os.getenv("TRANSCRIPTION_BACKOFF_MAX", 60 * 60))
+TRANSCRIPTION_LOCK_TIMEOUT = int(os.getenv("TRANSCRIPTION_LOCK_TIMEOUT", 15 * 60))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+# what the listing shows for each job state
+TRANSCRIPTION_STATUS = {
+    JOB_QUEUED: "pending",
+    JOB_RUNNING: "processing",
+    JOB_COMPLETED: "completed",
+    JOB_FAILED: "failed",
+}
+
+
+def enqueue_transcription(session: AsyncSession, audio: AudioFile):
+    """Add a job for audio; committed together with the upload itself."""
+    session.add(TranscriptionJob(audio_file_id=audio.id, status=JOB_QUEUED))
+
+
+async def enqueue_transcriptions(session: AsyncSession, audio_ids: List[int]):
+    """Bulk version of enqueue_transcription, one INSERT for all files."""
+    if audio_ids:
+        await session.execute(
+            insert(TranscriptionJob).values(
+                [{"audio_file_id": i, "status": JOB_QUEUED} for i in audio_ids]
+            )
+        )
+
+
+async def claim_jobs(session: AsyncSession, worker_id: str, limit: int) -> List[TranscriptionJob]:
+    now = datetime.utcnow()
+    # SKIP LOCKED lets any number of workers poll the same table without
+    # blocking on, or double-claiming, each other's rows
+    candidates = (
+        select(TranscriptionJob.id)
+        .where(TranscriptionJob.status == JOB_QUEUED, TranscriptionJob.run_after <= now)
+        .order_by(TranscriptionJob.run_after)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    result = await session.execute(
+        update(TranscriptionJob)
+        .where(TranscriptionJob.id.in_(candidates))
+        .values(
+            status=JOB_RUNNING,
+            attempts=TranscriptionJob.attempts + 1,
+            locked_by=worker_id,
+            locked_at=now,
+            updated_at=now,
+        )
+        .returning(TranscriptionJob)
+    )
+    jobs = list(result.scalars())
+    await session.commit()
+    return jobs
+
+
+async def heartbeat_jobs(session: AsyncSession, worker_id: str, job_ids: List[int]) -> Set[int]:
+    """Refresh locked_at on the jobs this worker runs; returns those it still holds.
+
+    A job missing from the result was requeued as stale and may already be
+    running elsewhere.
+    """
+    result = await session.execute(
+        update(TranscriptionJob)
+        .where(
+            TranscriptionJob.id.in_(job_ids),
+            TranscriptionJob.status == JOB_RUNNING,
+            TranscriptionJob.locked_by == worker_id,
+        )
+        .values(locked_at=datetime.utcnow())
+        .returning(TranscriptionJob.id)
+    )
+    held = set(result.scalars())
+    await session.commit()
+    return held
+
+
+async def requeue_stale_jobs(session: AsyncSession) -> int:
+    """Give jobs of crashed workers back to the queue."""
+    cutoff = datetime.utcnow() - timedelta(seconds=TRANSCRIPTION_LOCK_TIMEOUT)
+    result = await session.execute(
+        update(TranscriptionJob)
+        .where(TranscriptionJob.status == JOB_RUNNING, TranscriptionJob.locked_at < cutoff)
+        .values(status=JOB_QUEUED, locked_by=None, locked_at=None)
+    )
+    await session.commit()
+    return result.rowcount
+
+
+async def release_jobs(session: AsyncSession, worker_id: str):
+    """Requeue whatever this worker still holds, used on shutdown."""
+    await session.execute(
+        update(TranscriptionJob)
+        .where(TranscriptionJob.status == JOB_RUNNING, TranscriptionJob.locked_by == worker_id)
+        .values(
+            status=JOB_QUEUED,
+            attempts=TranscriptionJob.attempts - 1,
+            locked_by=None,
+            locked_at=None,
+        )
+    )
+    await session.commit()
+
+
+async def find_sibling_transcription(
+    session: AsyncSession, audio: AudioFile
+) -> Optional[EngineResult]:
+    # deduplicated uploads have identical audio, no need to run the engine twice
+    if not audio.blob_hash:
+        return None
+    result = await session.execute(
+        select(TranscriptionResult)
+        .join(AudioFile, AudioFile.id == TranscriptionResult.audio_file_id)
+        .where(AudioFile.blob_hash == audio.blob_hash)
+        .limit(1)
+    )
+    existing = result.scalar_one_or_none()
+    if existing is None:
+        return None
+    return EngineResult(
+        text=existing.text, language=existing.language, confidence=existing.confidence
+    )
+
+
+def _held(job: TranscriptionJob):
+    # a job requeued as stale belongs to whoever claimed it next
+    return and_(
+        TranscriptionJob.id == job.id,
+        TranscriptionJob.status == JOB_RUNNING,
+        TranscriptionJob.locked_by == job.locked_by,
+    )
+
+
+async def complete_job(
+    session: AsyncSession, job: TranscriptionJob, result: EngineResult, method: str
+) -> bool:
+    """Store the result and commit; False if the job is no longer this worker's."""
+    now = datetime.utcnow()
+    finished = await session.execute(
+        update(TranscriptionJob)
+        .where(_held(job))
+        .values(status=JOB_COMPLETED, locked_by=None, locked_at=None, last_error=None, updated_at=now)
+        .returning(TranscriptionJob.id)
+    )
+    if finished.scalar_one_or_none() is None:
+        await session.rollback()
+        return False
+    values = {
+        "language": result.language,
+        "text": result.text,
+        "word_count": len(result.text.split()),
+        "character_count": len(result.text),
+        "confidence": result.confidence,
+        "method": method,
+        "completed_at": now,
+    }
+    stmt = insert(TranscriptionResult).values(audio_file_id=job.audio_file_id, **values)
+    await session.execute(
+        stmt.on_conflict_do_update(index_elements=[TranscriptionResult.audio_file_id], set_=values)
+    )
+    await index_transcript(session, job.audio_file_id)
+    await session.commit()
+    return True
+
+
+async def fail_job(session: AsyncSession, job: TranscriptionJob, error: str) -> bool:
+    """Schedule a retry, or give up after the last attempt; False as in complete_job."""
+    now = datetime.utcnow()
+    values = {"locked_by": None, "locked_at": None, "last_error": error[:2000], "updated_at": now}
+    if job.attempts >= TRANSCRIPTION_MAX_ATTEMPTS:
+        values["status"] = JOB_FAILED
+    else:
+        # exponential backoff with jitter so retries of a bad batch spread out
+        delay = min(TRANSCRIPTION_BACKOFF_BASE * 2 ** (job.attempts - 1), TRANSCRIPTION_BACKOFF_MAX)
+        values["status"] = JOB_QUEUED
+        values["run_after"] = now + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+    result = await session.execute(update(TranscriptionJob).where(_held(job)).values(**values))
+    await session.commit()
+    return result.rowcount > 0
@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete
+from starlette.requests import ClientDisconnect
+
+from ..database import async_session
+from ..models import UploadSession
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_STAGING_DIR = os.getenv("UPLOAD_STAGING_DIR", "uploads_staging")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 500 * 1024 * 1024))
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", 24))
+# a chunk lease older than this belongs to a request that died
+UPLOAD_LEASE_TIMEOUT = int(os.getenv("UPLOAD_LEASE_TIMEOUT", 10 * 60))
+UPLOAD_SWEEP_INTERVAL = int(os.getenv("UPLOAD_SWEEP_INTERVAL", 15 * 60))
+
+
+def _too_large(max_size: int = MAX_UPLOAD_SIZE) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File exceeds maximum upload size of {max_size} bytes",
+    )
+
+
+async def iter_upload_file(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def hash_stream(
+    chunks: AsyncIterator[bytes], max_size: int = MAX_UPLOAD_SIZE
+) -> Tuple[int, str]:
+    size = 0
+    digest = hashlib.sha256()
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > max_size:
+            raise _too_large(max_size)
+        await run_in_threadpool(digest.update, chunk)
+    return size, digest.hexdigest()
+
+
+async def hash_upload_file(file: UploadFile) -> Tuple[int, str]:
+    # starlette already knows the size of the spooled part, so reject
+    # oversized uploads before reading anything
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        raise _too_large()
+    return await hash_stream(iter_upload_file(file))
+
+
+async def append_stream(
+    chunks: AsyncIterator[bytes],
+    destination: str,
+    offset: int,
+    max_size: int = MAX_UPLOAD_SIZE,
+) -> int:
+    """Append chunks to a partial upload starting at offset.
+
+    Returns how many bytes were written. A dropped client connection is not
+    an error: whatever arrived is kept so the client can resume from there.
+    """
+    written = 0
+    f = await run_in_threadpool(_open_at, destination, offset)
+    try:
+        async for chunk in chunks:
+            if offset + written + len(chunk) > max_size:
+                raise _too_large(max_size)
+            await run_in_threadpool(f.write, chunk)
+            written += len(chunk)
+    except ClientDisconnect:
+        pass
+    except BaseException:
+        # drop the half-written chunk so the file matches the stored offset
+        await run_in_threadpool(_truncate_and_close, f, offset)
+        raise
+    await run_in_threadpool(f.close)
+    return written
+
+
+def partial_upload_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_STAGING_DIR, upload_id)
+
+
+async def partial_size(path: str) -> int:
+    return await run_in_threadpool(_size_or_zero, path)
+
+
+async def file_sha256(path: str) -> str:
+    return await run_in_threadpool(_hash_file, path)
+
+
+async def remove_file(path: str):
+    await run_in_threadpool(_remove_quietly, path)
+
+
+async def sweep_abandoned_uploads() -> int:
+    cutoff = datetime.utcnow() - timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    async with async_session() as session:
+        # DELETE ... RETURNING lets several workers sweep at the same time
+        # without two of them claiming the same session
+        result = await session.execute(
+            delete(UploadSession)
+            .where(UploadSession.updated_at < cutoff)
+            .returning(UploadSession.id)
+        )
+        upload_ids = result.scalars().all()
+        await session.commit()
+
+    for upload_id in upload_ids:
+        await remove_file(partial_upload_path(upload_id))
+    return len(upload_ids)
+
+
+async def run_upload_sweeper():
+    while True:
+        try:
+            removed = await sweep_abandoned_uploads()
+            if removed:
+                logger.info("Removed %d abandoned upload sessions", removed)
+        except Exception:
+            logger.exception("Upload sweeper failed")
+        await asyncio.sleep(UPLOAD_SWEEP_INTERVAL)
+
+
+def _open_at(path: str, offset: int):
+    f = open(path, "r+b" if os.path.exists(path) else "wb")
+    f.seek(offset)
+    # a previous request may have died mid-chunk and left extra bytes
+    f.truncate()
+    return f
+
+
+def _size_or_zero(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _truncate_and_close(f, offset: int):
+    f.truncate(offset)
+    f.close()
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,79 @@
+import os
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import UserUsage
+
+# 0 means unlimited
+USER_QUOTA_FILES = int(os.getenv("USER_QUOTA_FILES", 0))
+USER_QUOTA_BYTES = int(os.getenv("USER_QUOTA_BYTES", 0))
+USER_QUOTA_DURATION = int(os.getenv("USER_QUOTA_DURATION", 0))
+
+
+def _quota_exceeded(what: str) -> HTTPException:
+    return HTTPException(status_code=403, detail=f"Storage quota exceeded: {what}")
+
+
+async def get_usage(session: AsyncSession, user_id: int) -> Optional[UserUsage]:
+    result = await session.execute(select(UserUsage).where(UserUsage.user_id == user_id))
+    return result.scalar_one_or_none()
+
+
+def _check(file_count: int, total_bytes: int, total_duration: int):
+    if USER_QUOTA_FILES and file_count > USER_QUOTA_FILES:
+        raise _quota_exceeded("file count")
+    if USER_QUOTA_BYTES and total_bytes > USER_QUOTA_BYTES:
+        raise _quota_exceeded("bytes")
+    # duration is only known after processing, so it can only stop the next upload
+    if USER_QUOTA_DURATION and total_duration >= USER_QUOTA_DURATION:
+        raise _quota_exceeded("duration")
+
+
+async def check_quota(session: AsyncSession, user_id: int, size: int = 0, files: int = 1):
+    """Cheap early check, before anything is written to storage."""
+    usage = await get_usage(session, user_id)
+    if usage is None:
+        _check(files, size, 0)
+    else:
+        _check(usage.file_count + files, usage.total_bytes + size, usage.total_duration)
+
+
+async def add_usage(
+    session: AsyncSession,
+    user_id: int,
+    files: int = 0,
+    size: int = 0,
+    duration: int = 0,
+    enforce: bool = False,
+):
+    """Apply a delta to the user's usage row, in the caller's transaction.
+
+    The upsert takes the row lock, so with enforce the quota holds even
+    for concurrent uploads of the same user: the one that would go over
+    gets a 403 and its transaction is rolled back by the caller.
+    """
+    now = datetime.utcnow()
+    stmt = insert(UserUsage).values(
+        user_id=user_id,
+        file_count=files,
+        total_bytes=size,
+        total_duration=duration,
+        updated_at=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserUsage.user_id],
+        set_={
+            "file_count": UserUsage.file_count + files,
+            "total_bytes": UserUsage.total_bytes + size,
+            "total_duration": UserUsage.total_duration + duration,
+            "updated_at": now,
+        },
+    ).returning(UserUsage.file_count, UserUsage.total_bytes, UserUsage.total_duration)
+    row = (await session.execute(stmt)).one()
+    if enforce:
+        _check(row.file_count, row.total_bytes, row.total_duration)
@@ -0,0 +1,190 @@
+"""Waveform peaks for the frontend player.
+
+Audio is decoded to mono 16-bit PCM in a streaming fashion (the wave
+module for WAV, ffmpeg for everything else) and reduced block by block to
+min/max pairs with NumPy, so memory stays flat however long the file is.
+
+File layout, all little-endian:
+
+    b"VPK1", u8 bits, u8 level count, u16 reserved, u32 sample rate
+    per level: u32 samples per peak, u32 peak count
+    per level: peak count (min, max) pairs of int8 or int16
+
+Like audio_probe this module has no app imports, it runs in worker processes.
+"""
+import os
+import shutil
+import struct
+import subprocess
+import wave
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"VPK1"
+HEADER = struct.Struct("<4sBBHI")
+LEVEL = struct.Struct("<II")
+# the level count is a u8, so reading this much always covers the header
+MAX_HEADER_SIZE = HEADER.size + LEVEL.size * 255
+
+# peaks per second, finest first; every entry must divide the first one
+PEAKS_LEVELS = tuple(int(x) for x in os.getenv("PEAKS_LEVELS", "100,20,5,1").split(","))
+PEAKS_BITS = int(os.getenv("PEAKS_BITS", 8))
+# ffmpeg resamples to this rate, plenty for drawing a waveform
+PEAKS_DECODE_RATE = int(os.getenv("PEAKS_DECODE_RATE", 8000))
+DECODE_CHUNK_FRAMES = 64 * 1024
+
+
+def _wav_chunks(path: str) -> Tuple[int, Iterator[np.ndarray]]:
+    w = wave.open(path, "rb")
+    rate, channels, width = w.getframerate(), w.getnchannels(), w.getsampwidth()
+    if width not in (1, 2, 3, 4):
+        w.close()
+        raise ValueError(f"Unsupported WAV sample width: {width}")
+
+    def chunks():
+        try:
+            while True:
+                frames = w.readframes(DECODE_CHUNK_FRAMES)
+                if not frames:
+                    break
+                yield _pcm_to_mono16(frames, width, channels)
+        finally:
+            w.close()
+
+    return rate, chunks()
+
+
+def _pcm_to_mono16(frames: bytes, width: int, channels: int) -> np.ndarray:
+    if width == 1:
+        # 8-bit WAV is unsigned
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.int16) - 128) << 8
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype="<i2")
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        # keep the two most significant bytes of each 24-bit sample
+        samples = np.ascontiguousarray(raw[:, 1:]).view("<i2").ravel()
+    else:
+        samples = (np.frombuffer(frames, dtype="<i4") >> 16).astype(np.int16)
+    if channels > 1:
+        samples = samples[: len(samples) - len(samples) % channels]
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples
+
+
+def _ffmpeg_chunks(path: str) -> Tuple[int, Iterator[np.ndarray]]:
+    process = subprocess.Popen(
+        [
+            "ffmpeg", "-nostdin", "-v", "error", "-i", path,
+            "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(PEAKS_DECODE_RATE), "-",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+
+    def chunks():
+        try:
+            leftover = b""
+            while True:
+                data = process.stdout.read(DECODE_CHUNK_FRAMES * 2)
+                if not data:
+                    break
+                data = leftover + data
+                cut = len(data) - len(data) % 2
+                leftover = data[cut:]
+                yield np.frombuffer(data[:cut], dtype="<i2")
+        finally:
+            process.stdout.close()
+            if process.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed to decode {path}")
+
+    return PEAKS_DECODE_RATE, chunks()
+
+
+def _decode(path: str, mime_type: Optional[str]) -> Optional[Tuple[int, Iterator[np.ndarray]]]:
+    if mime_type == "audio/wav":
+        try:
+            return _wav_chunks(path)
+        except (wave.Error, EOFError, ValueError):
+            # compressed WAV, let ffmpeg deal with it
+            pass
+    if shutil.which("ffmpeg"):
+        return _ffmpeg_chunks(path)
+    return None
+
+
+def compute_peaks(path: str, mime_type: Optional[str] = None) -> Optional[bytes]:
+    """Return the encoded peaks file, or None if the audio can't be decoded here."""
+    decoded = _decode(path, mime_type)
+    if decoded is None:
+        return None
+    rate, chunks = decoded
+
+    finest = PEAKS_LEVELS[0]
+    samples_per_peak = max(1, round(rate / finest))
+    mins: List[np.ndarray] = []
+    maxs: List[np.ndarray] = []
+    pending = np.empty(0, dtype=np.int16)
+
+    for chunk in chunks:
+        pending = np.concatenate((pending, chunk)) if len(pending) else chunk
+        full = len(pending) - len(pending) % samples_per_peak
+        if full:
+            blocks = pending[:full].reshape(-1, samples_per_peak)
+            mins.append(blocks.min(axis=1))
+            maxs.append(blocks.max(axis=1))
+            pending = pending[full:]
+    if len(pending):
+        mins.append(pending.min(keepdims=True))
+        maxs.append(pending.max(keepdims=True))
+
+    level_min = np.concatenate(mins) if mins else np.zeros(0, dtype=np.int16)
+    level_max = np.concatenate(maxs) if maxs else np.zeros(0, dtype=np.int16)
+
+    levels = []
+    for peaks_per_second in PEAKS_LEVELS:
+        factor = finest // peaks_per_second
+        levels.append((samples_per_peak * factor, _reduce(level_min, level_max, factor)))
+
+    header = HEADER.pack(MAGIC, PEAKS_BITS, len(levels), 0, rate)
+    header += b"".join(LEVEL.pack(spp, len(data) // (2 * PEAKS_BITS // 8)) for spp, data in levels)
+    return header + b"".join(data for _, data in levels)
+
+
+def _reduce(level_min: np.ndarray, level_max: np.ndarray, factor: int) -> bytes:
+    if factor > 1 and len(level_min):
+        pad = -len(level_min) % factor
+        if pad:
+            # repeat the last peak so the tail block isn't lost
+            level_min = np.concatenate((level_min, np.repeat(level_min[-1:], pad)))
+            level_max = np.concatenate((level_max, np.repeat(level_max[-1:], pad)))
+        level_min = level_min.reshape(-1, factor).min(axis=1)
+        level_max = level_max.reshape(-1, factor).max(axis=1)
+
+    pairs = np.empty(len(level_min) * 2, dtype=np.int16)
+    pairs[0::2] = level_min
+    pairs[1::2] = level_max
+    if PEAKS_BITS == 8:
+        return (pairs >> 8).astype(np.int8).tobytes()
+    return pairs.astype("<i2").tobytes()
+
+
+def read_level(header: bytes, level: int) -> Tuple[int, int, int, int, int]:
+    """Locate a level from the file header.
+
+    Returns (sample rate, bits, samples per peak, byte offset, byte length).
+    """
+    magic, bits, count, _, rate = HEADER.unpack_from(header)
+    if magic != MAGIC:
+        raise ValueError("Not a peaks file")
+    if not 0 <= level < count:
+        raise IndexError(level)
+    offset = HEADER.size + LEVEL.size * count
+    pair_size = 2 * bits // 8
+    for index in range(count):
+        spp, peaks = LEVEL.unpack_from(header, HEADER.size + LEVEL.size * index)
+        if index == level:
+            return rate, bits, spp, offset, peaks * pair_size
+        offset += peaks * pair_size
+    raise IndexError(level)
@@ -0,0 +1,107 @@
+"""Email sender, drains the email_outbox table.
+
+    python -m vocali_backend.workers.email_sender --concurrency 8
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import uuid
+
+from ..database import async_session
+from ..services.email_service import (
+    BrevoSender,
+    claim_emails,
+    finish_batch,
+    load_templates,
+    prune_sent_emails,
+    requeue_stale_emails,
+)
+
+logger = logging.getLogger("vocali_backend.workers.email_sender")
+
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 50))
+EMAIL_SEND_CONCURRENCY = int(os.getenv("EMAIL_SEND_CONCURRENCY", 8))
+EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", 1))
+EMAIL_STALE_CHECK_INTERVAL = int(os.getenv("EMAIL_STALE_CHECK_INTERVAL", 60))
+
+
+class EmailWorker:
+    def __init__(self, sender: BrevoSender, batch_size: int):
+        self.sender = sender
+        self.batch_size = batch_size
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.stopping = asyncio.Event()
+
+    async def run(self):
+        logger.info("Email worker %s started, batch=%d", self.worker_id, self.batch_size)
+        loop = asyncio.get_running_loop()
+        last_stale_check = 0.0
+
+        while not self.stopping.is_set():
+            if loop.time() - last_stale_check > EMAIL_STALE_CHECK_INTERVAL:
+                async with async_session() as session:
+                    requeued = await requeue_stale_emails(session)
+                    await prune_sent_emails(session)
+                if requeued:
+                    logger.warning("Requeued %d stale emails", requeued)
+                last_stale_check = loop.time()
+
+            async with async_session() as session:
+                messages = await claim_emails(session, self.worker_id, self.batch_size)
+            if messages:
+                await self.send_batch(messages)
+
+            # a full batch means there is probably more waiting
+            if len(messages) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), EMAIL_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+        logger.info("Email worker %s stopped", self.worker_id)
+
+    async def send_batch(self, messages):
+        results = await asyncio.gather(
+            *(self.sender.send(message) for message in messages), return_exceptions=True
+        )
+        sent, failed = [], []
+        for message, result in zip(messages, results):
+            if isinstance(result, Exception):
+                logger.warning("Email %s to %s failed (attempt %d): %s",
+                               message.id, message.to_email, message.attempts, result)
+                failed.append((message, result))
+            else:
+                sent.append(message)
+        async with async_session() as session:
+            await finish_batch(session, sent, failed)
+        logger.info("Sent %d emails, %d failed", len(sent), len(failed))
+
+    def stop(self):
+        self.stopping.set()
+
+
+async def main(concurrency: int, batch_size: int):
+    load_templates()
+    sender = BrevoSender(concurrency)
+    worker = EmailWorker(sender, batch_size)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        sender.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the email sender")
+    parser.add_argument("--concurrency", type=int, default=EMAIL_SEND_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=EMAIL_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    asyncio.run(main(args.concurrency, args.batch_size))
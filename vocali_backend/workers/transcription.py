@@ -0,0 +1,161 @@
+"""Transcription worker.
+
+Run as many of these as needed, on any number of hosts:
+
+    python -m vocali_backend.workers.transcription --concurrency 4
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import uuid
+from typing import Dict
+
+from ..database import async_session
+from ..models import AudioFile, TranscriptionJob
+from ..services.blob_service import audio_file_key
+from ..services.storage import get_storage, local_copy
+from ..services.transcription_engines import TranscriptionEngine, load_engine
+from ..services.transcription_service import (
+    TRANSCRIPTION_LOCK_TIMEOUT,
+    claim_jobs,
+    complete_job,
+    fail_job,
+    find_sibling_transcription,
+    heartbeat_jobs,
+    release_jobs,
+    requeue_stale_jobs,
+)
+
+logger = logging.getLogger("vocali_backend.workers.transcription")
+
+TRANSCRIPTION_ENGINE = os.getenv("TRANSCRIPTION_ENGINE", "stub")
+TRANSCRIPTION_CONCURRENCY = int(os.getenv("TRANSCRIPTION_CONCURRENCY", 2))
+TRANSCRIPTION_POLL_INTERVAL = float(os.getenv("TRANSCRIPTION_POLL_INTERVAL", 2))
+TRANSCRIPTION_STALE_CHECK_INTERVAL = int(os.getenv("TRANSCRIPTION_STALE_CHECK_INTERVAL", 60))
+# well inside the lock timeout, a job that runs long is never taken as stale
+TRANSCRIPTION_HEARTBEAT_INTERVAL = float(
+    os.getenv("TRANSCRIPTION_HEARTBEAT_INTERVAL", TRANSCRIPTION_LOCK_TIMEOUT / 5)
+)
+
+
+class TranscriptionWorker:
+    def __init__(self, engine: TranscriptionEngine, concurrency: int):
+        self.engine = engine
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        # job id -> the task running it
+        self.running: Dict[int, asyncio.Task] = {}
+        self.stopping = asyncio.Event()
+
+    async def run(self):
+        logger.info("Worker %s started, engine=%s concurrency=%d",
+                    self.worker_id, self.engine.name, self.concurrency)
+        loop = asyncio.get_running_loop()
+        last_stale_check = 0.0
+        heartbeat = asyncio.create_task(self.heartbeat())
+
+        while not self.stopping.is_set():
+            if loop.time() - last_stale_check > TRANSCRIPTION_STALE_CHECK_INTERVAL:
+                async with async_session() as session:
+                    requeued = await requeue_stale_jobs(session)
+                if requeued:
+                    logger.warning("Requeued %d stale jobs", requeued)
+                last_stale_check = loop.time()
+
+            free = self.concurrency - len(self.running)
+            jobs = []
+            if free > 0:
+                async with async_session() as session:
+                    jobs = await claim_jobs(session, self.worker_id, free)
+            for job in jobs:
+                task = asyncio.create_task(self.run_job(job))
+                self.running[job.id] = task
+                task.add_done_callback(lambda _, job_id=job.id: self.running.pop(job_id, None))
+
+            # only sleep when there was nothing to do, a full batch means
+            # there is probably more waiting
+            if not jobs or len(self.running) >= self.concurrency:
+                try:
+                    await asyncio.wait_for(self._wait_for_slot(), TRANSCRIPTION_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+        if self.running:
+            await asyncio.gather(*self.running.values(), return_exceptions=True)
+        heartbeat.cancel()
+        async with async_session() as session:
+            await release_jobs(session, self.worker_id)
+        logger.info("Worker %s stopped", self.worker_id)
+
+    async def _wait_for_slot(self):
+        if len(self.running) >= self.concurrency:
+            await asyncio.wait(self.running.values(), return_when=asyncio.FIRST_COMPLETED)
+        else:
+            await self.stopping.wait()
+
+    async def heartbeat(self):
+        """Keep locked_at fresh on running jobs so requeue_stale_jobs leaves them be."""
+        while True:
+            await asyncio.sleep(TRANSCRIPTION_HEARTBEAT_INTERVAL)
+            job_ids = list(self.running)
+            if not job_ids:
+                continue
+            try:
+                async with async_session() as session:
+                    held = await heartbeat_jobs(session, self.worker_id, job_ids)
+            except Exception:
+                logger.exception("Heartbeat failed for worker %s", self.worker_id)
+                continue
+            for job_id in job_ids:
+                task = self.running.get(job_id)
+                if job_id not in held and task is not None and not task.done():
+                    # requeued after missed heartbeats, it may run elsewhere now
+                    logger.warning("Lost the lock on job %s, stopping it", job_id)
+                    task.cancel()
+
+    async def run_job(self, job: TranscriptionJob):
+        try:
+            async with async_session() as session:
+                audio = await session.get(AudioFile, job.audio_file_id)
+                if audio is None:
+                    return
+                result = await find_sibling_transcription(session, audio)
+            method = "copy"
+
+            if result is None:
+                async with local_copy(get_storage(), audio_file_key(audio)) as path:
+                    result = await self.engine.transcribe(path)
+                method = self.engine.name
+
+            async with async_session() as session:
+                if not await complete_job(session, job, result, method):
+                    logger.warning("Job %s was taken over by another worker, result dropped", job.id)
+        except Exception as e:
+            logger.exception("Job %s failed (attempt %d)", job.id, job.attempts)
+            async with async_session() as session:
+                await fail_job(session, job, f"{type(e).__name__}: {e}")
+
+    def stop(self):
+        self.stopping.set()
+
+
+async def main(concurrency: int, engine_spec: str):
+    worker = TranscriptionWorker(load_engine(engine_spec), concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the transcription worker")
+    parser.add_argument("--concurrency", type=int, default=TRANSCRIPTION_CONCURRENCY)
+    parser.add_argument("--engine", default=TRANSCRIPTION_ENGINE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    asyncio.run(main(args.concurrency, args.engine))